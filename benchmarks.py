@@ -0,0 +1,297 @@
+# benchmarks.py
+
+# Benchmark suite for the team cost calculator's cost functions and summary pipeline.
+# Runs without a Streamlit server: the benchmarks call the UI-free team_cost_model module.
+#
+#   python benchmarks.py                         # sweep teams, roles per team and year spans
+#   python benchmarks.py --save baseline.json    # save the results as a baseline
+#   python benchmarks.py --compare baseline.json # report changes against a saved baseline
+
+# Import necessary libraries
+import argparse
+import io
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+
+# Default sweep: each dimension is varied around the base case
+BASE_CASE = {'teams': 1000, 'roles': 4, 'years': 3}
+SWEEP = {
+    'teams': [100, 1000, 10000],
+    'roles': [1, 4, 10],
+    'years': [1, 5, 10]
+}
+QUICK_SWEEP = {
+    'teams': [100, 1000],
+    'roles': [1, 4],
+    'years': [1, 5]
+}
+
+# The per-team reference functions are only timed up to this many teams
+REFERENCE_MAX_TEAMS = 2000
+
+# Ratio to the baseline above which a benchmark is reported as a regression
+REGRESSION_THRESHOLD = 1.25
+
+# Function to import the cost model module
+def load_app():
+    warnings.filterwarnings('ignore')
+    import team_cost_model
+    return team_cost_model
+
+# Function to generate a seeded synthetic portfolio, built on the app's demo team generator
+def generate_synthetic_portfolio(app, num_teams, roles_per_team, year_span, seed=0):
+    random.seed(seed)
+    roles = list(app.DEFAULT_YEARLY_SALARIES.keys())
+    first_year = app.YEAR_OPTIONS[0]
+    last_year = app.YEAR_OPTIONS[-1]
+
+    teams = []
+    while len(teams) < num_teams:
+        for team in app.generate_demo_teams(app.DEFAULT_YEARLY_SALARIES):
+            # Stretch each demo team to the requested number of roles and year span
+            while len(team['team_roles']) < roles_per_team:
+                role = random.choice(roles)
+                team['team_roles'].append({
+                    'role': role,
+                    'count': round(random.uniform(0.5, 5.0) * 2) / 2,
+                    'resource_type': random.choice(list(app.DEFAULT_YEARLY_SALARIES[role].keys()))
+                })
+            del team['team_roles'][roles_per_team:]
+            team['start_year'] = random.randint(first_year, max(first_year, last_year - year_span + 1))
+            team['end_year'] = min(team['start_year'] + year_span - 1, last_year)
+            team['end_month'] = random.randint(team['start_month'], 12) if team['end_year'] == team['start_year'] else random.randint(1, 12)
+            team['team_name'] = f"Team {len(teams) + 1}"
+            teams.append(team)
+    return teams[:num_teams]
+
+# Function to time a callable, returning the median latency and the peak traced memory of one run
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak_bytes
+
+# Function to build the benchmarks for one portfolio shape as (name, callable) pairs
+def portfolio_benchmarks(app, case):
+    records = generate_synthetic_portfolio(app, case['teams'], case['roles'], case['years'])
+    store = app.team_store_from_records(records)
+    cost_cache = app.create_cost_cache()
+    app.update_portfolio_costs(store, cost_cache, app.DEFAULT_YEARLY_SALARIES)
+    team_ids = app.costable_team_ids(store)
+    cost_inputs = app.build_cost_inputs(store, team_ids, app.DEFAULT_YEARLY_SALARIES)
+    export_json = json.dumps(app.team_store_to_records(store)).encode('utf-8')
+    arrow_tables = {name: app.arrow_to_ipc(app.store_table_to_arrow(store, name)) for name in ('teams', 'roles', 'costs')}
+
+    # A thousand 90-day windows spread over the portfolio's years
+    window_starts = np.datetime64(f"{app.YEAR_OPTIONS[0]}-01-01") + np.random.default_rng(0).integers(0, 365 * len(app.YEAR_OPTIONS), 1000)
+
+    # Per-team reference functions, as the app called them before the batched engine
+    def reference_costs():
+        team_roles = store['roles'].groupby('team_id')
+        start_dates = app.month_start_dates(store['teams']['start_year'], store['teams']['start_month'])
+        end_dates = app.month_start_dates(store['teams']['end_year'], store['teams']['end_month'])
+        for (team_id, roles), start_date, end_date in zip(team_roles, start_dates, end_dates):
+            app.calculate_team_cost_per_year(roles, start_date, end_date, app.DEFAULT_YEARLY_SALARIES)
+            app.calculate_role_costs(roles, start_date, end_date, app.DEFAULT_YEARLY_SALARIES)
+
+    # A 2,187-scenario what-if grid over three roles, FTE scaling and date shifts, evaluated in-process
+    def what_if_scenarios():
+        import what_if
+        base = what_if.build_what_if_base(store, app.DEFAULT_YEARLY_SALARIES)
+        grid = what_if.build_scenario_grid(
+            {role: [0.9, 1.0, 1.1] for role in list(app.DEFAULT_YEARLY_SALARIES)[:3]},
+            [0.9, 1.0, 1.1], [-3, 0, 3], [0, 3, 6]
+        )
+        for _ in what_if.run_what_if_scenarios(what_if.build_scenario_arrays(base, grid), processes=1):
+            pass
+
+    # One FTE edit followed by a regenerate, as in the editor, which passes the edited team on
+    def incremental_update():
+        roles = store['roles']
+        roles.iloc[0, roles.columns.get_loc('count')] += 0.5
+        app.update_portfolio_costs(store, cost_cache, app.DEFAULT_YEARLY_SALARIES, team_ids=[roles['team_id'].iat[0]])
+
+    # Reporting currency switches with offshore salaries paid in INR; each switch re-applies a cached conversion
+    salary_currencies = {
+        role: {resource_type: 'INR' if resource_type.startswith('Offshore') else 'USD' for resource_type in role_salaries}
+        for role, role_salaries in app.DEFAULT_YEARLY_SALARIES.items()
+    }
+    fx_rates = pd.DataFrame(app.DEFAULT_FX_RATES)
+    def currency_switches():
+        for reporting_currency in ('EUR', 'GBP', 'USD'):
+            currency = app.currency_settings(salary_currencies, fx_rates, reporting_currency)
+            app.build_summary_frames(store, cost_cache, 'Quarter', 1, currency)
+
+    # The FTE-per-month sweep, rebuilt rather than read from the calendar
+    def headcount_sweep():
+        app.portfolio_calendar(store, cost_cache).pop('headcount', None)
+        app.build_headcount_frames(store, cost_cache)
+
+    # Fitting the portfolio to caps 20% below its yearly costs, with delays of up to six months
+    def budget_fit():
+        import optimizer
+        base = optimizer.build_optimizer_base(store, app.DEFAULT_YEARLY_SALARIES, max_delay=6)
+        optimizer.solve_budget_plan(base, (cost_cache['yearly_totals'] * 0.8).to_dict())
+
+    # 10,000 Monte Carlo draws of salaries, FTE counts and end-date slippage, evaluated in-process
+    def monte_carlo_draws():
+        import simulation
+        base = simulation.build_simulation_base(store, app.DEFAULT_YEARLY_SALARIES, max_slip=12)
+        for _ in simulation.run_simulation(base, 10000, processes=1):
+            pass
+
+    # Two sessions on one shared store: one saves a team edit, the other picks it up. The directory is removed when
+    # the benchmarks are dropped
+    import shared_store
+    shared_dir = tempfile.TemporaryDirectory()
+    shared = shared_store.open_shared_store(f"{shared_dir.name}/portfolio.db")
+    shared_store.push_shared_changes(shared, store, shared_store.load_shared_portfolio(shared)[1], 'seed')
+    editing_store, editing_sync = shared_store.load_shared_portfolio(shared)
+    watching_store, watching_sync = shared_store.load_shared_portfolio(shared)
+    def shared_edit_round_trip():
+        roles = editing_store['roles']
+        roles.iloc[0, roles.columns.get_loc('count')] += 0.5
+        shared_store.push_shared_changes(shared, editing_store, editing_sync, 'editing')
+        shared_store.pull_shared_changes(shared, watching_store, watching_sync, 'watching')
+
+    # Snapshots on the same store: a save after one team edit, and a diff against the snapshot before the edit
+    import snapshots
+    snapshots.create_snapshot_tables(shared)
+    first_snapshot = snapshots.save_snapshot(shared, store, app.DEFAULT_YEARLY_SALARIES, 'first')['snapshot_id']
+    def snapshot_one_edit():
+        roles = store['roles']
+        roles.iloc[0, roles.columns.get_loc('count')] += 0.5
+        app.update_portfolio_costs(store, cost_cache, app.DEFAULT_YEARLY_SALARIES, team_ids=[roles['team_id'].iat[0]])
+        return snapshots.save_snapshot(shared, store, app.DEFAULT_YEARLY_SALARIES, 'edited')['snapshot_id']
+    edited_snapshot = snapshot_one_edit()
+
+    # A 3% escalation with a mid-year override, costed month by month from a fresh cache
+    salary_schedule = app.build_salary_schedule(
+        app.DEFAULT_YEARLY_SALARIES, app.YEAR_OPTIONS[0], default_escalation=3.0,
+        overrides=[{'role': role, 'resource_type': resource_type, 'from': f"{app.YEAR_OPTIONS[len(app.YEAR_OPTIONS) // 2]}-07", 'salary': salary * 1.2}
+                   for role, role_salaries in app.DEFAULT_YEARLY_SALARIES.items() for resource_type, salary in list(role_salaries.items())[:1]]
+    )
+
+    benchmarks = [
+        ('generate_demo_teams', lambda: generate_synthetic_portfolio(app, case['teams'], case['roles'], case['years'])),
+        ('team_store_from_records', lambda: app.team_store_from_records(records)),
+        ('build_cost_inputs', lambda: app.build_cost_inputs(store, team_ids, app.DEFAULT_YEARLY_SALARIES)),
+        ('calculate_portfolio_costs', lambda: app.calculate_portfolio_costs(
+            cost_inputs['role_team_index'],
+            cost_inputs['role_counts'],
+            cost_inputs['role_rates'],
+            cost_inputs['start_dates'],
+            cost_inputs['end_dates']
+        )),
+        ('update_portfolio_costs_full', lambda: app.update_portfolio_costs(store, app.create_cost_cache(), app.DEFAULT_YEARLY_SALARIES)),
+        ('update_portfolio_costs_one_edit', incremental_update),
+        ('update_portfolio_costs_scheduled', lambda: app.update_portfolio_costs(store, app.create_cost_cache(), app.DEFAULT_YEARLY_SALARIES, salary_schedule)),
+        ('build_summary_frames', lambda: app.build_summary_frames(store, cost_cache)),
+        ('build_summary_frames_monthly', lambda: app.build_summary_frames(store, cost_cache, 'Month')),
+        ('build_summary_frames_currency_x3', currency_switches),
+        ('window_cost_queries_x1000', lambda: app.portfolio_window_costs(
+            app.portfolio_calendar(store, cost_cache), window_starts, window_starts + 90
+        )),
+        ('headcount_per_month', headcount_sweep),
+        ('what_if_scenarios', what_if_scenarios),
+        ('budget_fit', budget_fit),
+        ('monte_carlo_10k_draws', monte_carlo_draws),
+        ('shared_store_load', lambda: shared_store.load_shared_portfolio(shared)),
+        ('shared_store_edit_round_trip', shared_edit_round_trip),
+        ('snapshot_save_one_edit', snapshot_one_edit),
+        ('snapshot_diff', lambda: snapshots.diff_snapshots(shared, first_snapshot, edited_snapshot)),
+        ('json_export', lambda: json.dumps(app.team_store_to_records(store))),
+        ('json_import', lambda: app.import_teams_file(io.BytesIO(export_json), 'teams_data.json')),
+        ('arrow_save', lambda: {name: app.arrow_to_ipc(app.store_table_to_arrow(store, name)) for name in ('teams', 'roles', 'costs')}),
+        ('arrow_load', lambda: app.team_store_from_arrow({name: app.arrow_from_ipc(data) for name, data in arrow_tables.items()}))
+    ]
+    if case['teams'] <= REFERENCE_MAX_TEAMS:
+        benchmarks.append(('reference_per_team_costs', reference_costs))
+    return benchmarks
+
+# Function to list the portfolio shapes to run: each dimension swept around the base case, or the full grid
+def sweep_cases(sweep, full_grid):
+    if full_grid:
+        return [
+            {'teams': teams, 'roles': roles, 'years': years}
+            for teams in sweep['teams'] for roles in sweep['roles'] for years in sweep['years']
+        ]
+    cases = []
+    for dimension, values in sweep.items():
+        for value in values:
+            case = dict(BASE_CASE, **{dimension: value})
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+# Function to run every benchmark for every case and collect the results keyed by benchmark and case
+def run_benchmarks(cases, repeat):
+    app = load_app()
+    results = {}
+    for case in cases:
+        case_label = f"teams={case['teams']},roles={case['roles']},years={case['years']}"
+        for name, func in portfolio_benchmarks(app, case):
+            seconds, peak_bytes = measure(func, repeat)
+            results[f"{name}[{case_label}]"] = {
+                'benchmark': name,
+                'case': case,
+                'seconds': seconds,
+                'peak_bytes': peak_bytes,
+                'teams_per_second': case['teams'] / seconds if seconds else float('inf')
+            }
+            print(f"{name:<34} {case_label:<30} {seconds * 1000:>10.2f} ms {peak_bytes / 1e6:>9.2f} MB {case['teams'] / seconds:>14,.0f} teams/s")
+    return results
+
+# Function to compare results against a saved baseline, returning the keys that regressed
+def compare_to_baseline(results, baseline):
+    regressions = []
+    print()
+    print(f"{'benchmark':<66} {'baseline':>11} {'current':>11} {'ratio':>7}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[key]['seconds'] if baseline[key]['seconds'] else float('inf')
+        flag = ''
+        if ratio > REGRESSION_THRESHOLD:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f"{key:<66} {baseline[key]['seconds'] * 1000:>8.2f} ms {result['seconds'] * 1000:>8.2f} ms {ratio:>6.2f}x{flag}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the team cost calculator's cost functions and summary pipeline.")
+    parser.add_argument('--quick', action='store_true', help="Use a smaller sweep.")
+    parser.add_argument('--grid', action='store_true', help="Run the full teams x roles x years grid instead of one-dimensional sweeps.")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark; the median is reported.")
+    parser.add_argument('--save', metavar='PATH', help="Save the results as a JSON baseline.")
+    parser.add_argument('--compare', metavar='PATH', help="Compare the results against a saved JSON baseline.")
+    args = parser.parse_args()
+
+    results = run_benchmarks(sweep_cases(QUICK_SWEEP if args.quick else SWEEP, args.grid), args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print(f"Saved {len(results)} results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare_to_baseline(results, json.load(baseline_file))
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {REGRESSION_THRESHOLD:.2f}x")
+            sys.exit(1)
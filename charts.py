@@ -0,0 +1,100 @@
+# charts.py
+
+# Rendering layer for the summary charts: reduces the summary frames to a bounded number of chart rows
+# before they are embedded in a Vega-Lite spec, and counts what each chart ships to the browser.
+# The largest teams are charted individually; the rest are binned into "other" rows.
+
+# Import necessary libraries
+import json
+import altair as alt
+import pandas as pd
+
+# Teams charted individually in the Gantt, pie and stacked charts
+CHART_TOP_TEAMS = 25
+
+# Most Gantt rows the remaining teams are binned into; quarter bins coarsen to years above this
+GANTT_MAX_BINS = 40
+
+# Function to pick the teams charted individually: the top_n by total cost, as a boolean mask over the Gantt rows
+def top_team_mask(gantt_df, top_n=CHART_TOP_TEAMS):
+    mask = pd.Series(False, index=gantt_df.index)
+    mask.loc[gantt_df['Cost'].nlargest(top_n).index] = True
+    return mask.to_numpy()
+
+# Function to bin the Gantt rows outside the top teams by start and end period, returning the chart rows and
+# the key of the Gantt row each team is charted under. Keys tell rows apart whatever their labels: a team's key is
+# its team_id and a bin's is its periods, so a team named like a bin is never selected with it
+def bin_gantt_rows(gantt_df, top_n=CHART_TOP_TEAMS, max_bins=GANTT_MAX_BINS):
+    gantt_df = gantt_df.assign(Key=gantt_df.index.astype(str))
+    keys = pd.Series(gantt_df['Key'].to_numpy(), index=gantt_df.index)
+    if len(gantt_df) <= top_n:
+        return gantt_df, keys
+
+    top = top_team_mask(gantt_df, top_n)
+    rest = gantt_df[~top]
+    for freq in ('Q', 'Y'):
+        start_bins = rest['Start'].dt.to_period(freq).astype(str)
+        end_bins = rest['End'].dt.to_period(freq).astype(str)
+        bin_labels = "Other: " + start_bins + " to " + end_bins
+        if bin_labels.nunique() <= max_bins:
+            break
+
+    # One row per bin spanning its teams, with their summed cost
+    binned = rest.groupby(bin_labels.to_numpy(), sort=False).agg(
+        Start=('Start', 'min'),
+        End=('End', 'max'),
+        Cost=('Cost', 'sum'),
+        Teams=('Team', 'size')
+    )
+    binned_df = pd.DataFrame({
+        'Team': binned.index,
+        'Start': binned['Start'].to_numpy(),
+        'End': binned['End'].to_numpy(),
+        'Cost': binned['Cost'].to_numpy(),
+        'Roles': binned['Teams'].map("{:,} teams".format).to_numpy(),
+        'Description': "",
+        'Key': "bin " + binned.index
+    })
+    keys.loc[rest.index] = ("bin " + bin_labels).to_numpy()
+    return pd.concat([gantt_df[top], binned_df], ignore_index=True), keys
+
+# Function to aggregate the pie rows onto the Gantt row keys, so a binned row shows the role mix of its teams
+def aggregate_pie_rows(pie_df, team_keys):
+    pie_df = pie_df.assign(Key=team_keys.reindex(pie_df.index).to_numpy())
+    return pie_df.groupby(['Key', 'Role'], as_index=False, sort=False)['Cost'].sum()
+
+# Function to keep the top teams in the long-form team x period costs and fold every other team into one row per period
+def aggregate_detailed_rows(detailed_df, gantt_df, period_column, top_n=CHART_TOP_TEAMS):
+    if len(gantt_df) <= top_n:
+        return detailed_df
+    top_ids = gantt_df.index[top_team_mask(gantt_df, top_n)]
+    is_top = detailed_df.index.isin(top_ids)
+    other_label = f"Other ({len(gantt_df) - len(top_ids):,} teams)"
+    other = detailed_df[~is_top].groupby(period_column, as_index=False, sort=False)['Cost'].sum().assign(Team=other_label)
+    return pd.concat([detailed_df[is_top], other[detailed_df.columns]], ignore_index=True)
+
+# Function to build the chart frames for the summary section: binned Gantt rows, the pie rows aggregated to match,
+# and the stacked chart rows with the smaller teams folded into "other"
+def build_chart_frames(summary_frames, period_column, top_n=CHART_TOP_TEAMS):
+    gantt_df, team_keys = bin_gantt_rows(summary_frames['gantt'], top_n)
+    return {
+        'gantt': gantt_df,
+        'pie': aggregate_pie_rows(summary_frames['pie'], team_keys),
+        'detailed': aggregate_detailed_rows(summary_frames['detailed'], summary_frames['gantt'], period_column, top_n)
+    }
+
+# Function to combine the Gantt and pie rows into the one dataset their concatenated chart shares
+def shared_gantt_pie_data(chart_frames):
+    return pd.concat([
+        chart_frames['gantt'].assign(Layer='gantt'),
+        chart_frames['pie'].assign(Layer='pie')
+    ], ignore_index=True)
+
+# Function to measure a chart's payload: its data rows, counted from the frame it charts, and, when the chart is
+# given, the bytes of its Vega-Lite spec with the data inline. Measuring bytes serializes the whole spec once more
+def chart_payload(chart_df, chart=None):
+    payload = {'rows': len(chart_df), 'bytes': None}
+    if chart is not None:
+        with alt.data_transformers.disable_max_rows():
+            payload['bytes'] = len(json.dumps(chart.to_dict(), default=str))
+    return payload
@@ -0,0 +1,89 @@
+# instrumentation.py
+
+# Per-rerun instrumentation for the team cost app: timing spans around the sections of a script run,
+# counts of rows, widgets and bytes, and a JSON Lines log with one record per rerun.
+# A trace is a plain dict; spans nest, and the records written to the log hold no Streamlit objects.
+
+# Import necessary libraries
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Environment variable naming the JSON Lines file each rerun's record is appended to; unset disables the log
+TRACE_LOG_ENV = 'TEAM_COST_TRACE_LOG'
+
+# Function to start the trace of one rerun
+def start_trace(session_id, rerun):
+    return {
+        'session_id': session_id,
+        'rerun': rerun,
+        'timestamp': time.time(),
+        'started': time.perf_counter(),
+        'open': [],
+        'spans': [],
+        'counts': {}
+    }
+
+# Function to open a span; spans opened inside it are recorded one level deeper
+def begin_span(trace, name):
+    span = {'name': name, 'depth': len(trace['open']), 'start': time.perf_counter()}
+    trace['open'].append(span)
+    return span
+
+# Function to close a span and record its offset from the start of the rerun and its duration in milliseconds
+def end_span(trace, span):
+    now = time.perf_counter()
+    trace['open'].remove(span)
+    trace['spans'].append({
+        'name': span['name'],
+        'depth': span['depth'],
+        'offset_ms': (span['start'] - trace['started']) * 1000,
+        'ms': (now - span['start']) * 1000
+    })
+
+# Function to time a block as a span
+@contextmanager
+def timed_span(trace, name):
+    span = begin_span(trace, name)
+    try:
+        yield span
+    finally:
+        end_span(trace, span)
+
+# Function to add to a named count (rows, widgets, bytes) of the rerun
+def add_count(trace, name, value):
+    trace['counts'][name] = trace['counts'].get(name, 0) + int(value)
+
+# Function to finish a trace, closing any spans left open, and return its record for the log
+def finish_trace(trace):
+    for span in reversed(list(trace['open'])):
+        end_span(trace, span)
+    return {
+        'timestamp': trace['timestamp'],
+        'session_id': trace['session_id'],
+        'rerun': trace['rerun'],
+        'total_ms': (time.perf_counter() - trace['started']) * 1000,
+        'spans': sorted(trace['spans'], key=lambda span: span['offset_ms']),
+        'counts': dict(trace['counts'])
+    }
+
+# Function to total a record's spans by name, in the order they first ran: calls, milliseconds and share of the rerun
+def span_totals(record):
+    totals = {}
+    for span in record['spans']:
+        total = totals.setdefault(span['name'], {'Section': "  " * span['depth'] + span['name'], 'Calls': 0, 'ms': 0.0})
+        total['Calls'] += 1
+        total['ms'] += span['ms']
+    for total in totals.values():
+        total['Share'] = total['ms'] / record['total_ms'] if record['total_ms'] else 0.0
+    return list(totals.values())
+
+# Function to append a record to a JSON Lines log
+def append_trace_log(record, path):
+    with open(path, 'a') as log_file:
+        log_file.write(json.dumps(record) + '\n')
+
+# Function to get the trace log path configured for this process, or None when logging is off
+def trace_log_path():
+    return os.environ.get(TRACE_LOG_ENV) or None
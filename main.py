@@ -5,234 +5,305 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 import numpy as np
-import random
 import json
-from datetime import datetime, date, timedelta
+import copy
+import os
+import time
+import uuid
+from datetime import date, timedelta
 import calendar
+from team_cost_model import (
+    BASE_CURRENCY,
+    DEFAULT_FX_RATES,
+    DEFAULT_YEARLY_SALARIES,
+    GRANULARITIES,
+    TABLE_EXPORT_FORMATS,
+    YEAR_OPTIONS,
+    add_store_team,
+    apply_role_edits,
+    arrow_from_ipc,
+    arrow_to_ipc,
+    build_headcount_frames,
+    build_salary_schedule,
+    build_summary_frames,
+    calendar_period_costs,
+    converted_month_costs,
+    converted_window_costs,
+    create_cost_cache,
+    create_frame_cache,
+    create_team_store,
+    currency_settings,
+    default_salary_currencies,
+    delete_store_team,
+    find_teams,
+    frame_cache_get,
+    frame_cache_put,
+    generate_demo_teams,
+    import_teams_file,
+    portfolio_calendar,
+    portfolio_content_hash,
+    portfolio_window_costs,
+    propagate_salary_change,
+    resize_store_team_roles,
+    role_edit_frame,
+    store_table_to_arrow,
+    summary_table_bytes,
+    team_display_names,
+    team_overview_frame,
+    team_store_from_arrow,
+    team_store_from_records,
+    team_store_to_records,
+    update_portfolio_costs
+)
+from charts import (
+    CHART_TOP_TEAMS,
+    build_chart_frames,
+    chart_payload,
+    shared_gantt_pie_data
+)
+from instrumentation import (
+    add_count,
+    append_trace_log,
+    begin_span,
+    end_span,
+    finish_trace,
+    span_totals,
+    start_trace,
+    timed_span,
+    trace_log_path
+)
+from optimizer import (
+    MAX_DELAY_MONTHS,
+    apply_budget_plan,
+    budget_plan_frames,
+    build_optimizer_base,
+    solve_budget_plan
+)
+from shared_store import (
+    SHARED_POLL_SECONDS,
+    load_shared_portfolio,
+    load_shared_salaries,
+    open_shared_store,
+    pull_shared_changes,
+    push_shared_changes,
+    save_shared_salaries,
+    shared_store_path,
+    shared_store_version
+)
+from snapshots import (
+    create_snapshot_tables,
+    delete_snapshot,
+    diff_snapshots,
+    list_snapshots,
+    save_snapshot
+)
+from simulation import (
+    DEFAULT_UNCERTAINTY,
+    MAX_SLIP_MONTHS,
+    build_simulation_base,
+    cost_bands_frame,
+    run_simulation
+)
+from what_if import (
+    base_yearly_costs,
+    build_scenario_arrays,
+    build_scenario_grid,
+    build_what_if_base,
+    run_what_if_scenarios,
+    scenario_results_frame
+)
 
 # Set Streamlit page configuration
 st.set_page_config(page_title="Team Cost Calculator", layout="wide")
 st.title("Team Cost Calculator with Gantt Chart and Yearly Cost Summary")
 
-# Define the roles and their yearly salaries
-yearly_salaries = {
-    'Management': {
-        'Onshore FTE': 263000,
-        'Offshore FTE': 131000,
-        'Onshore Professional Services': 394000,
-        'Offshore Professional Services': 197000
-    },
-    'Product Manager': {
-        'Onshore FTE': 140000,
-        'Offshore FTE': 105000,
-        'Onshore Professional Services': 175000,
-        'Offshore Professional Services': 123000
-    },
-    'Product Specialists': {
-        'Onshore FTE': 140000,
-        'Offshore FTE': 88000,
-        'Onshore Professional Services': 175000,
-        'Offshore Professional Services': 123000
-    },
-    'Core Dev, Data Science & Infra': {
-        'Onshore FTE': 175000,
-        'Offshore FTE': 123000,
-        'Onshore Professional Services': 228000,
-        'Offshore Professional Services': 140000
-    },
-    'QA': {
-        'Onshore FTE': 140000,
-        'Offshore FTE': 88000,
-        'Onshore Professional Services': 175000,
-        'Offshore Professional Services': 123000
-    },
-    'UX Designers': {
-        'Onshore FTE': 175000,
-        'Offshore FTE': 123000,
-        'Onshore Professional Services': 228000,
-        'Offshore Professional Services': 140000
-    },
-    'Scrum Masters': {
-        'Onshore FTE': 140000,
-        'Offshore FTE': 105000,
-        'Onshore Professional Services': 175000,
-        'Offshore Professional Services': 123000
-    }
-}
-
-# Function to calculate costs for a team per year based on yearly salaries
-def calculate_team_cost_per_year(team_roles, start_date, end_date):
-    cost_per_year = {}
-
-    # Convert start_date and end_date to pd.Timestamp
-    start_date = pd.Timestamp(start_date)
-    end_date = pd.Timestamp(end_date)
-
-    # Generate a list of years covered by the date range
-    years = pd.date_range(start=start_date, end=end_date).year.unique()
-
-    for year in years:
-        # Define start and end of the year to calculate partial or full year overlap
-        year_start = pd.Timestamp(f"{year}-01-01")
-        year_end = pd.Timestamp(f"{year}-12-31")
-
-        # Calculate overlapping period within the year
-        overlap_start = max(start_date, year_start)
-        overlap_end = min(end_date, year_end)
-        overlap_days = (overlap_end - overlap_start).days + 1
-        overlap_fraction = overlap_days / 365.25  # Fraction of the year
-
-        # Calculate the cost for each role in this year
-        yearly_cost = 0
-        for role_info in team_roles:
-            role = role_info['role']
-            count = role_info['count']  # FTE value
-            resource_type = role_info['resource_type']
-
-            # Validate role and resource_type
-            if not role or not resource_type:
-                continue  # Skip if role or resource_type is empty
-
-            yearly_salary = yearly_salaries.get(role, {}).get(resource_type, None)
-            if yearly_salary is None:
-                continue  # Skip if no matching salary found
-
-            # Calculate cost as FTE count times the salary, adjusted for partial year
-            yearly_cost += count * yearly_salary * overlap_fraction
-
-        cost_per_year[year] = yearly_cost
-
-    return cost_per_year
-
-# Function to calculate cost breakdown by role
-def calculate_role_costs(team_roles, start_date, end_date):
-    # Convert start_date and end_date to pd.Timestamp
-    start_date = pd.Timestamp(start_date)
-    end_date = pd.Timestamp(end_date)
-
-    duration_days = (end_date - start_date).days + 1  # Include end date
-    duration_fraction = duration_days / 365.25  # Fraction of a year
-
-    role_costs = {}
-    for role_info in team_roles:
-        role = role_info['role']
-        count = role_info['count']
-        resource_type = role_info['resource_type']
-
-        # Validate role and resource_type
-        if not role or not resource_type:
-            continue  # Skip if role or resource_type is empty
-
-        yearly_salary = yearly_salaries.get(role, {}).get(resource_type, None)
-        if yearly_salary is None:
-            continue  # Skip if no matching salary found
-
-        # Calculate cost as FTE count times the salary, adjusted for partial year
-        cost = count * yearly_salary * duration_fraction
-        role_key = f"{role} ({resource_type})"
-        role_costs[role_key] = cost
-
-    return role_costs
-
-# Function to generate demo teams
-def generate_demo_teams():
-    demo_teams = []
-    team_names = ['Alpha', 'Beta', 'Gamma', 'Delta']
-    for i in range(4):
-        start_year = date.today().year + random.randint(0, 2)
-        start_month = random.randint(1, 12)
-        start_date = datetime(start_year, start_month, 1).date()
-        end_year = start_year + random.randint(0, 2)
-        end_month = random.randint(start_month, 12) if end_year == start_year else random.randint(1, 12)
-        end_date = datetime(end_year, end_month, 1).date()
-        num_roles = random.randint(1, 4)
-        team_roles = []
-        for _ in range(num_roles):
-            role = random.choice(list(yearly_salaries.keys()))
-            resource_type = random.choice(list(yearly_salaries[role].keys()))
-            count = random.uniform(0.5, 5.0)
-            count = round(count * 2) / 2  # Round to nearest 0.5
-            team_roles.append({
-                'role': role,
-                'count': count,
-                'resource_type': resource_type
-            })
-        demo_teams.append({
-            'team_name': f"Team {team_names[i]}",
-            'team_description': f"Description for Team {team_names[i]}",
-            'start_year': start_year,
-            'start_month': start_month,
-            'end_year': end_year,
-            'end_month': end_month,
-            'duration_weeks': 0,
-            'team_roles': team_roles,
-            'cost_per_year': {},
-            'total_team_cost': 0
-        })
-    return demo_teams
-
-# Initialize session state for teams
-if 'teams' not in st.session_state:
-    st.session_state.teams = []
-
-# Function to recursively convert date objects to strings
-def convert_dates_to_strings(obj):
-    if isinstance(obj, dict):
-        for key, value in obj.items():
-            if isinstance(value, (datetime, date)):
-                obj[key] = value.isoformat()
-            else:
-                convert_dates_to_strings(value)
-    elif isinstance(obj, list):
-        for item in obj:
-            convert_dates_to_strings(item)
-
-# Function to recursively convert strings back to dates
-def convert_strings_to_dates(obj):
-    if isinstance(obj, dict):
-        for key, value in obj.items():
-            if isinstance(value, str):
-                try:
-                    parsed_date = datetime.fromisoformat(value)
-                    if parsed_date.time() == datetime.min.time():
-                        obj[key] = parsed_date.date()
-                    else:
-                        obj[key] = parsed_date
-                except ValueError:
-                    pass  # Not a date string
-            else:
-                convert_strings_to_dates(value)
-    elif isinstance(obj, list):
-        for item in obj:
-            convert_strings_to_dates(item)
-
-# Function to load teams from local storage
+# Trace this rerun: timing spans around each section, plus counts of rows, widgets and bytes
+if 'trace_session_id' not in st.session_state:
+    st.session_state.trace_session_id = uuid.uuid4().hex
+st.session_state.trace_rerun = st.session_state.get('trace_rerun', 0) + 1
+rerun_trace = start_trace(st.session_state.trace_session_id, st.session_state.trace_rerun)
+
+# Function to finish this rerun's trace and append it to the trace log, if one is configured
+def log_rerun_trace():
+    record = finish_trace(rerun_trace)
+    log_path = trace_log_path()
+    if log_path:
+        try:
+            append_trace_log(record, log_path)
+        except OSError as e:
+            st.warning(f"Could not write the trace log: {e}")
+    return record
+
+# Define the roles and their yearly salaries for this run; the sidebar adjusts this copy
+yearly_salaries = copy.deepcopy(DEFAULT_YEARLY_SALARIES)
+
+# Maximum memory held by the summary frames shared across sessions
+SUMMARY_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Function to get the summary frame cache shared by every session on this server
+@st.cache_resource
+def shared_summary_cache():
+    return create_frame_cache(SUMMARY_CACHE_MAX_BYTES)
+
+# Initialize session state for the cost cache
+if 'cost_cache' not in st.session_state:
+    st.session_state.cost_cache = create_cost_cache()
+
+# Teams edited since the last cost update; None makes the next update check every team
+if 'dirty_team_ids' not in st.session_state:
+    st.session_state.dirty_team_ids = None
+
+# Function to record teams whose cost inputs may have changed, so the next cost update fingerprints them
+def mark_teams_dirty(team_ids):
+    if st.session_state.dirty_team_ids is not None:
+        st.session_state.dirty_team_ids.update(int(team_id) for team_id in team_ids)
+
+# Function to make the next cost update check every team, after the whole store was replaced
+def mark_all_teams_dirty():
+    st.session_state.dirty_team_ids = None
+
+# Function to get the connection pool of a shared portfolio store, opened once per server and database file
+@st.cache_resource
+def shared_portfolio_store(path):
+    return create_snapshot_tables(open_shared_store(path))
+
+# Shared portfolio store, when configured: every session on the server edits the teams and salaries in one database
+shared_path = shared_store_path()
+shared_store = shared_portfolio_store(shared_path) if shared_path else None
+
+# Salaries come from the shared store, read once per session; the first session seeds it with the defaults
+if shared_store is not None and 'shared_salaries' not in st.session_state:
+    st.session_state.shared_salaries = load_shared_salaries(shared_store)
+    if not st.session_state.shared_salaries:
+        save_shared_salaries(shared_store, yearly_salaries, st.session_state.trace_session_id)
+
+# Function to drop the editor widget state of the given teams, so their widgets show the store's values again;
+# returns the ids of the teams that had widget state
+def clear_team_widgets(team_ids):
+    team_keys = {str(team_id) for team_id in team_ids}
+    cleared = set()
+    for widget_key in list(st.session_state.keys()):
+        key_parts = str(widget_key).split('_')
+        if key_parts[0] == 'team' and len(key_parts) > 2 and key_parts[1] in team_keys:
+            del st.session_state[widget_key]
+            cleared.add(int(key_parts[1]))
+    return cleared
+
+# Function to load teams from the shared store, or else from local storage (Arrow IPC tables)
 def load_teams_from_storage():
-    stored_teams_json = st.session_state.get('stored_teams', '[]')
+    if shared_store is not None:
+        try:
+            st.session_state.team_store, st.session_state.shared_sync = load_shared_portfolio(shared_store)
+        except Exception as e:
+            st.error(f"Error loading teams from the shared store: {e}")
+            st.session_state.team_store = create_team_store()
+            st.session_state.shared_sync = {'versions': pd.Series(dtype='int64'), 'hashes': pd.Series(dtype='uint64'), 'seq': 0}
+        return
+    stored_tables = st.session_state.get('stored_team_tables', {})
+    add_count(rerun_trace, 'stored_bytes_loaded', sum(len(stored['data']) for stored in stored_tables.values()))
     try:
-        teams_data = json.loads(stored_teams_json)
-        # Convert date strings back to date objects
-        convert_strings_to_dates(teams_data)
-        st.session_state.teams = teams_data
+        if stored_tables:
+            st.session_state.team_store = team_store_from_arrow({
+                name: arrow_from_ipc(stored['data']) for name, stored in stored_tables.items()
+            })
+        else:
+            st.session_state.team_store = create_team_store()
     except Exception as e:
         st.error(f"Error loading teams from storage: {e}")
+        st.session_state.team_store = create_team_store()
 
-# Function to save teams to local storage
+# Function to save teams to the shared store, writing only changed teams, or else to local storage, re-serializing
+# only the tables that changed
 def save_teams_to_storage():
-    teams_copy = st.session_state.teams.copy()
-    # Convert date objects to strings
-    convert_dates_to_strings(teams_copy)
-    st.session_state.stored_teams = json.dumps(teams_copy)
-
-# Load teams when the app starts
-load_teams_from_storage()
+    store = st.session_state.team_store
+    if shared_store is not None:
+        with timed_span(rerun_trace, 'save_teams_to_storage'):
+            push_result = push_shared_changes(shared_store, store, st.session_state.shared_sync, st.session_state.trace_session_id)
+        add_count(rerun_trace, 'shared_teams_written', len(push_result['saved']) + len(push_result['deleted']))
+
+        # Conflicting teams now hold the other user's version and renamed teams have new ids; rerun to show them
+        if push_result['conflicts'] or push_result['renamed']:
+            mark_teams_dirty(push_result['conflicts'] + list(push_result['renamed']) + list(push_result['renamed'].values()))
+            clear_team_widgets(push_result['conflicts'] + list(push_result['renamed']) + list(push_result['renamed'].values()))
+            if push_result['conflicts']:
+                st.session_state.shared_store_notice = (
+                    f"{len(push_result['conflicts'])} teams were changed by another user first; their changes were kept and yours were discarded."
+                )
+            log_rerun_trace()
+            st.rerun()
+        return
+    stored_tables = st.session_state.setdefault('stored_team_tables', {})
+    with timed_span(rerun_trace, 'save_teams_to_storage'):
+        for name in ('teams', 'roles', 'costs'):
+            table_hash = int(pd.util.hash_pandas_object(store[name]).sum())
+            table_shape = (store[name].shape, tuple(store[name].columns))
+            stored = stored_tables.get(name)
+            if stored and stored['hash'] == table_hash and stored['shape'] == table_shape:
+                continue
+            stored_tables[name] = {
+                'hash': table_hash,
+                'shape': table_shape,
+                'data': arrow_to_ipc(store_table_to_arrow(store, name))
+            }
+            add_count(rerun_trace, 'stored_bytes_written', len(stored_tables[name]['data']))
+
+# Load teams when the app starts; the store stays in session state across reruns
+if 'team_store' not in st.session_state:
+    with timed_span(rerun_trace, 'load_teams_from_storage'):
+        load_teams_from_storage()
+
+# Other sessions' changes to the shared store since the last rerun replace this session's copies of those teams
+elif shared_store is not None:
+    with timed_span(rerun_trace, 'pull_shared_changes'):
+        pulled = pull_shared_changes(shared_store, st.session_state.team_store, st.session_state.shared_sync, st.session_state.trace_session_id)
+    add_count(rerun_trace, 'shared_teams_pulled', len(pulled['team_ids']))
+    mark_teams_dirty(pulled['team_ids'])
+    reloaded_editors = clear_team_widgets(pulled['team_ids'])
+    if reloaded_editors:
+        st.session_state.shared_store_notice = (
+            f"{len(reloaded_editors)} teams open in the editor were changed by another user and have been reloaded."
+        )
+
+    # Salary inputs keep their own values; dropping them recreates them from the shared salaries
+    if pulled['salaries']:
+        st.session_state.shared_salaries = load_shared_salaries(shared_store)
+        for role, role_salaries in st.session_state.shared_salaries.items():
+            for resource_type in role_salaries:
+                st.session_state.pop(f"{role}_{resource_type}_adjust", None)
+for role, role_salaries in st.session_state.get('shared_salaries', {}).items():
+    for resource_type, salary in role_salaries.items():
+        if role in yearly_salaries and resource_type in yearly_salaries[role]:
+            yearly_salaries[role][resource_type] = salary
+add_count(rerun_trace, 'team_rows', len(st.session_state.team_store['teams']))
+add_count(rerun_trace, 'role_rows', len(st.session_state.team_store['roles']))
 
 # Sidebar for adjusting yearly salaries and data import/export
+sidebar_span = begin_span(rerun_trace, 'sidebar')
 with st.sidebar:
     st.header("Settings")
+
+    # Shared store status; a poll reruns the app when another session has changed the portfolio
+    if shared_store is not None:
+        shared_store_notice = st.session_state.pop('shared_store_notice', None)
+        if shared_store_notice:
+            st.warning(shared_store_notice)
+
+        @st.fragment(run_every=SHARED_POLL_SECONDS)
+        def shared_store_status():
+            if shared_store_version(shared_store, st.session_state.trace_session_id) > st.session_state.shared_sync['seq']:
+                st.rerun()
+            st.caption(f"Shared portfolio: {os.path.basename(shared_path)}, {len(st.session_state.team_store['teams']):,} teams.")
+        shared_store_status()
+
+    # Show this rerun's timings and counts at the bottom of the sidebar
+    show_timing_panel = st.toggle("Show performance panel", key='show_timing_panel')
     
     # Adjust Yearly Salaries
     with st.expander("Adjust Yearly Salaries"):
+        if 'applied_salaries' not in st.session_state:
+            st.session_state.applied_salaries = {}
+        applied_salaries = st.session_state.applied_salaries
+        changed_salaries = []
         for role in yearly_salaries.keys():
             st.subheader(f"{role} Salaries")
             for resource_type in yearly_salaries[role]:
@@ -244,18 +315,97 @@ with st.sidebar:
                     step=1000,
                     key=f"{role}_{resource_type}_adjust"
                 )
+                add_count(rerun_trace, 'widgets', 1)
                 yearly_salaries[role][resource_type] = new_salary
 
+                # Changed salaries are propagated once the schedule built on them is known
+                if applied_salaries.get((role, resource_type), current_salary) != new_salary:
+                    changed_salaries.append((role, resource_type))
+                applied_salaries[(role, resource_type)] = new_salary
+
+    # Salary schedule: annual escalation from the base year's salaries above, plus explicit overrides
+    with st.expander("Salary Schedule"):
+        schedule_base_year = st.selectbox(
+            "Salaries above apply in", options=YEAR_OPTIONS, index=YEAR_OPTIONS.index(date.today().year), key='schedule_base_year'
+        )
+        default_escalation = st.number_input("Annual escalation (%)", value=0.0, step=0.5, format="%.1f", key='schedule_default_escalation')
+        role_escalation_df = st.data_editor(
+            pd.DataFrame({'Escalation %': np.nan}, index=pd.Index(list(yearly_salaries), name='Role')),
+            key='schedule_role_escalation',
+            column_config={'Escalation %': st.column_config.NumberColumn("Escalation %", help="Overrides the annual escalation for this role.", format="%.1f")}
+        )
+        st.caption("Overrides set a salary from a year (2027) or month (2027-07) on; escalation continues from it.")
+        schedule_overrides_df = st.data_editor(
+            pd.DataFrame({'role': pd.Series(dtype=object), 'resource_type': pd.Series(dtype=object), 'from': pd.Series(dtype=object), 'salary': pd.Series(dtype='float64')}),
+            key='schedule_overrides',
+            num_rows='dynamic',
+            hide_index=True,
+            column_config={
+                'role': st.column_config.SelectboxColumn("Role", options=list(yearly_salaries), required=True),
+                'resource_type': st.column_config.SelectboxColumn("Resource Type", options=list(next(iter(yearly_salaries.values()))), required=True),
+                'from': st.column_config.TextColumn("From", required=True),
+                'salary': st.column_config.NumberColumn("Salary", min_value=0, step=1000, required=True)
+            }
+        )
+        try:
+            salary_schedule = build_salary_schedule(
+                yearly_salaries,
+                schedule_base_year,
+                role_escalation_df['Escalation %'].to_dict(),
+                schedule_overrides_df.dropna().to_dict('records'),
+                default_escalation
+            )
+        except ValueError as e:
+            st.error(f"Salary schedule ignored: {e}")
+            salary_schedule = None
+
+    # Recompute only the teams that use a changed salary
+    touched_teams = pd.Index([], dtype='int64')
+    for role, resource_type in changed_salaries:
+        touched_teams = touched_teams.union(propagate_salary_change(
+            st.session_state.team_store, st.session_state.cost_cache, role, resource_type, yearly_salaries, salary_schedule
+        ))
+    if len(touched_teams):
+        st.info(f"Salary change updated costs for {len(touched_teams)} teams.")
+    if shared_store is not None and changed_salaries:
+        save_shared_salaries(shared_store, yearly_salaries, st.session_state.trace_session_id)
+
+    # Salary currencies and FX rates; summaries are converted into the reporting currency month by month
+    with st.expander("Currencies"):
+        st.caption("FX rates give the value of one unit in USD, per year (2026) or month (2026-03).")
+        fx_rates = st.data_editor(
+            pd.DataFrame(DEFAULT_FX_RATES),
+            key='fx_rates_editor',
+            num_rows='dynamic',
+            column_config={col: st.column_config.NumberColumn(col, min_value=0.0, format="%.4f") for col in DEFAULT_FX_RATES}
+        )
+        currency_options = list(fx_rates.columns)
+        salary_currencies_df = st.data_editor(
+            pd.DataFrame(default_salary_currencies(yearly_salaries)).T,
+            key='salary_currencies_editor',
+            column_config={
+                col: st.column_config.SelectboxColumn(col, options=currency_options, required=True)
+                for col in next(iter(yearly_salaries.values()))
+            }
+        )
+        salary_currencies = {role: row.dropna().to_dict() for role, row in salary_currencies_df.iterrows()}
+        reporting_currency = st.selectbox("Reporting currency", options=currency_options, key='reporting_currency')
+        try:
+            summary_currency = currency_settings(salary_currencies, fx_rates, reporting_currency)
+        except ValueError as e:
+            st.error(f"Costs are shown unconverted: {e}")
+            summary_currency = None
+            reporting_currency = BASE_CURRENCY
+
     st.header("Data Import/Export")
 
     # Export Teams
     if st.button('Export Teams', key='export_teams'):
-        if st.session_state.get('teams'):
+        if len(st.session_state.team_store['teams']):
             # Prepare data for export
-            teams_copy = st.session_state.teams.copy()
-            # Convert date objects to strings
-            convert_dates_to_strings(teams_copy)
-            teams_json = json.dumps(teams_copy, indent=4)
+            # Dates are encoded as ISO strings by the team document schema
+            teams_json = json.dumps(team_store_to_records(st.session_state.team_store), indent=4)
+            add_count(rerun_trace, 'export_bytes', len(teams_json))
             st.download_button(
                 'Download Teams Data',
                 data=teams_json,
@@ -266,46 +416,136 @@ with st.sidebar:
             st.info("No teams to export.")
 
     # Import Teams
-    uploaded_file = st.file_uploader("Upload Teams Data", type=['json'], key='upload_teams')
-    if uploaded_file is not None:
+    uploaded_file = st.file_uploader(
+        "Upload Teams Data",
+        type=['json', 'jsonl', 'csv', 'parquet'],
+        help="JSON array or JSON Lines of teams, or a CSV/Parquet table with one row per role.",
+        key='upload_teams'
+    )
+    # Import each uploaded file once; the uploader keeps returning it on later reruns
+    if uploaded_file is not None and st.session_state.get('imported_file_id') != uploaded_file.file_id:
+        import_progress = st.progress(0.0, text="Importing teams...")
+        add_count(rerun_trace, 'upload_bytes', uploaded_file.size)
         try:
-            teams_json = uploaded_file.read().decode('utf-8')
-            teams_data = json.loads(teams_json)
-            # Convert strings back to dates
-            convert_strings_to_dates(teams_data)
-            # Ensure 'team_roles' is initialized
-            for team in teams_data:
-                if 'team_roles' not in team or team['team_roles'] is None:
-                    team['team_roles'] = []
-
-                # Reset calculated fields
-                team['cost_per_year'] = {}
-                team['total_team_cost'] = 0
-
-            st.session_state.teams = teams_data
+            imported_store, import_problems = import_teams_file(
+                uploaded_file,
+                uploaded_file.name,
+                total_bytes=uploaded_file.size,
+                on_progress=lambda fraction: import_progress.progress(min(fraction, 1.0), text="Importing teams...")
+            )
+            st.session_state.team_store = imported_store
+            mark_all_teams_dirty()
+            st.session_state.imported_file_id = uploaded_file.file_id
             save_teams_to_storage()
-            st.success("Teams data uploaded successfully.")
+            st.success(f"Imported {len(imported_store['teams'])} teams with {len(imported_store['roles'])} roles.")
+            if import_problems:
+                st.warning(f"Skipped {len(import_problems)} invalid entries: " + "; ".join(import_problems[:5]))
         except Exception as e:
             st.error(f"Error uploading teams data: {e}")
+        import_progress.empty()
 
     # Reset Teams
     if st.button('Reset All Teams', key='reset_all_teams'):
-        st.session_state.teams = []
+        st.session_state.team_store = create_team_store()
+        mark_all_teams_dirty()
         save_teams_to_storage()
         st.success("All teams have been reset.")
 
     # Generate Demo Teams
     if st.button('Generate Demo Teams', key='generate_demo_teams'):
-        st.session_state.teams = generate_demo_teams()
+        st.session_state.team_store = team_store_from_records(generate_demo_teams(yearly_salaries))
+        mark_all_teams_dirty()
         save_teams_to_storage()
         st.success("Demo teams have been generated.")
+end_span(rerun_trace, sidebar_span)
+
+# Function to bring the cost cache and the team store up to date, fingerprinting only the teams edited since the
+# last update; returns the number of teams recomputed
+def update_dirty_team_costs():
+    recomputed_teams = update_portfolio_costs(
+        st.session_state.team_store, st.session_state.cost_cache, yearly_salaries, salary_schedule, st.session_state.dirty_team_ids
+    )
+    st.session_state.dirty_team_ids = set()
+    return recomputed_teams
+
+# Number formats for amounts in the reporting currency, by currency
+CURRENCY_COLUMN_FORMATS = {'USD': "dollar", 'EUR': "euro", 'JPY': "yen"}
+money_column_format = CURRENCY_COLUMN_FORMATS.get(reporting_currency, f"%.2f {reporting_currency}")
+money_tooltip_format = '$,.2f' if reporting_currency == 'USD' else ',.2f'
+
+# Function to format an amount in the reporting currency
+def format_money(amount):
+    return f"${amount:,.2f}" if reporting_currency == 'USD' else f"{amount:,.2f} {reporting_currency}"
+
+# Function to show a cost table as a data grid: costs stay numeric and are formatted per column, and rows
+# past the first thousand are sent to the browser as they are scrolled into view
+def show_cost_table(df, label_columns):
+    df = df.rename(columns=str)
+    st.dataframe(
+        df,
+        hide_index=True,
+        lazy=True,
+        column_config={col: st.column_config.NumberColumn(format=money_column_format) for col in df.columns if col not in label_columns}
+    )
+
+# Sections costed straight from the salary table add each salary in its own currency; their amounts are in that
+# currency when every salary shares one, and otherwise are unconverted sums labelled as such
+salary_table_currencies = {
+    salary_currencies.get(role, {}).get(resource_type, BASE_CURRENCY)
+    for role, role_salaries in yearly_salaries.items()
+    for resource_type in role_salaries
+}
+salary_table_currency = next(iter(salary_table_currencies)) if len(salary_table_currencies) == 1 else None
+salary_amount_label = salary_table_currency or "unconverted"
+salary_tooltip_format = '$,.2f' if salary_table_currency == 'USD' else ',.2f'
+
+# Function to format an amount from the salary table
+def format_salary_amount(amount):
+    if salary_table_currency == 'USD':
+        return f"${amount:,.2f}"
+    return f"{amount:,.2f} {salary_table_currency}" if salary_table_currency else f"{amount:,.2f}"
+
+# Function to configure a column of amounts from the salary table, labelled with their currency
+def salary_money_column(label, decimals=2, **kwargs):
+    if salary_table_currency == 'USD':
+        number_format = f"$%.{decimals}f"
+    else:
+        number_format = f"%.{decimals}f {salary_table_currency}" if salary_table_currency else f"%.{decimals}f"
+    return st.column_config.NumberColumn(f"{label} ({salary_amount_label})", format=number_format, **kwargs)
+
+# Function to note under a section costed from the salary table how its amounts relate to the reporting currency
+def salary_currency_note():
+    if salary_table_currency is None:
+        st.caption(
+            f"Salaries are in {', '.join(sorted(salary_table_currencies))}; amounts in this section add them unconverted. "
+            f"The summary and dashboard convert them to {reporting_currency}."
+        )
+    elif salary_table_currency != reporting_currency:
+        st.caption(f"Amounts in this section are in {salary_table_currency} and are not converted to {reporting_currency}.")
+
+# Function to offer a table for download in every export format; the file is only built when its button is clicked
+def table_download_buttons(df, file_stem, key):
+    columns = st.columns(len(TABLE_EXPORT_FORMATS))
+    for column, (file_format, mime) in zip(columns, TABLE_EXPORT_FORMATS.items()):
+        with column:
+            st.download_button(
+                f"Download .{file_format}",
+                data=lambda file_format=file_format: summary_table_bytes(df, file_format),
+                file_name=f"{file_stem}.{file_format}",
+                mime=mime,
+                on_click='ignore',
+                key=f"{key}_{file_format}"
+            )
 
-# Function to add a new team
-def add_team():
-    # Set default role and resource type
+# Function to get the default role for new teams and role rows
+def default_team_role():
     default_role = list(yearly_salaries.keys())[0]
     default_resource_type = list(yearly_salaries[default_role].keys())[0]
-    st.session_state.teams.append({
+    return {'role': default_role, 'count': 1.0, 'resource_type': default_resource_type}
+
+# Function to add a new team
+def add_team():
+    team_id = add_store_team(st.session_state.team_store, {
         'team_name': '',
         'team_description': '',
         'start_year': date.today().year,
@@ -313,34 +553,69 @@ def add_team():
         'end_year': date.today().year,
         'end_month': date.today().month,
         'duration_weeks': 0,
-        'team_roles': [{'role': default_role, 'count': 1.0, 'resource_type': default_resource_type}],
-        'cost_per_year': {},
+        'team_roles': [default_team_role()],
         'total_team_cost': 0
     })
+    mark_teams_dirty([team_id])
     save_teams_to_storage()
 
 # Add Team Button
 if st.button("Add New Team", key="add_new_team"):
     add_team()
 
-# Display existing teams and allow editing
-if st.session_state.teams:
-    teams = st.session_state.teams  # For convenience
-    team_names = [team['team_name'] or f"Team {idx+1}" for idx, team in enumerate(teams)]
-    team_tabs = st.tabs(team_names)
-    for idx, (team, team_tab) in enumerate(zip(teams, team_tabs)):
+# Number of teams whose editing widgets are rendered at once
+EDITOR_PAGE_SIZES = [5, 10, 25, 50]
+
+# Display existing teams and allow editing; only the current page of matching teams renders widgets
+editor_span = begin_span(rerun_trace, 'editor')
+store = st.session_state.team_store
+if len(store['teams']):
+    teams = store['teams']  # For convenience
+    col1, col2, col3, col4 = st.columns([3, 3, 1, 1])
+    with col1:
+        team_search = st.text_input("Search teams", key='editor_search')
+    with col2:
+        role_filter = st.multiselect("Teams with roles", options=list(yearly_salaries.keys()), key='editor_role_filter')
+    with timed_span(rerun_trace, 'editor.find_teams'):
+        matching_ids = find_teams(store, team_search.strip(), role_filter)
+    add_count(rerun_trace, 'matching_team_rows', len(matching_ids))
+    with col3:
+        page_size = st.selectbox("Teams per page", options=EDITOR_PAGE_SIZES, index=1, key='editor_page_size')
+    num_pages = max(1, -(-len(matching_ids) // page_size))
+
+    # Keep the page in range when the filter or page size shrinks the list; the page widget reads its value from the key
+    st.session_state.setdefault('editor_page', 1)
+    if st.session_state.editor_page > num_pages:
+        st.session_state.editor_page = num_pages
+    with col4:
+        page = st.number_input("Page", min_value=1, max_value=num_pages, step=1, key='editor_page')
+    page_ids = matching_ids[(page - 1) * page_size:page * page_size]
+
+    # Bulk edit mode replaces the per-team tabs with one table of every matching team's roles
+    bulk_role_editing = st.toggle("Bulk edit roles", key='editor_bulk_mode')
+
+    if not len(matching_ids):
+        st.info("No teams match the search.")
+    elif not bulk_role_editing:
+        st.caption(f"Showing teams {(page - 1) * page_size + 1}-{(page - 1) * page_size + len(page_ids)} of {len(matching_ids)} matching ({len(teams)} in total).")
+
+    role_groups = store['roles'].groupby('team_id', sort=False).indices
+    display_names = pd.Series(team_display_names(teams), index=teams.index)
+    team_tabs = st.tabs(display_names.loc[page_ids].tolist()) if len(page_ids) and not bulk_role_editing else []
+    tabs_span = begin_span(rerun_trace, 'editor.team_tabs')
+    for team_id, team_tab in zip(page_ids.tolist(), team_tabs):
         with team_tab:
             # Team Details Section
             with st.expander("Team Details", expanded=True):
-                team['team_name'] = st.text_input(
+                teams.at[team_id, 'team_name'] = st.text_input(
                     "Team Name",
-                    value=team['team_name'],
-                    key=f"team_{idx}_name"
+                    value=teams.at[team_id, 'team_name'],
+                    key=f"team_{team_id}_name"
                 )
-                team['team_description'] = st.text_area(
+                teams.at[team_id, 'team_description'] = st.text_area(
                     "Team Description",
-                    value=team['team_description'],
-                    key=f"team_{idx}_description"
+                    value=teams.at[team_id, 'team_description'],
+                    key=f"team_{team_id}_description"
                 )
 
             # Team Duration Section
@@ -349,187 +624,263 @@ if st.session_state.teams:
                 with col1:
                     start_year = st.selectbox(
                         "Start Year",
-                        options=range(2020, 2031),
-                        index=team.get('start_year', date.today().year) - 2020,
-                        key=f"team_{idx}_start_year"
+                        options=YEAR_OPTIONS,
+                        index=int(teams.at[team_id, 'start_year']) - YEAR_OPTIONS[0],
+                        key=f"team_{team_id}_start_year",
+                        on_change=mark_teams_dirty,
+                        args=([team_id],)
                     )
                     start_month = st.selectbox(
                         "Start Month",
                         options=list(calendar.month_name)[1:],  # Exclude empty string at index 0
-                        index=team.get('start_month', date.today().month) - 1,
-                        key=f"team_{idx}_start_month"
+                        index=int(teams.at[team_id, 'start_month']) - 1,
+                        key=f"team_{team_id}_start_month",
+                        on_change=mark_teams_dirty,
+                        args=([team_id],)
                     )
-                    try:
-                        team['start_year'] = start_year
-                        team['start_month'] = list(calendar.month_name).index(start_month)
-                        team['start_date'] = datetime(
-                            start_year,
-                            team['start_month'],
-                            1
-                        ).date()
-                    except Exception as e:
-                        st.error(f"Invalid start date: {e}")
-                        team['duration_weeks'] = 0
+                    teams.at[team_id, 'start_year'] = start_year
+                    teams.at[team_id, 'start_month'] = list(calendar.month_name).index(start_month)
+                    start_date = date(start_year, int(teams.at[team_id, 'start_month']), 1)
 
                 with col2:
                     end_year = st.selectbox(
                         "End Year",
-                        options=range(2020, 2031),
-                        index=team.get('end_year', date.today().year) - 2020,
-                        key=f"team_{idx}_end_year"
+                        options=YEAR_OPTIONS,
+                        index=int(teams.at[team_id, 'end_year']) - YEAR_OPTIONS[0],
+                        key=f"team_{team_id}_end_year",
+                        on_change=mark_teams_dirty,
+                        args=([team_id],)
                     )
                     end_month = st.selectbox(
                         "End Month",
                         options=list(calendar.month_name)[1:],  # Exclude empty string at index 0
-                        index=team.get('end_month', date.today().month) - 1,
-                        key=f"team_{idx}_end_month"
+                        index=int(teams.at[team_id, 'end_month']) - 1,
+                        key=f"team_{team_id}_end_month",
+                        on_change=mark_teams_dirty,
+                        args=([team_id],)
                     )
-                    try:
-                        team['end_year'] = end_year
-                        team['end_month'] = list(calendar.month_name).index(end_month)
-                        team['end_date'] = datetime(
-                            end_year,
-                            team['end_month'],
-                            1
-                        ).date()
-                    except Exception as e:
-                        st.error(f"Invalid end date: {e}")
-                        team['duration_weeks'] = 0
+                    teams.at[team_id, 'end_year'] = end_year
+                    teams.at[team_id, 'end_month'] = list(calendar.month_name).index(end_month)
+                    end_date = date(end_year, int(teams.at[team_id, 'end_month']), 1)
 
                     # Calculate duration in weeks
-                    if team['end_date'] and team['start_date']:
-                        if team['end_date'] <= team['start_date']:
-                            st.error("End date must be after start date.")
-                            team['duration_weeks'] = 0
-                        else:
-                            duration_days = (team['end_date'] - team['start_date']).days + 1
-                            team['duration_weeks'] = round(duration_days / 7, 2)
+                    if end_date <= start_date:
+                        st.error("End date must be after start date.")
+                        teams.at[team_id, 'duration_weeks'] = 0
+                    else:
+                        duration_days = (end_date - start_date).days + 1
+                        teams.at[team_id, 'duration_weeks'] = round(duration_days / 7, 2)
 
             # Roles in Team Section
             with st.expander("Roles in Team", expanded=True):
                 # Define Roles in Team
-                team_roles = team.get('team_roles', [])
+                role_ids = store['roles'].index[role_groups.get(team_id, [])]
                 num_roles = st.number_input(
                     "Number of Different Roles",
                     min_value=1,
-                    value=len(team_roles) if team_roles else 1,
+                    value=len(role_ids) if len(role_ids) else 1,
                     step=1,
-                    key=f"team_{idx}_num_roles"
+                    key=f"team_{team_id}_num_roles"
                 )
 
-                # Adjust the team_roles list to match num_roles
-                while len(team_roles) < num_roles:
-                    # Set default role and resource_type to valid values
-                    default_role = list(yearly_salaries.keys())[0]
-                    default_resource_type = list(yearly_salaries[default_role].keys())[0]
-                    team_roles.append({'role': default_role, 'count': 1.0, 'resource_type': default_resource_type})
-                while len(team_roles) > num_roles:
-                    team_roles.pop()
-
-                team['team_roles'] = team_roles  # Update the team dict
+                # Adjust the team's role rows to match num_roles
+                if len(role_ids) != num_roles:
+                    mark_teams_dirty([team_id])
+                    role_ids = resize_store_team_roles(store, team_id, role_ids, int(num_roles), default_team_role())
+                    role_groups = store['roles'].groupby('team_id', sort=False).indices
+                roles = store['roles']
 
-                for j in range(int(num_roles)):
+                for j, role_id in enumerate(role_ids):
                     st.write(f"**Role {j+1}**")
-                    role_info = team_roles[j]
                     col1, col2, col3 = st.columns(3)
 
                     with col1:
-                        role_info['role'] = st.selectbox(
+                        current_role = roles.at[role_id, 'role']
+                        roles.at[role_id, 'role'] = st.selectbox(
                             "Role",
                             options=list(yearly_salaries.keys()),
-                            index=list(yearly_salaries.keys()).index(role_info['role']) if role_info['role'] in yearly_salaries else 0,
-                            key=f"team_{idx}_role_{j}_role_select"
+                            index=list(yearly_salaries.keys()).index(current_role) if current_role in yearly_salaries else 0,
+                            key=f"team_{team_id}_role_{j}_role_select",
+                            on_change=mark_teams_dirty,
+                            args=([team_id],)
                         )
 
                     with col2:
-                        resource_types = list(yearly_salaries.get(role_info['role'], {}).keys())
+                        resource_types = list(yearly_salaries.get(roles.at[role_id, 'role'], {}).keys())
+                        current_resource_type = roles.at[role_id, 'resource_type']
                         if resource_types:
-                            role_info['resource_type'] = st.selectbox(
+                            roles.at[role_id, 'resource_type'] = st.selectbox(
                                 "Resource Type",
                                 options=resource_types,
-                                index=resource_types.index(role_info['resource_type']) if role_info['resource_type'] in resource_types else 0,
-                                key=f"team_{idx}_role_{j}_resource_type_select"
+                                index=resource_types.index(current_resource_type) if current_resource_type in resource_types else 0,
+                                key=f"team_{team_id}_role_{j}_resource_type_select",
+                                on_change=mark_teams_dirty,
+                                args=([team_id],)
                             )
                         else:
-                            st.error(f"No resource types available for {role_info['role']}")
+                            st.error(f"No resource types available for {roles.at[role_id, 'role']}")
 
                     with col3:
-                        role_info['count'] = st.number_input(
+                        roles.at[role_id, 'count'] = st.number_input(
                             "FTE Count",
                             min_value=0.0,
-                            value=float(role_info.get('count', 1.0)),
+                            value=float(roles.at[role_id, 'count']),
                             step=0.5,
                             format="%.1f",
-                            key=f"team_{idx}_role_{j}_fte_input"
+                            key=f"team_{team_id}_role_{j}_fte_input",
+                            on_change=mark_teams_dirty,
+                            args=([team_id],)
                         )
 
+                    # Roles the salary table no longer lists fall back to its first entry without a widget change
+                    if roles.at[role_id, 'role'] != current_role or roles.at[role_id, 'resource_type'] != current_resource_type:
+                        mark_teams_dirty([team_id])
+                add_count(rerun_trace, 'widgets', 3 * len(role_ids))
+
             # Delete Team Button
-            if st.button('Delete Team', key=f'delete_team_{idx}'):
-                del st.session_state.teams[idx]
+            add_count(rerun_trace, 'widgets', 8)
+            if st.button('Delete Team', key=f'delete_team_{team_id}'):
+                delete_store_team(store, team_id)
+                mark_teams_dirty([team_id])
                 save_teams_to_storage()
-                st.experimental_rerun()
+                log_rerun_trace()
+                st.rerun()
+    end_span(rerun_trace, tabs_span)
+
+    if bulk_role_editing and len(matching_ids):
+        # Report the last applied batch, which was stored before the rerun
+        bulk_edit_result = st.session_state.pop('bulk_role_edit_result', None)
+        if bulk_edit_result:
+            st.success(bulk_edit_result['message'])
+            for problem in bulk_edit_result['problems']:
+                st.warning(problem)
+
+        # Edits accumulate in the form and reach the store as one batched diff on submit
+        bulk_roles_df = role_edit_frame(store, matching_ids)
+        add_count(rerun_trace, 'bulk_editor_rows', len(bulk_roles_df))
+        resource_type_options = list(dict.fromkeys(
+            resource_type for role_salaries in yearly_salaries.values() for resource_type in role_salaries
+        ))
+        bulk_editor_key = f"bulk_roles_{st.session_state.get('bulk_roles_version', 0)}"
+        with st.form(key='bulk_roles_form'):
+            st.data_editor(
+                bulk_roles_df,
+                key=bulk_editor_key,
+                num_rows='dynamic',
+                hide_index=True,
+                disabled=['Team'],
+                column_config={
+                    'team_id': st.column_config.NumberColumn("Team ID", required=True, step=1, format="%d"),
+                    'Role': st.column_config.SelectboxColumn("Role", options=list(yearly_salaries.keys()), required=True),
+                    'Resource Type': st.column_config.SelectboxColumn("Resource Type", options=resource_type_options, required=True),
+                    'FTE': st.column_config.NumberColumn("FTE", min_value=0.0, step=0.5, format="%.1f", required=True)
+                }
+            )
+            apply_bulk_edits = st.form_submit_button("Apply Role Changes")
+
+        if apply_bulk_edits:
+            edit_result = apply_role_edits(store, bulk_roles_df.index, st.session_state[bulk_editor_key], yearly_salaries)
+
+            # The rerun's cost update recomputes the whole batch at once, fingerprinting only the touched teams
+            mark_teams_dirty(edit_result['team_ids'])
+            save_teams_to_storage()
+            st.session_state.bulk_role_edit_result = {
+                'message': (
+                    f"Applied {edit_result['updated']} updated, {edit_result['added']} added and {edit_result['deleted']} deleted "
+                    f"roles across {len(edit_result['team_ids'])} teams."
+                ),
+                'problems': edit_result['problems']
+            }
+
+            # A fresh editor key drops the applied diff from the table's state
+            st.session_state.bulk_roles_version = st.session_state.get('bulk_roles_version', 0) + 1
+            log_rerun_trace()
+            st.rerun()
 
     # Save teams when any input changes
     save_teams_to_storage()
+
+    # Compact overview of every matching team; rows render as one table rather than as widgets
+    with timed_span(rerun_trace, 'editor.overview'), st.expander(f"All Matching Teams ({len(matching_ids)})", expanded=False):
+        st.dataframe(
+            team_overview_frame(store, matching_ids),
+            hide_index=True,
+            column_config={
+                'FTE': st.column_config.NumberColumn(format="%.1f"),
+                'Total Cost': salary_money_column('Total Cost')
+            }
+        )
 else:
     st.write("No teams defined yet.")
+end_span(rerun_trace, editor_span)
+
+# Bring costs up to date once per rerun, after the editor has applied its edits; the sections below read the cost cache
+with timed_span(rerun_trace, 'update_costs'):
+    recomputed_teams = update_dirty_team_costs()
+add_count(rerun_trace, 'recomputed_teams', recomputed_teams)
+if recomputed_teams:
+    save_teams_to_storage()
 
-# The rest of your application code (Generate Gantt Chart, Summary Dashboard, etc.) remains unchanged.
+# Cost summary granularity; changing it re-aggregates the cached costs without recomputing them
+col1, col2 = st.columns(2)
+with col1:
+    summary_granularity = st.radio("Summary granularity", options=list(GRANULARITIES), index=2, horizontal=True, key='summary_granularity')
+with col2:
+    fiscal_year_start_name = st.selectbox("Fiscal year starts in", options=list(calendar.month_name)[1:], index=0, key='fiscal_year_start')
+fiscal_year_start = list(calendar.month_name).index(fiscal_year_start_name)
 
 # Generate Gantt Chart and Cost Summaries
 if st.button("Generate Gantt Chart and Cost Summary", key="generate_gantt_cost_summary"):
-    teams = st.session_state.teams
-    if not teams:
+    summary_span = begin_span(rerun_trace, 'summary')
+    store = st.session_state.team_store
+    teams = store['teams']
+    if not len(teams):
         st.error("Please define at least one team.")
     else:
-        # Calculate costs and prepare data
-        gantt_data = []
-        all_years = set()
-        for team in teams:
-            if not team.get('start_date') or not team.get('end_date') or not team.get('team_roles'):
-                st.warning(f"Team '{team['team_name'] or 'Unnamed'}' is incomplete and will be skipped.")
-                continue
-
-            # Calculate team cost per year
-            team['cost_per_year'] = calculate_team_cost_per_year(team['team_roles'], team['start_date'], team['end_date'])
-            team['total_team_cost'] = sum(team['cost_per_year'].values())
-
-            # Calculate role costs for pie chart
-            team['role_costs'] = calculate_role_costs(team['team_roles'], team['start_date'], team['end_date'])
-
-            # Prepare data for Gantt chart
-            roles_list = []
-            for role_info in team['team_roles']:
-                count = role_info['count']
-                role = role_info['role']
-                resource_type = role_info['resource_type']
-                roles_list.append(f"{count} x {role} ({resource_type})")
-            roles_str = ", ".join(roles_list)
-            team_name = team['team_name'] or f"Team {idx+1}"
-            team_cost = team['total_team_cost']
-            team_description = team['team_description']
-            start_date = pd.Timestamp(team['start_date'])
-            end_date = pd.Timestamp(team['end_date'])
-            gantt_data.append({
-                'Team': team_name,
-                'Start': start_date,
-                'End': end_date,
-                'Cost': team_cost,
-                'Roles': roles_str,
-                'Description': team_description,
-                'Role Costs': team['role_costs']
-            })
-
-            all_years.update(team['cost_per_year'].keys())
+        # Collect complete teams (teams with at least one role) for the batched cost engine
+        roles = store['roles']
+        has_roles = teams.index.isin(roles['team_id'])
+        for team_name in teams.loc[~has_roles, 'team_name']:
+            st.warning(f"Team '{team_name or 'Unnamed'}' is incomplete and will be skipped.")
+
+        # Summary and chart frames are shared across sessions, keyed by the portfolio content, salaries and granularity
+        summary_cache = shared_summary_cache()
+        with timed_span(rerun_trace, 'summary.cache_lookup'):
+            summary_key = portfolio_content_hash(
+                store, yearly_salaries, summary_granularity, fiscal_year_start,
+                summary_currency and summary_currency['key'], salary_schedule and salary_schedule['key']
+            )
+            summary_artifacts = frame_cache_get(summary_cache, summary_key)
+        if summary_artifacts is None:
+            # Prepare data for the Gantt chart and cost summaries from the cost cache
+            with timed_span(rerun_trace, 'summary.build_frames'):
+                summary_frames = build_summary_frames(
+                    store, st.session_state.cost_cache, summary_granularity, fiscal_year_start, summary_currency
+                )
+                summary_artifacts = {
+                    'summary': summary_frames,
+                    'charts': build_chart_frames(summary_frames, summary_granularity)
+                }
+            frame_cache_put(summary_cache, summary_key, summary_artifacts)
+        else:
+            # A hit needs no cost work: the frames were built from costs with the same content key
+            st.caption(f"Loaded the summary from the shared cache ({summary_cache['hits']} hits, {summary_cache['misses']} misses).")
+        summary_frames = summary_artifacts['summary']
+        gantt_df = summary_frames['gantt']
 
-        if not gantt_data:
+        if gantt_df.empty:
             st.error("No complete teams to display.")
         else:
-            gantt_df = pd.DataFrame(gantt_data)
+            # Chart the largest teams individually and bin the rest, so chart payloads stay bounded
+            chart_frames = summary_artifacts['charts']
+            chart_payloads = {}
+
+            # Spec bytes cost an extra serialization of every chart, so they are only measured while tracing
+            measure_chart_bytes = show_timing_panel or bool(trace_log_path())
 
-            # Create Gantt chart using Altair
-            base = alt.Chart(gantt_df).encode(
-                x='Start:T',
+            # Create Gantt chart using Altair; the Gantt and pie share one dataset, split by layer
+            base = alt.Chart().transform_filter(alt.datum.Layer == 'gantt').encode(
+                x=alt.X('Start:T', axis=alt.Axis(tickCount={'interval': 'month', 'step': GRANULARITIES[summary_granularity]})),
                 x2='End:T',
                 y=alt.Y('Team:N', sort=alt.EncodingSortField(field='Start', order='ascending')),
                 color=alt.Color('Cost:Q', scale=alt.Scale(scheme='blues')),
@@ -538,140 +889,667 @@ if st.button("Generate Gantt Chart and Cost Summary", key="generate_gantt_cost_s
             bars = base.mark_bar().encode(
                 tooltip=[
                     'Team', 'Start', 'End',
-                    alt.Tooltip('Cost:Q', format='$,.2f'),
+                    alt.Tooltip('Cost:Q', format=money_tooltip_format),
                     'Roles', 'Description'
                 ]
             )
 
-            # Modify selection
-            selection = alt.selection_single(
-                fields=['Team'],
+            # Hovering a bar selects its team or bin; nothing is selected otherwise
+            selection = alt.selection_point(
+                fields=['Key'],
                 on='mouseover',
                 nearest=False,
-                empty='none',
+                empty=False,
                 clear='mouseout'
             )
 
-            gantt_chart = bars.add_selection(selection)
-
-            # Data transformation for pie chart
-            pie_data = []
-            for idx, row in gantt_df.iterrows():
-                team_name = row['Team']
-                role_costs = row['Role Costs']
-                for role, cost in role_costs.items():
-                    pie_data.append({
-                        'Team': team_name,
-                        'Role': role,
-                        'Cost': cost
-                    })
-            pie_df = pd.DataFrame(pie_data)
-
-            pie_chart = alt.Chart(pie_df).transform_filter(
+            gantt_chart = bars.add_params(selection)
+
+            # Pie chart of role costs for the hovered team or bin
+            pie_chart = alt.Chart().transform_filter(
+                alt.datum.Layer == 'pie'
+            ).transform_filter(
                 selection
             ).mark_arc().encode(
                 theta=alt.Theta('Cost:Q', stack=True),
                 color=alt.Color('Role:N', legend=alt.Legend(title="Roles", orient="bottom")),
-                tooltip=[alt.Tooltip('Role:N'), alt.Tooltip('Cost:Q', format='$,.2f')]
+                tooltip=[alt.Tooltip('Role:N'), alt.Tooltip('Cost:Q', format=money_tooltip_format)]
             ).properties(
                 width=300,
                 height=300
             )
 
+            gantt_pie_df = shared_gantt_pie_data(chart_frames)
             combined_chart = alt.hconcat(
                 gantt_chart.properties(title='Team Gantt Chart').interactive(),
-                pie_chart.properties(title='Team Cost Composition')
+                pie_chart.properties(title='Team Cost Composition'),
+                data=gantt_pie_df
             )
 
-            st.altair_chart(combined_chart, use_container_width=True)
-
-            # Yearly Cost Summary
-            st.header("Yearly Cost Summary")
-            all_years = sorted(all_years)
-            yearly_costs = []
-            for year in all_years:
-                total_cost = 0
-                for team in teams:
-                    team_cost = team['cost_per_year'].get(year, 0)
-                    total_cost += team_cost
-                yearly_costs.append({'Year': year, 'Cost': total_cost})
+            with timed_span(rerun_trace, 'summary.gantt_chart'):
+                st.altair_chart(combined_chart, use_container_width=True)
+            chart_payloads['Gantt and pie'] = chart_payload(gantt_pie_df, combined_chart if measure_chart_bytes else None)
+            if len(chart_frames['gantt']) < len(gantt_df):
+                st.caption(f"Showing the {CHART_TOP_TEAMS} highest-cost teams; the other {len(gantt_df) - CHART_TOP_TEAMS:,} teams are grouped by start and end period.")
 
-            yearly_costs_df = pd.DataFrame(yearly_costs)
+            # Cost Summary per period
+            period_title = {'Month': "Monthly", 'Quarter': "Quarterly", 'Year': "Yearly"}[summary_granularity]
+            st.header(f"{period_title} Cost Summary ({reporting_currency})")
+            period_costs_df = summary_frames['period_costs']
 
             # Display the summary table
-            st.subheader("Total Costs per Year")
-            st.table(yearly_costs_df.style.format({'Cost': '${:,.2f}'}))
+            st.subheader(f"Total Costs per {summary_granularity}")
+            with timed_span(rerun_trace, 'summary.period_table'):
+                show_cost_table(period_costs_df, [summary_granularity])
 
-            # Bar chart of yearly costs
-            cost_bar_chart = alt.Chart(yearly_costs_df).mark_bar().encode(
-                x='Year:O',
+            # Bar chart of period costs
+            cost_bar_chart = alt.Chart(period_costs_df).mark_bar().encode(
+                x=f'{summary_granularity}:O',
                 y='Cost:Q',
-                tooltip=['Year', alt.Tooltip('Cost:Q', format=",.2f")]
+                tooltip=[summary_granularity, alt.Tooltip('Cost:Q', format=",.2f")]
             ).properties(
-                title='Total Costs per Year'
+                title=f'Total Costs per {summary_granularity}'
             )
 
-            st.altair_chart(cost_bar_chart, use_container_width=True)
-
-            # Detailed breakdown per team per year
-            st.subheader("Detailed Costs per Team per Year")
-            detailed_data = []
-            for team in teams:
-                team_name = team['team_name'] or f"Team {teams.index(team)+1}"
-                for year, cost in team['cost_per_year'].items():
-                    detailed_data.append({
-                        'Team': team_name,
-                        'Year': year,
-                        'Cost': cost
-                    })
-            detailed_df = pd.DataFrame(detailed_data)
-
-            # Pivot table to show teams as rows and years as columns
-            pivot_df = detailed_df.pivot(index='Team', columns='Year', values='Cost').fillna(0)
-            pivot_df = pivot_df.reset_index()
-            st.table(pivot_df.style.format({col: '${:,.2f}' for col in pivot_df.columns if col != 'Team'}))
-
-            # Stacked bar chart per team per year
-            stacked_bar_chart = alt.Chart(detailed_df).mark_bar().encode(
-                x='Year:O',
+            with timed_span(rerun_trace, 'summary.period_chart'):
+                st.altair_chart(cost_bar_chart, use_container_width=True)
+            chart_payloads['Total costs'] = chart_payload(period_costs_df, cost_bar_chart if measure_chart_bytes else None)
+
+            # Detailed breakdown per team per period
+            st.subheader(f"Detailed Costs per Team per {summary_granularity}")
+
+            # Pivot table to show teams as rows and periods as columns
+            pivot_df = summary_frames['pivot']
+            add_count(rerun_trace, 'pivot_rows', len(pivot_df))
+            with timed_span(rerun_trace, 'summary.pivot_table'):
+                show_cost_table(pivot_df, ['Team'])
+            table_download_buttons(pivot_df, f"team_costs_per_{summary_granularity.lower()}", key='pivot_download')
+
+            # Stacked bar chart per team per period, with the smaller teams folded into one "other" series
+            stacked_bar_chart = alt.Chart(chart_frames['detailed']).mark_bar().encode(
+                x=f'{summary_granularity}:O',
                 y='Cost:Q',
                 color='Team:N',
-                tooltip=['Team', 'Year', alt.Tooltip('Cost:Q', format=",.2f")]
+                tooltip=['Team', summary_granularity, alt.Tooltip('Cost:Q', format=",.2f")]
             ).properties(
-                title='Costs per Team per Year'
+                title=f'Costs per Team per {summary_granularity}'
             )
 
-            st.altair_chart(stacked_bar_chart, use_container_width=True)
-# The rest of your application code (Summary Dashboard, Heatmap, Interactive Dashboard, What-If Analysis) remains unchanged.
+            with timed_span(rerun_trace, 'summary.team_chart'):
+                st.altair_chart(stacked_bar_chart, use_container_width=True)
+            chart_payloads['Costs per team'] = chart_payload(chart_frames['detailed'], stacked_bar_chart if measure_chart_bytes else None)
+            add_count(rerun_trace, 'chart_rows', sum(payload['rows'] for payload in chart_payloads.values()))
+            if measure_chart_bytes:
+                add_count(rerun_trace, 'chart_bytes', sum(payload['bytes'] for payload in chart_payloads.values()))
+
+            # Data rows each chart ships to the browser, and its bytes while tracing
+            with st.expander("Chart Payloads"):
+                payloads_df = pd.DataFrame({
+                    'Chart': list(chart_payloads),
+                    'Data Rows': [payload['rows'] for payload in chart_payloads.values()]
+                })
+                if measure_chart_bytes:
+                    payloads_df['Payload (KB)'] = [payload['bytes'] / 1024 for payload in chart_payloads.values()]
+                    st.table(payloads_df.style.format({'Payload (KB)': '{:,.1f}'}))
+                else:
+                    st.table(payloads_df)
+                    st.caption("Turn on the performance panel to measure payload bytes.")
+    end_span(rerun_trace, summary_span)
 
 # Summary Dashboard with Metrics
 st.header("Summary Dashboard")
 
-if st.session_state.teams:
-    teams = st.session_state.teams  # For convenience
-
-    total_cost_all_teams = sum(team.get('total_team_cost', 0) for team in teams)
-    average_fte_per_team = round(np.mean([sum(role['count'] for role in team.get('team_roles', []) if role.get('count')) for team in teams]), 2)
-    highest_cost_team = max(teams, key=lambda x: x.get('total_team_cost', 0))
-    highest_cost_team_name = highest_cost_team['team_name'] or f"Team {teams.index(highest_cost_team)+1}"
-    highest_cost = highest_cost_team.get('total_team_cost', 0)
-
-    total_fte_all_teams = round(sum([sum(role['count'] for role in team.get('team_roles', []) if role.get('count')) for team in teams]), 2)
-    total_roles = sum([len(team.get('team_roles', [])) for team in teams])
+dashboard_span = begin_span(rerun_trace, 'dashboard')
+store = st.session_state.team_store
+if len(store['teams']):
+    teams = store['teams']  # For convenience
+    roles = store['roles']
+    team_fte = roles.groupby('team_id')['count'].sum().reindex(teams.index, fill_value=0.0)
+
+    # Team totals in the reporting currency; converting re-applies the cached conversion vector
+    team_totals = teams['total_team_cost']
+    if summary_currency is not None:
+        with timed_span(rerun_trace, 'dashboard.convert_costs'):
+            team_totals = pd.Series(
+                converted_month_costs(store, st.session_state.cost_cache, summary_currency)['team_month_costs'].sum(axis=1),
+                index=portfolio_calendar(store, st.session_state.cost_cache)['team_ids']
+            ).reindex(teams.index, fill_value=0.0)
+
+    total_cost_all_teams = team_totals.sum()
+    average_fte_per_team = round(team_fte.mean(), 2)
+    highest_cost_pos = int(np.argmax(team_totals.to_numpy()))
+    highest_cost_team_name = team_display_names(teams)[highest_cost_pos]
+    highest_cost = team_totals.iloc[highest_cost_pos]
+
+    total_fte_all_teams = round(team_fte.sum(), 2)
+    total_roles = len(roles)
 
     # Create columns for metrics
     col1, col2, col3, col4, col5 = st.columns(5)
     with col1:
-        st.metric("Total Cost All Teams", f"${total_cost_all_teams:,.2f}")
+        st.metric("Total Cost All Teams", format_money(total_cost_all_teams))
     with col2:
         st.metric("Average FTE per Team", f"{average_fte_per_team:.2f}")
     with col3:
-        st.metric("Highest Cost Team", f"{highest_cost_team_name} (${highest_cost:,.2f})")
+        st.metric("Highest Cost Team", f"{highest_cost_team_name} ({format_money(highest_cost)})")
     with col4:
         st.metric("Total FTE All Teams", f"{total_fte_all_teams:.2f}")
     with col5:
         st.metric("Total Number of Roles", f"{total_roles}")
+
+    # Cost over any date window, answered from the cumulative daily costs in the cached calendar
+    with timed_span(rerun_trace, 'dashboard.calendar'):
+        cost_calendar = portfolio_calendar(store, st.session_state.cost_cache)
+    if len(cost_calendar['months']):
+        first_day = cost_calendar['months'][0].astype('datetime64[D]').item()
+        last_day = (cost_calendar['months'][-1] + 1).astype('datetime64[D]').item() - timedelta(days=1)
+        cost_window = st.date_input(
+            "Cost window",
+            value=(first_day, last_day),
+            min_value=first_day,
+            max_value=last_day,
+            key='cost_window'
+        )
+
+        # The picker returns a single date while the end of the range is being chosen
+        if len(cost_window) == 2:
+            window_start, window_end = cost_window
+            window_cost = portfolio_window_costs(cost_calendar, [window_start], [window_end])[0]
+            team_window_costs, team_window_active = calendar_period_costs(
+                cost_calendar, np.array([window_start, window_end + timedelta(days=1)], dtype='datetime64[D]')
+            )
+            team_window_costs = team_window_costs[:, 0]
+            if summary_currency is not None:
+                team_window_costs = converted_window_costs(store, st.session_state.cost_cache, summary_currency, window_start, window_end)
+                window_cost = team_window_costs.sum()
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Cost in Window", format_money(window_cost))
+            with col2:
+                st.metric("Teams Active in Window", f"{int(team_window_active.sum()):,}")
+            with col3:
+                st.metric("Share of Total Cost", f"{window_cost / total_cost_all_teams:.1%}" if total_cost_all_teams else "n/a")
+
+            # Highest-cost teams in the window; a partial sort keeps this linear in the number of teams
+            top_positions = np.argpartition(-team_window_costs, min(10, len(team_window_costs)) - 1)[:10]
+            top_positions = top_positions[np.argsort(-team_window_costs[top_positions])]
+            top_positions = top_positions[team_window_costs[top_positions] > 0]
+            window_names = pd.Series(team_display_names(teams), index=teams.index)
+            st.table(pd.DataFrame({
+                'Team': window_names.loc[cost_calendar['team_ids'][top_positions]].to_numpy(),
+                'Cost in Window': [format_money(cost) for cost in team_window_costs[top_positions]]
+            }))
+
+    # Capacity: FTE per month by role from a sweep over the teams' start and end dates, and the peak load
+    st.subheader("Capacity")
+    with timed_span(rerun_trace, 'dashboard.headcount'):
+        headcount_frames = build_headcount_frames(store, st.session_state.cost_cache)
+    fte_totals = headcount_frames['totals']
+    if len(fte_totals):
+        peak_row = fte_totals.loc[fte_totals['Peak FTE'].idxmax()]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Peak Concurrent FTE", f"{peak_row['Peak FTE']:,.2f}")
+        with col2:
+            st.metric("Peak Month", peak_row['Month'])
+        with col3:
+            st.metric("Average Monthly FTE", f"{fte_totals['FTE'].mean():,.2f}")
+
+        # Average FTE per month, stacked by role
+        role_fte_df = headcount_frames['monthly'].groupby(['Month', 'Role'], as_index=False)['FTE'].sum()
+        fte_chart = alt.Chart(role_fte_df).mark_area().encode(
+            x='Month:T',
+            y=alt.Y('FTE:Q', stack='zero'),
+            color='Role:N',
+            tooltip=['Month', 'Role', alt.Tooltip('FTE:Q', format=",.2f")]
+        ).properties(
+            title='FTE per Month by Role'
+        )
+        with timed_span(rerun_trace, 'dashboard.headcount_chart'):
+            st.altair_chart(fte_chart, use_container_width=True)
+        add_count(rerun_trace, 'headcount_rows', len(headcount_frames['monthly']))
+
+        st.caption("Peak concurrent FTE of each role and resource type, and the first month it is reached.")
+        st.dataframe(
+            headcount_frames['peaks'],
+            hide_index=True,
+            column_config={'Peak FTE': st.column_config.NumberColumn(format="%.2f")}
+        )
+        table_download_buttons(headcount_frames['monthly'], 'fte_per_month', 'headcount_download')
+
+    # Cost uncertainty: P10/P50/P90 yearly cost bands from Monte Carlo draws of salaries, FTE counts and end-date slippage
+    st.subheader(f"Cost Uncertainty ({salary_amount_label})")
+    salary_currency_note()
+    with st.form(key='simulation_form'):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            simulation_draws = st.number_input("Draws", min_value=100, max_value=1000000, value=10000, step=1000, key='simulation_draws')
+            simulation_seed = st.number_input("Random seed", min_value=0, value=0, step=1, key='simulation_seed')
+        with col2:
+            salary_sd_pct = st.number_input("Salary std. dev. (%)", min_value=0.0, value=DEFAULT_UNCERTAINTY['salary_sd'] * 100, step=1.0, key='simulation_salary_sd')
+            fte_sd_pct = st.number_input("FTE std. dev. (%)", min_value=0.0, value=DEFAULT_UNCERTAINTY['fte_sd'] * 100, step=1.0, key='simulation_fte_sd')
+        with col3:
+            mean_slip = st.number_input("Mean end-date slippage (months)", min_value=0.0, value=DEFAULT_UNCERTAINTY['mean_slip'], step=0.5, key='simulation_mean_slip')
+            max_slip = st.number_input("Largest slippage (months)", min_value=0, max_value=MAX_SLIP_MONTHS, value=12, step=1, key='simulation_max_slip')
+        simulation_processes = st.number_input("Worker processes", min_value=1, value=os.cpu_count() or 1, step=1, key='simulation_processes')
+        run_cost_simulation = st.form_submit_button("Run Simulation")
+
+    # Bands are kept with the portfolio and settings they were drawn for
+    uncertainty = {'salary_sd': salary_sd_pct / 100, 'fte_sd': fte_sd_pct / 100, 'mean_slip': mean_slip}
+    simulation_key = portfolio_content_hash(
+        store, yearly_salaries, salary_schedule and salary_schedule['key'], uncertainty, int(max_slip), int(simulation_draws), int(simulation_seed)
+    )
+    if run_cost_simulation:
+        simulation_span = begin_span(rerun_trace, 'dashboard.simulation')
+        add_count(rerun_trace, 'simulation_draws', simulation_draws)
+        simulation_base = build_simulation_base(store, yearly_salaries, salary_schedule, int(max_slip))
+        simulation_progress = st.progress(0.0, text="Drawing...")
+        draw_parts = {}
+        completed = 0
+        for start, yearly_draws in run_simulation(simulation_base, int(simulation_draws), uncertainty, int(simulation_seed), int(simulation_processes)):
+            draw_parts[start] = yearly_draws
+            completed += len(yearly_draws)
+            simulation_progress.progress(completed / simulation_draws, text=f"Evaluated {completed:,} of {int(simulation_draws):,} draws...")
+        simulation_progress.empty()
+        st.session_state.cost_bands = {
+            'key': simulation_key,
+            'bands': cost_bands_frame(simulation_base, np.concatenate([draw_parts[start] for start in sorted(draw_parts)]))
+        }
+        end_span(rerun_trace, simulation_span)
+
+    cost_bands = st.session_state.get('cost_bands')
+    if cost_bands is not None and cost_bands['key'] == simulation_key:
+        bands_df = cost_bands['bands']
+        yearly_bands_df = bands_df[bands_df['Year'] != 'Total']
+        bands_chart = alt.Chart(yearly_bands_df).mark_area(opacity=0.3).encode(
+            x='Year:O',
+            y=alt.Y('P10:Q', title=f"Cost ({salary_amount_label})"),
+            y2='P90:Q',
+            tooltip=['Year', alt.Tooltip('P10:Q', format=salary_tooltip_format), alt.Tooltip('P90:Q', format=salary_tooltip_format)]
+        ) + alt.Chart(yearly_bands_df).mark_line(point=True).encode(
+            x='Year:O',
+            y='P50:Q',
+            tooltip=['Year', alt.Tooltip('P50:Q', format=salary_tooltip_format)]
+        ) + alt.Chart(yearly_bands_df).mark_line(strokeDash=[4, 4], color='gray').encode(
+            x='Year:O',
+            y='Base:Q',
+            tooltip=['Year', alt.Tooltip('Base:Q', format=salary_tooltip_format)]
+        )
+        st.altair_chart(bands_chart.properties(title='Yearly Cost P10-P90 Band, P50 and Base'), use_container_width=True)
+        st.dataframe(
+            bands_df,
+            hide_index=True,
+            column_config={col: salary_money_column(col) for col in ['P10', 'P50', 'P90', 'Mean', 'Base']}
+        )
 else:
     st.info("No teams available to display summary metrics.")
+end_span(rerun_trace, dashboard_span)
+
+# Function to parse a comma-separated list of numbers from a text input
+def parse_number_list(text, cast=float):
+    return [cast(value) for value in text.replace(' ', '').split(',') if value]
+
+# What-If Analysis: evaluate a grid of salary, FTE and date perturbations against the current portfolio
+st.header(f"What-If Analysis ({salary_amount_label})")
+salary_currency_note()
+
+salary_targets = {f"{role} (all resource types)": role for role in yearly_salaries}
+salary_targets.update({
+    f"{role} ({resource_type})": (role, resource_type)
+    for role, role_salaries in yearly_salaries.items()
+    for resource_type in role_salaries
+})
+
+with st.form(key='what_if_form'):
+    selected_targets = st.multiselect("Salaries to vary", options=list(salary_targets), key='what_if_targets')
+    col1, col2 = st.columns(2)
+    with col1:
+        salary_multipliers_text = st.text_input("Salary multipliers", value="0.9, 1.0, 1.1", key='what_if_salary_multipliers')
+        fte_scales_text = st.text_input("FTE scaling", value="0.9, 1.0, 1.1", key='what_if_fte_scales')
+    with col2:
+        start_shifts_text = st.text_input("Start date shifts (months)", value="-3, 0, 3", key='what_if_start_shifts')
+        end_shifts_text = st.text_input("End date shifts (months)", value="0, 3, 6", key='what_if_end_shifts')
+    what_if_processes = st.number_input("Worker processes", min_value=1, value=os.cpu_count() or 1, step=1, key='what_if_processes')
+    run_what_if = st.form_submit_button("Run What-If Scenarios")
 
-# The rest of your application code (Heatmap, Interactive Dashboard, What-If Analysis) remains unchanged.
+if run_what_if:
+    store = st.session_state.team_store
+    try:
+        salary_multipliers = parse_number_list(salary_multipliers_text)
+        scenario_grid = build_scenario_grid(
+            {salary_targets[target]: salary_multipliers for target in selected_targets},
+            parse_number_list(fte_scales_text),
+            parse_number_list(start_shifts_text, int),
+            parse_number_list(end_shifts_text, int)
+        )
+    except ValueError as e:
+        st.error(f"Invalid scenario grid: {e}")
+        scenario_grid = None
+
+    what_if_base = build_what_if_base(store, yearly_salaries, salary_schedule)
+    if scenario_grid is not None and not len(what_if_base['team_ids']):
+        st.error("Please define at least one team with roles.")
+    elif scenario_grid is not None:
+        what_if_span = begin_span(rerun_trace, 'what_if')
+        add_count(rerun_trace, 'scenarios', len(scenario_grid))
+        scenario_arrays = build_scenario_arrays(what_if_base, scenario_grid)
+        base_total = base_yearly_costs(scenario_arrays).sum()
+        st.caption(f"Evaluating {len(scenario_grid):,} scenarios for {len(what_if_base['team_ids']):,} teams against a base cost of {format_salary_amount(base_total)}.")
+
+        # Stream completed scenario ranges into the table and chart as they arrive
+        what_if_progress = st.progress(0.0, text="Running scenarios...")
+        what_if_chart = st.empty()
+        what_if_table = st.empty()
+        result_parts = []
+        completed = 0
+        last_render = 0.0
+        for start, yearly_costs in run_what_if_scenarios(scenario_arrays, processes=int(what_if_processes)):
+            result_parts.append(scenario_results_frame(scenario_grid, scenario_arrays, start, yearly_costs, base_total))
+            completed += len(yearly_costs)
+            what_if_progress.progress(completed / len(scenario_grid), text=f"Evaluated {completed:,} of {len(scenario_grid):,} scenarios...")
+
+            # Redraw at most twice a second, and once at the end
+            if time.perf_counter() - last_render < 0.5 and completed < len(scenario_grid):
+                continue
+            last_render = time.perf_counter()
+            results_df = pd.concat(result_parts, ignore_index=True).sort_values('Total Cost')
+
+            # Yearly cost range across the scenarios so far, against the base portfolio
+            year_columns = [str(year) for year in scenario_arrays['years'] + 1970]
+            envelope_df = pd.DataFrame({
+                'Year': year_columns,
+                'Lowest': results_df[year_columns].min().to_numpy(),
+                'Highest': results_df[year_columns].max().to_numpy(),
+                'Base': base_yearly_costs(scenario_arrays)
+            })
+            envelope_chart = alt.Chart(envelope_df).mark_area(opacity=0.3).encode(
+                x='Year:O',
+                y=alt.Y('Lowest:Q', title=f"Cost ({salary_amount_label})"),
+                y2='Highest:Q',
+                tooltip=['Year', alt.Tooltip('Lowest:Q', format=salary_tooltip_format), alt.Tooltip('Highest:Q', format=salary_tooltip_format)]
+            ) + alt.Chart(envelope_df).mark_line(point=True).encode(
+                x='Year:O',
+                y='Base:Q',
+                tooltip=['Year', alt.Tooltip('Base:Q', format=salary_tooltip_format)]
+            )
+            what_if_chart.altair_chart(
+                envelope_chart.properties(title='Yearly Cost Range across Scenarios vs Base'),
+                use_container_width=True
+            )
+            what_if_table.dataframe(
+                results_df,
+                hide_index=True,
+                column_config={
+                    col: salary_money_column(col)
+                    for col in ['Total Cost', 'Change vs Base'] + year_columns
+                } | {'Change %': st.column_config.NumberColumn(format="%+.2f%%")}
+            )
+        what_if_progress.empty()
+        end_span(rerun_trace, what_if_span)
+
+# Budget Fit: trim the portfolio to yearly budget caps by delaying teams and cutting FTE, lowest priority first
+st.header(f"Budget Fit ({salary_amount_label})")
+salary_currency_note()
+
+store = st.session_state.team_store
+budget_fit_result = st.session_state.pop('budget_fit_result', None)
+if budget_fit_result:
+    st.success(budget_fit_result)
+if len(store['teams']):
+    # The cost cache was brought up to date after the editor
+    yearly_totals = st.session_state.cost_cache['yearly_totals']
+    team_fte = store['roles'].groupby('team_id')['count'].sum().reindex(store['teams'].index, fill_value=0.0)
+    with st.form(key='budget_fit_form'):
+        st.caption("Years left blank are not capped. Teams with a higher priority are delayed and cut last.")
+        budget_caps_df = st.data_editor(
+            pd.DataFrame({'Budget Cap': yearly_totals.round(-3).to_numpy()}, index=pd.Index(yearly_totals.index.astype(str), name='Year')),
+            key='budget_caps_editor',
+            column_config={'Budget Cap': salary_money_column("Budget Cap", decimals=0, min_value=0.0, step=1000.0)}
+        )
+        budget_teams_df = st.data_editor(
+            pd.DataFrame({
+                'Team': team_display_names(store['teams']),
+                'FTE': team_fte.to_numpy(),
+                'Priority': 0,
+                'Min FTE': 0.0,
+                'Max FTE': team_fte.to_numpy()
+            }, index=store['teams'].index),
+            key='budget_teams_editor',
+            hide_index=True,
+            disabled=['Team', 'FTE'],
+            column_config={
+                'FTE': st.column_config.NumberColumn("FTE", format="%.1f"),
+                'Priority': st.column_config.NumberColumn("Priority", step=1, format="%d"),
+                'Min FTE': st.column_config.NumberColumn("Min FTE", min_value=0.0, step=0.5, format="%.1f"),
+                'Max FTE': st.column_config.NumberColumn("Max FTE", min_value=0.0, step=0.5, format="%.1f")
+            }
+        )
+        add_count(rerun_trace, 'budget_editor_rows', len(budget_teams_df))
+        col1, col2 = st.columns(2)
+        with col1:
+            budget_max_delay = st.number_input("Latest start delay (months)", min_value=0, max_value=MAX_DELAY_MONTHS, value=0, step=1, key='budget_max_delay')
+        with col2:
+            budget_fte_step = st.number_input("FTE step", min_value=0.1, value=0.5, step=0.1, format="%.1f", key='budget_fte_step')
+        run_budget_fit = st.form_submit_button("Fit to Budget")
+
+    # The plan is kept with the portfolio it was solved for, and can only be applied while that is unchanged
+    budget_plan_key = portfolio_content_hash(store, yearly_salaries, salary_schedule and salary_schedule['key'])
+    if run_budget_fit:
+        with timed_span(rerun_trace, 'budget_fit'):
+            try:
+                budget_base = build_optimizer_base(store, yearly_salaries, salary_schedule, int(budget_max_delay))
+                team_limits = budget_teams_df.reindex(budget_base['team_ids'])
+                budget_plan = solve_budget_plan(
+                    budget_base,
+                    budget_caps_df['Budget Cap'].to_dict(),
+                    team_limits['Priority'].to_numpy(dtype=np.float64),
+                    team_limits['Min FTE'].to_numpy(dtype=np.float64),
+                    team_limits['Max FTE'].to_numpy(dtype=np.float64),
+                    float(budget_fte_step)
+                )
+                st.session_state.budget_plan = {'key': budget_plan_key, 'base': budget_base, 'plan': budget_plan}
+            except ValueError as e:
+                st.error(f"Cannot fit the budget: {e}")
+
+    budget_fit = st.session_state.get('budget_plan')
+    if budget_fit is not None and budget_fit['key'] == budget_plan_key:
+        budget_base, budget_plan = budget_fit['base'], budget_fit['plan']
+        plan_frames = budget_plan_frames(budget_base, budget_plan)
+        if budget_plan['feasible']:
+            st.info("The plan meets every budget cap.")
+        else:
+            over_years = plan_frames['years'].loc[plan_frames['years']['Over Cap'] > 0, 'Year']
+            st.warning(f"No plan within the FTE minimums meets the caps for {', '.join(over_years)}; this is the closest found.")
+
+        # Planned costs per year against the caps
+        years_df = plan_frames['years']
+        budget_chart = alt.Chart(years_df).mark_bar(opacity=0.4).encode(
+            x='Year:O',
+            y=alt.Y('Cost:Q', title=f"Cost ({salary_amount_label})"),
+            tooltip=['Year', alt.Tooltip('Cost:Q', format=salary_tooltip_format)]
+        ) + alt.Chart(years_df).mark_bar().encode(
+            x='Year:O',
+            y='Planned Cost:Q',
+            tooltip=['Year', alt.Tooltip('Planned Cost:Q', format=salary_tooltip_format)]
+        ) + alt.Chart(years_df).mark_tick(color='red', thickness=2).encode(
+            x='Year:O',
+            y='Budget Cap:Q',
+            tooltip=['Year', alt.Tooltip('Budget Cap:Q', format=salary_tooltip_format)]
+        )
+        st.altair_chart(budget_chart.properties(title='Yearly Cost: Current, Planned and Cap'), use_container_width=True)
+        st.dataframe(
+            years_df,
+            hide_index=True,
+            column_config={col: salary_money_column(col) for col in ['Budget Cap', 'Cost', 'Planned Cost', 'Over Cap']}
+        )
+
+        # Only the teams the plan changes
+        changed_df = plan_frames['teams']
+        changed_df = changed_df[(changed_df['Planned FTE'] != changed_df['FTE']) | (changed_df['Delay (months)'] != 0)]
+        st.caption(f"The plan changes {len(changed_df):,} of {len(plan_frames['teams']):,} teams.")
+        st.dataframe(
+            changed_df,
+            hide_index=True,
+            column_config={
+                'team_id': st.column_config.NumberColumn("Team ID", format="%d"),
+                'FTE': st.column_config.NumberColumn(format="%.1f"),
+                'Planned FTE': st.column_config.NumberColumn(format="%.1f"),
+                'Cost': salary_money_column('Cost'),
+                'Planned Cost': salary_money_column('Planned Cost')
+            }
+        )
+        table_download_buttons(plan_frames['teams'], 'budget_plan', 'budget_plan_download')
+
+        if len(changed_df) and st.button("Apply Plan", key='apply_budget_plan'):
+            changed_ids = apply_budget_plan(store, budget_base, budget_plan)
+
+            # Editor widgets of the changed teams would otherwise keep their old dates and FTE counts
+            clear_team_widgets(changed_ids)
+            mark_teams_dirty(changed_ids)
+            save_teams_to_storage()
+            del st.session_state.budget_plan
+            st.session_state.budget_fit_result = f"Applied the budget plan to {len(changed_ids):,} teams."
+            log_rerun_trace()
+            st.rerun()
+else:
+    st.info("No teams available to fit to a budget.")
+
+# Snapshots: save the portfolio and salaries under a name, and compare any two saved snapshots
+st.header(f"Snapshots ({salary_amount_label})")
+salary_currency_note()
+
+# Snapshots live in the shared store when there is one, and otherwise in a private in-memory store of the session
+if shared_store is not None:
+    snapshot_store = shared_store
+elif 'snapshot_store' in st.session_state:
+    snapshot_store = st.session_state.snapshot_store
+else:
+    snapshot_store = st.session_state.snapshot_store = create_snapshot_tables(open_shared_store(':memory:', pool_size=1))
+if shared_store is None:
+    st.caption("Snapshots are kept for this browser session only and are lost when the page is reloaded. Set "
+               "TEAM_COST_SHARED_STORE to a database file to keep them.")
+
+store = st.session_state.team_store
+snapshot_result = st.session_state.pop('snapshot_result', None)
+if snapshot_result:
+    st.success(snapshot_result)
+with st.form(key='snapshot_form'):
+    snapshot_name = st.text_input("Snapshot name", value=f"Plan {date.today().isoformat()}", key='snapshot_name')
+    take_snapshot = st.form_submit_button("Save Snapshot")
+if take_snapshot:
+    with timed_span(rerun_trace, 'snapshots.save'):
+        saved_snapshot = save_snapshot(snapshot_store, store, yearly_salaries, snapshot_name.strip() or "Unnamed")
+    st.session_state.snapshot_result = (
+        f"Saved snapshot {saved_snapshot['snapshot_id']} with {len(store['teams']):,} teams; "
+        f"{saved_snapshot['new_blobs']:,} of them were new or changed."
+    )
+
+    # Compare the new snapshot with the one before it
+    for selection_key in ('snapshot_old', 'snapshot_new'):
+        st.session_state.pop(selection_key, None)
+    log_rerun_trace()
+    st.rerun()
+
+snapshots_df = list_snapshots(snapshot_store)
+if len(snapshots_df):
+    st.dataframe(
+        snapshots_df,
+        hide_index=True,
+        column_config={
+            'snapshot_id': st.column_config.NumberColumn("Snapshot", format="%d"),
+            'name': "Name",
+            'created_at': st.column_config.DatetimeColumn("Saved (UTC)"),
+            'team_count': st.column_config.NumberColumn("Teams", format="%d"),
+            'new_blobs': st.column_config.NumberColumn("New or Changed Teams", format="%d")
+        }
+    )
+    snapshot_labels = dict(zip(snapshots_df['snapshot_id'], snapshots_df['snapshot_id'].astype(str) + ": " + snapshots_df['name']))
+    col1, col2, col3 = st.columns([3, 3, 1])
+    with col1:
+        old_snapshot = st.selectbox("Compare", options=list(snapshot_labels), index=min(1, len(snapshot_labels) - 1), format_func=snapshot_labels.get, key='snapshot_old')
+    with col2:
+        new_snapshot = st.selectbox("With", options=list(snapshot_labels), index=0, format_func=snapshot_labels.get, key='snapshot_new')
+    with col3:
+        if st.button("Delete Compared", key='delete_snapshot', help="Deletes the snapshot selected under Compare."):
+            removed_blobs = delete_snapshot(snapshot_store, old_snapshot)
+            st.session_state.snapshot_result = f"Deleted snapshot {old_snapshot} and {removed_blobs:,} teams no other snapshot holds."
+            log_rerun_trace()
+            st.rerun()
+
+    # Snapshots never change, so a diff is kept until another pair is compared
+    snapshot_diff = st.session_state.get('snapshot_diff')
+    if snapshot_diff is None or snapshot_diff['key'] != (old_snapshot, new_snapshot):
+        with timed_span(rerun_trace, 'snapshots.diff'):
+            snapshot_diff = st.session_state.snapshot_diff = {'key': (old_snapshot, new_snapshot), 'diff': diff_snapshots(snapshot_store, old_snapshot, new_snapshot)}
+    diff = snapshot_diff['diff']
+    add_count(rerun_trace, 'snapshot_diff_teams', len(diff['teams']))
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Teams Added", f"{diff['counts']['Added']:,}")
+    col2.metric("Teams Removed", f"{diff['counts']['Removed']:,}")
+    col3.metric("Teams Changed", f"{diff['counts']['Changed']:,}")
+    col4.metric("Cost Changes Only", f"{diff['counts']['Cost Only']:,}")
+    col5.metric(f"Total Cost Delta ({salary_amount_label})", format_salary_amount(diff['years']['Delta'].sum()))
+
+    years_long = diff['years'].melt(id_vars='Year', value_vars=['Before', 'After'], var_name='Snapshot', value_name='Cost')
+    snapshot_chart = alt.Chart(years_long).mark_bar().encode(
+        x=alt.X('Year:N', title='Year'),
+        xOffset='Snapshot:N',
+        y=alt.Y('Cost:Q', title=f"Cost ({salary_amount_label})"),
+        color=alt.Color('Snapshot:N', sort=['Before', 'After']),
+        tooltip=['Year', 'Snapshot', alt.Tooltip('Cost:Q', format=salary_tooltip_format)]
+    )
+    st.altair_chart(snapshot_chart.properties(title=f"Yearly Cost: {diff['old_name']} and {diff['new_name']}"), use_container_width=True)
+    st.dataframe(
+        diff['years'],
+        hide_index=True,
+        column_config={col: salary_money_column(col) for col in ['Before', 'After', 'Delta']}
+    )
+
+    if len(diff['teams']):
+        st.subheader("Team Changes")
+        st.dataframe(
+            diff['teams'],
+            hide_index=True,
+            column_config={
+                'team_id': st.column_config.NumberColumn("Team ID", format="%d"),
+                **{col: salary_money_column(col) for col in ['Cost Before', 'Cost After', 'Cost Delta']}
+            }
+        )
+        table_download_buttons(diff['teams'], 'snapshot_team_changes', 'snapshot_teams_download')
+    if len(diff['roles']):
+        st.subheader("Role Changes")
+        st.dataframe(
+            diff['roles'].rename(columns={'role': 'Role', 'resource_type': 'Resource Type'}),
+            hide_index=True,
+            column_config={
+                'team_id': st.column_config.NumberColumn("Team ID", format="%d"),
+                'FTE Before': st.column_config.NumberColumn(format="%.1f"),
+                'FTE After': st.column_config.NumberColumn(format="%.1f")
+            }
+        )
+    if len(diff['salaries']):
+        st.subheader("Salary Changes")
+        st.dataframe(diff['salaries'], hide_index=True, column_config={col: salary_money_column(col, decimals=0) for col in ['Before', 'After']})
+else:
+    st.info("No snapshots saved yet.")
+
+# Finish this rerun's trace; the panel shows every section above it, and the log gets one line per rerun
+rerun_record = log_rerun_trace()
+if show_timing_panel:
+    with st.sidebar:
+        st.header("Performance")
+        st.caption(f"Rerun {rerun_record['rerun']} took {rerun_record['total_ms']:,.1f} ms" + (f"; logging to {trace_log_path()}" if trace_log_path() else "."))
+        st.dataframe(
+            pd.DataFrame(span_totals(rerun_record), columns=['Section', 'Calls', 'ms', 'Share']),
+            hide_index=True,
+            column_config={
+                'ms': st.column_config.NumberColumn("ms", format="%.1f"),
+                'Share': st.column_config.ProgressColumn("Share", min_value=0.0, max_value=1.0, format="percent")
+            }
+        )
+        st.dataframe(
+            pd.DataFrame({'Count': list(rerun_record['counts']), 'Value': list(rerun_record['counts'].values())}),
+            hide_index=True
+        )
@@ -0,0 +1,189 @@
+# optimizer.py
+
+# Budget fitting for team portfolios: trims a portfolio to per-year budget caps by delaying teams and scaling
+# their FTE within per-team bounds, lowest priority first.
+# Costs for every allowed delay come from the vectorized cost engine in one pass each; the solver is a greedy
+# heuristic over those team x year cost matrices, so a plan for thousands of teams takes well under a second.
+
+# Import necessary libraries
+import numpy as np
+import pandas as pd
+from team_cost_model import (
+    YEAR_OPTIONS,
+    build_cost_inputs,
+    calculate_portfolio_costs,
+    costable_team_ids,
+    team_display_names
+)
+
+# Largest start date delay the optimizer considers, in months
+MAX_DELAY_MONTHS = 24
+
+# Function to build the optimizer's base arrays: each team's FTE and its yearly costs for every delay of 0 to
+# max_delay months, on one year axis. Delays that would move a team's end past the last plannable year are not allowed
+def build_optimizer_base(store, salaries, schedule=None, max_delay=0):
+    if not 0 <= max_delay <= MAX_DELAY_MONTHS:
+        raise ValueError(f"The delay must be between 0 and {MAX_DELAY_MONTHS} months.")
+    team_ids = costable_team_ids(store)
+    cost_inputs = build_cost_inputs(store, team_ids, salaries, schedule)
+    start_months = cost_inputs['start_dates'].astype('datetime64[M]')
+    end_months = cost_inputs['end_dates'].astype('datetime64[M]')
+
+    # One year axis covers every delay, so shifted costs line up with the unshifted ones
+    delays = np.arange(max_delay + 1)
+    if len(team_ids):
+        years = np.arange(start_months.min().astype('datetime64[Y]'), (end_months.max() + max_delay).astype('datetime64[Y]') + 1)
+    else:
+        years = np.array([], dtype='datetime64[Y]')
+    delay_costs = np.zeros((len(delays), len(team_ids), len(years)))
+    for delay in delays:
+        costs = calculate_portfolio_costs(
+            cost_inputs['role_team_index'],
+            cost_inputs['role_counts'],
+            cost_inputs['role_rates'],
+            (start_months + delay).astype('datetime64[D]'),
+            (end_months + delay).astype('datetime64[D]'),
+            cost_inputs['rate_months']
+        )
+        first = int(costs['years'][0]) - (int(years[0].astype(np.int64)) + 1970) if len(costs['years']) else 0
+        delay_costs[delay, :, first:first + len(costs['years'])] = costs['cost_matrix']
+
+    last_month = np.datetime64(f"{YEAR_OPTIONS[-1]}-12")
+    return {
+        'team_ids': team_ids,
+        'names': np.asarray(pd.Series(team_display_names(store['teams']), index=store['teams'].index).loc[team_ids], dtype=object),
+        'fte': np.bincount(cost_inputs['role_team_index'], weights=cost_inputs['role_counts'], minlength=len(team_ids)),
+        'years': years.astype(np.int64) + 1970,
+        'delay_costs': delay_costs,
+        'allowed_delays': end_months[None, :] + delays[:, None] <= last_month
+    }
+
+# Function to turn per-year budget caps into a cap per year of the base's axis; years without a cap are unlimited
+def year_caps(base, budget_caps):
+    caps = np.full(len(base['years']), np.inf)
+    for year, cap in budget_caps.items():
+        if cap is None or pd.isna(cap):
+            continue
+        if cap < 0:
+            raise ValueError(f"The {year} budget cap must not be negative.")
+        caps[base['years'] == int(year)] = float(cap)
+    return caps
+
+# Function to fit the portfolio to per-year budget caps. Teams are visited lowest priority first (largest cost first
+# within a priority): first each is delayed by whichever allowed delay most reduces the total overage, then FTE is
+# cut to what clears the overage in its years, in steps of fte_step and never below its minimum. A last pass in
+# reverse order gives back FTE that still fits. Returns each team's delay and FTE, and whether every cap is met
+def solve_budget_plan(base, budget_caps, priorities=None, min_fte=None, max_fte=None, fte_step=0.5):
+    num_teams = len(base['team_ids'])
+    caps = year_caps(base, budget_caps)
+    fte = base['fte']
+    priorities = np.zeros(num_teams) if priorities is None else np.nan_to_num(np.asarray(priorities, dtype=np.float64))
+    min_fte = np.zeros(num_teams) if min_fte is None else np.nan_to_num(np.asarray(min_fte, dtype=np.float64))
+    max_fte = fte.copy() if max_fte is None else np.where(np.isnan(max_fte), fte, np.asarray(max_fte, dtype=np.float64))
+    if (min_fte > max_fte).any():
+        raise ValueError("A team's minimum FTE is above its maximum.")
+
+    # Costs per FTE at every delay; a team's cost is linear in its FTE
+    unit_costs = np.divide(base['delay_costs'], fte[None, :, None], out=np.zeros_like(base['delay_costs']), where=fte[None, :, None] > 0)
+    delays = np.zeros(num_teams, dtype=np.int64)
+    planned_fte = np.clip(fte, min_fte, max_fte)
+    team_costs = unit_costs[0] * planned_fte[:, None]
+    totals = team_costs.sum(axis=0)
+    order = np.lexsort((-base['delay_costs'][0].sum(axis=1), priorities))
+
+    # Delays: try every allowed delay for the team against the totals of all other teams
+    if len(unit_costs) > 1:
+        for team in order:
+            overage = np.clip(totals - caps, 0, None).sum()
+            if overage <= 0:
+                break
+            candidates = totals[None, :] - team_costs[team][None, :] + unit_costs[:, team] * planned_fte[team]
+            candidate_overage = np.where(base['allowed_delays'][:, team], np.clip(candidates - caps, 0, None).sum(axis=1), np.inf)
+            best = int(np.argmin(candidate_overage))
+            if candidate_overage[best] < overage:
+                delays[team] = best
+                totals = candidates[best]
+                team_costs[team] = unit_costs[best, team] * planned_fte[team]
+
+    # FTE cuts: enough FTE to clear the largest overage among the years the team is costed in
+    for team in order:
+        over = totals - caps
+        if (over <= 1e-6).all():
+            break
+        unit = unit_costs[delays[team], team]
+        binding = (over > 1e-6) & (unit > 0)
+        if not binding.any():
+            continue
+        target = max(planned_fte[team] - (over[binding] / unit[binding]).max(), min_fte[team])
+        target = max(np.floor(target / fte_step + 1e-9) * fte_step, min_fte[team])
+        if target < planned_fte[team]:
+            planned_fte[team] = target
+            totals = totals - team_costs[team] + unit * target
+            team_costs[team] = unit * target
+
+    # Give-back: raise FTE again, highest priority first, wherever every year still has room
+    for team in order[::-1]:
+        unit = unit_costs[delays[team], team]
+        room = planned_fte[team] < max_fte[team]
+        charged = unit > 0
+        if not room or not charged.any():
+            continue
+        headroom = ((caps[charged] - totals[charged]) / unit[charged]).min()
+        target = min(planned_fte[team] + np.floor(max(headroom, 0.0) / fte_step + 1e-9) * fte_step, max_fte[team])
+        if target > planned_fte[team]:
+            planned_fte[team] = target
+            totals = totals - team_costs[team] + unit * target
+            team_costs[team] = unit * target
+
+    over = np.clip(totals - caps, 0, None)
+    return {
+        'delays': delays,
+        'fte': planned_fte,
+        'team_costs': team_costs,
+        'totals': totals,
+        'caps': caps,
+        'overage': over,
+        'feasible': bool((over <= 1e-6).all())
+    }
+
+# Function to build the plan frames: one row per team with its FTE, delay and costs before and after, and one
+# row per year with its cap, base cost and planned cost
+def budget_plan_frames(base, plan):
+    base_costs = base['delay_costs'][0]
+    teams_df = pd.DataFrame({
+        'team_id': base['team_ids'],
+        'Team': base['names'],
+        'FTE': base['fte'],
+        'Planned FTE': plan['fte'],
+        'Delay (months)': plan['delays'],
+        'Cost': base_costs.sum(axis=1),
+        'Planned Cost': plan['team_costs'].sum(axis=1)
+    })
+    years_df = pd.DataFrame({
+        'Year': base['years'].astype(str),
+        'Budget Cap': np.where(np.isinf(plan['caps']), np.nan, plan['caps']),
+        'Cost': base_costs.sum(axis=0),
+        'Planned Cost': plan['totals'],
+        'Over Cap': plan['overage']
+    })
+    return {'teams': teams_df, 'years': years_df}
+
+# Function to apply a plan to the team store: role FTE counts are scaled to each team's planned FTE and team dates
+# are moved by its delay. Returns the ids of the teams that changed
+def apply_budget_plan(store, base, plan):
+    teams = store['teams']
+    roles = store['roles']
+    scales = np.divide(plan['fte'], base['fte'], out=np.ones_like(plan['fte']), where=base['fte'] > 0)
+    changed = (scales != 1.0) | (plan['delays'] != 0)
+    team_ids = base['team_ids'][changed]
+
+    role_scales = pd.Series(scales[changed], index=team_ids).reindex(roles['team_id']).to_numpy()
+    scaled = ~np.isnan(role_scales)
+    roles.loc[scaled, 'count'] = roles.loc[scaled, 'count'].to_numpy() * role_scales[scaled]
+
+    delays = plan['delays'][changed]
+    for prefix in ('start', 'end'):
+        months = (teams.loc[team_ids, f'{prefix}_year'].to_numpy() * 12 + teams.loc[team_ids, f'{prefix}_month'].to_numpy() - 1) + delays
+        teams.loc[team_ids, f'{prefix}_year'] = (months // 12).astype(teams[f'{prefix}_year'].dtype)
+        teams.loc[team_ids, f'{prefix}_month'] = (months % 12 + 1).astype(teams[f'{prefix}_month'].dtype)
+    return team_ids
@@ -0,0 +1,322 @@
+# shared_store.py
+
+# Server-side shared portfolio store: teams, roles and salaries in one SQLite database in WAL mode, so every
+# session on a server (and every server on the same file) edits one portfolio. Each team row carries a version; a
+# session writes a team only if it still has the version the session last saw, and otherwise keeps the other
+# user's team. Every committed change is appended to a change log whose sequence numbers are the versions, and
+# sessions poll it to pick up other users' edits.
+
+# Import necessary libraries
+import json
+import os
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from team_cost_model import ROLE_COLUMNS, TEAM_COLUMNS, create_team_store
+
+# Environment variable naming the shared store's database file; unset keeps every session's teams to itself
+SHARED_STORE_ENV = 'TEAM_COST_SHARED_STORE'
+
+# Connections held open per database, and how often sessions check the change log
+SHARED_STORE_POOL_SIZE = 4
+SHARED_POLL_SECONDS = 5
+
+# Team columns kept in the shared store; costs are derived and stay in each session
+SHARED_TEAM_COLUMNS = ['team_name', 'team_description', 'start_year', 'start_month', 'end_year', 'end_month', 'duration_weeks']
+
+SHARED_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS teams (
+    team_id INTEGER PRIMARY KEY,
+    team_name TEXT NOT NULL,
+    team_description TEXT NOT NULL,
+    start_year INTEGER NOT NULL,
+    start_month INTEGER NOT NULL,
+    end_year INTEGER NOT NULL,
+    end_month INTEGER NOT NULL,
+    duration_weeks REAL NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS roles (
+    team_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    role TEXT,
+    resource_type TEXT,
+    count REAL NOT NULL,
+    PRIMARY KEY (team_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS salaries (
+    role TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    salary REAL NOT NULL,
+    PRIMARY KEY (role, resource_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    team_id INTEGER,
+    kind TEXT NOT NULL,
+    session_id TEXT,
+    changed_at REAL NOT NULL
+);
+"""
+
+# Function to get the shared store path configured for this process, or None when sessions keep their own teams
+def shared_store_path():
+    return os.environ.get(SHARED_STORE_ENV) or None
+
+# Function to open a shared store: a pool of connections to the database in WAL mode, with the schema in place
+def open_shared_store(path, pool_size=SHARED_STORE_POOL_SIZE):
+    pool = queue.Queue()
+    for _ in range(pool_size):
+        # Transactions are explicit; connections move between the server's session threads through the pool
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        pool.put(connection)
+    shared = {'path': path, 'pool': pool}
+    with shared_connection(shared) as connection:
+        connection.executescript(SHARED_STORE_SCHEMA)
+    return shared
+
+# Function to borrow a pooled connection for the duration of a block
+@contextmanager
+def shared_connection(shared):
+    connection = shared['pool'].get()
+    try:
+        yield connection
+    finally:
+        shared['pool'].put(connection)
+
+# Function to run a block in one transaction on a pooled connection; writers take the write lock up front
+@contextmanager
+def shared_transaction(shared, write=False):
+    with shared_connection(shared) as connection:
+        connection.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+# Function to append an entry to the change log, returning its sequence number
+def log_change(connection, team_id, kind, session_id):
+    cursor = connection.execute(
+        'INSERT INTO changes (team_id, kind, session_id, changed_at) VALUES (?, ?, ?, ?)',
+        (team_id, kind, session_id, time.time())
+    )
+    return cursor.lastrowid
+
+# Function to get the latest change log sequence number written by any other session
+def shared_store_version(shared, session_id=None):
+    with shared_connection(shared) as connection:
+        row = connection.execute(
+            'SELECT MAX(seq) FROM changes WHERE session_id IS NOT ?', (session_id,)
+        ).fetchone()
+    return row[0] or 0
+
+# Function to read teams and their roles, all of them or the given team_ids, as team store tables plus versions
+def read_shared_teams(connection, team_ids=None):
+    team_filter = '' if team_ids is None else 'WHERE team_id IN (SELECT value FROM json_each(?))'
+    params = () if team_ids is None else (json.dumps([int(team_id) for team_id in team_ids]),)
+    teams = pd.read_sql_query(
+        f"SELECT team_id, {', '.join(SHARED_TEAM_COLUMNS)}, version FROM teams {team_filter} ORDER BY team_id",
+        connection, params=params, index_col='team_id'
+    )
+    roles = pd.read_sql_query(
+        f"SELECT team_id, role, resource_type, count FROM roles {team_filter} ORDER BY team_id, position",
+        connection, params=params
+    )
+    versions = teams.pop('version').astype('int64')
+    teams['total_team_cost'] = 0.0
+    teams = teams.reindex(columns=list(TEAM_COLUMNS)).astype(TEAM_COLUMNS)
+    teams.index = teams.index.astype('int64')
+    roles['role_cost'] = np.nan
+    roles = roles.astype(ROLE_COLUMNS)
+    roles.index.name = 'role_id'
+    return teams, roles, versions
+
+# Function to fingerprint each team's stored content: its shared columns and its roles in order
+def team_content_hashes(store):
+    teams = store['teams']
+    roles = store['roles']
+    team_hashes = pd.util.hash_pandas_object(teams[SHARED_TEAM_COLUMNS], index=True).to_numpy()
+    role_hashes = pd.util.hash_pandas_object(pd.DataFrame({
+        'team_id': roles['team_id'],
+        'position': roles.groupby('team_id').cumcount(),
+        'role': roles['role'],
+        'resource_type': roles['resource_type'],
+        'count': roles['count']
+    }), index=False).to_numpy()
+
+    # Combine role hashes per team; uint64 addition wraps around
+    hashes = team_hashes.copy()
+    positions = teams.index.get_indexer(roles['team_id'])
+    np.add.at(hashes, positions[positions >= 0], role_hashes[positions >= 0])
+    return pd.Series(hashes, index=teams.index)
+
+# Function to load the whole shared portfolio into a team store, with the sync state the session edits it from:
+# each team's version, its content hash and the change log position
+def load_shared_portfolio(shared):
+    with shared_transaction(shared) as connection:
+        teams, roles, versions = read_shared_teams(connection)
+        seq = connection.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+    store = create_team_store()
+    store['teams'] = teams
+    store['roles'] = roles.set_axis(pd.RangeIndex(len(roles), name='role_id'))
+    store['costs'] = store['costs'].reindex(teams.index)
+    return store, {'versions': versions, 'hashes': team_content_hashes(store), 'seq': seq}
+
+# Function to replace the given teams in a session's team store with rows read from the shared store, in place;
+# teams missing from the rows are removed. Teams keep their position, new ones are appended
+def replace_store_teams(store, team_ids, teams, roles):
+    team_ids = pd.Index(team_ids, dtype='int64')
+    kept = store['teams'].drop(index=team_ids.difference(teams.index), errors='ignore')
+    existing = teams.index.intersection(kept.index)
+    kept.loc[existing, SHARED_TEAM_COLUMNS] = teams.loc[existing, SHARED_TEAM_COLUMNS]
+    store['teams'] = pd.concat([kept, teams.loc[teams.index.difference(kept.index)]]).astype(TEAM_COLUMNS)
+
+    # Replaced teams' roles get fresh role_ids after the session's own
+    other_roles = store['roles'][~store['roles']['team_id'].isin(team_ids)]
+    next_role_id = int(store['roles'].index.max()) + 1 if len(store['roles']) else 0
+    new_roles = roles.set_axis(pd.RangeIndex(next_role_id, next_role_id + len(roles), name='role_id'))
+    store['roles'] = pd.concat([other_roles, new_roles]).astype(ROLE_COLUMNS)
+    store['costs'] = store['costs'].reindex(store['teams'].index)
+
+# Function to renumber teams in a session's team store, e.g. after their ids were taken by another session
+def rename_store_teams(store, renamed):
+    store['teams'] = store['teams'].rename(index=renamed)
+    store['roles']['team_id'] = store['roles']['team_id'].replace(renamed).astype('int64')
+    store['costs'] = store['costs'].rename(index=renamed)
+
+# Function to write the session's changed, new and deleted teams to the shared store in one transaction. A team is
+# written only if the shared store still has the version the session last saw; otherwise it is a conflict, the other
+# user's team is kept and reloaded into the session. New teams whose id was taken meanwhile get the next free id.
+# Updates the sync state and returns the written, deleted, conflicting and renamed team ids
+def push_shared_changes(shared, store, sync, session_id):
+    hashes = team_content_hashes(store)
+    known = sync['hashes'].reindex(hashes.index)
+    changed_ids = hashes.index[known.isna().to_numpy() | (known.to_numpy() != hashes.to_numpy())]
+    deleted_ids = sync['versions'].index.difference(store['teams'].index)
+    result = {'saved': [], 'deleted': [], 'conflicts': [], 'renamed': {}}
+    if not len(changed_ids) and not len(deleted_ids):
+        return result
+
+    teams = store['teams']
+    roles = store['roles']
+    role_groups = roles.groupby('team_id', sort=False).indices
+    with shared_transaction(shared, write=True) as connection:
+        current = dict(connection.execute(
+            'SELECT team_id, version FROM teams WHERE team_id IN (SELECT value FROM json_each(?))',
+            (json.dumps([int(team_id) for team_id in changed_ids.union(deleted_ids)]),)
+        ).fetchall())
+        next_team_id = connection.execute('SELECT COALESCE(MAX(team_id), -1) + 1 FROM teams').fetchone()[0]
+        next_team_id = max(next_team_id, int(teams.index.max()) + 1 if len(teams) else 0)
+
+        for team_id in changed_ids:
+            base_version = sync['versions'].get(team_id)
+            shared_id = int(team_id)
+            if base_version is None and shared_id in current:
+                shared_id = next_team_id
+                next_team_id += 1
+                result['renamed'][int(team_id)] = shared_id
+            elif base_version is not None and current.get(shared_id) != base_version:
+                result['conflicts'].append(int(team_id))
+                continue
+
+            version = log_change(connection, shared_id, 'save', session_id)
+            row = teams.loc[team_id, SHARED_TEAM_COLUMNS]
+            connection.execute(
+                f"INSERT OR REPLACE INTO teams (team_id, {', '.join(SHARED_TEAM_COLUMNS)}, version) VALUES ({', '.join('?' * (len(SHARED_TEAM_COLUMNS) + 2))})",
+                (shared_id, str(row['team_name']), str(row['team_description']), int(row['start_year']), int(row['start_month']),
+                 int(row['end_year']), int(row['end_month']), float(row['duration_weeks']), version)
+            )
+            connection.execute('DELETE FROM roles WHERE team_id = ?', (shared_id,))
+            team_roles = roles.iloc[role_groups.get(team_id, [])]
+            connection.executemany(
+                'INSERT INTO roles (team_id, position, role, resource_type, count) VALUES (?, ?, ?, ?, ?)',
+                [(shared_id, position, role, resource_type, float(count)) for position, (role, resource_type, count)
+                 in enumerate(zip(team_roles['role'], team_roles['resource_type'], team_roles['count']))]
+            )
+            result['saved'].append(shared_id)
+            sync['versions'].loc[shared_id] = version
+
+        for team_id in deleted_ids:
+            if int(team_id) not in current:
+                sync['versions'] = sync['versions'].drop(index=team_id)
+                continue
+            if current[int(team_id)] != sync['versions'][team_id]:
+                result['conflicts'].append(int(team_id))
+                continue
+            connection.execute('DELETE FROM teams WHERE team_id = ?', (int(team_id),))
+            connection.execute('DELETE FROM roles WHERE team_id = ?', (int(team_id),))
+            log_change(connection, int(team_id), 'delete', session_id)
+            sync['versions'] = sync['versions'].drop(index=team_id)
+            result['deleted'].append(int(team_id))
+
+        # Conflicting teams are reloaded as the other user left them
+        if result['conflicts']:
+            shared_teams, shared_roles, versions = read_shared_teams(connection, result['conflicts'])
+
+    sync['versions'] = sync['versions'].astype('int64')
+    if result['renamed']:
+        rename_store_teams(store, result['renamed'])
+    if result['conflicts']:
+        replace_store_teams(store, result['conflicts'], shared_teams, shared_roles)
+        sync['versions'] = sync['versions'].drop(index=result['conflicts'], errors='ignore')
+        sync['versions'] = pd.concat([sync['versions'], versions]).astype('int64')
+    sync['hashes'] = team_content_hashes(store)
+    return result
+
+# Function to bring a session's team store up to date with other sessions' changes since its last poll, in place.
+# Returns the team_ids that were reloaded or removed, and whether the salaries changed
+def pull_shared_changes(shared, store, sync, session_id):
+    with shared_transaction(shared) as connection:
+        changes = connection.execute(
+            'SELECT seq, team_id, kind, session_id FROM changes WHERE seq > ? ORDER BY seq', (int(sync['seq']),)
+        ).fetchall()
+        if not changes:
+            return {'team_ids': [], 'salaries': False}
+        others = [change for change in changes if change[3] != session_id]
+        team_ids = sorted({change[1] for change in others if change[1] is not None})
+        teams, roles, versions = read_shared_teams(connection, team_ids)
+    sync['seq'] = changes[-1][0]
+
+    # Teams the session already has at their latest version were written by it
+    local_versions = sync['versions'].reindex(team_ids)
+    shared_versions = versions.reindex(team_ids)
+    outdated = [
+        team_id for team_id, local, shared_version in zip(team_ids, local_versions, shared_versions)
+        if not (local == shared_version)
+    ]
+    if outdated:
+        replace_store_teams(store, outdated, teams.loc[teams.index.intersection(outdated)], roles[roles['team_id'].isin(outdated)])
+        sync['versions'] = pd.concat([sync['versions'].drop(index=outdated, errors='ignore'), versions.reindex(versions.index.intersection(outdated))]).astype('int64')
+        sync['hashes'] = team_content_hashes(store)
+    return {'team_ids': outdated, 'salaries': any(change[2] == 'salaries' for change in others)}
+
+# Function to read the shared salary table as {role: {resource_type: salary}}; empty until a session saves one
+def load_shared_salaries(shared):
+    with shared_connection(shared) as connection:
+        rows = connection.execute('SELECT role, resource_type, salary FROM salaries').fetchall()
+    salaries = {}
+    for role, resource_type, salary in rows:
+        salaries.setdefault(role, {})[resource_type] = salary
+    return salaries
+
+# Function to write the salary entries that differ from the shared salary table; returns how many changed
+def save_shared_salaries(shared, salaries, session_id):
+    with shared_transaction(shared, write=True) as connection:
+        stored = {(role, resource_type): salary for role, resource_type, salary in connection.execute('SELECT role, resource_type, salary FROM salaries')}
+        changed = [
+            (role, resource_type, float(salary))
+            for role, role_salaries in salaries.items()
+            for resource_type, salary in role_salaries.items()
+            if stored.get((role, resource_type)) != float(salary)
+        ]
+        if changed:
+            connection.executemany('INSERT OR REPLACE INTO salaries (role, resource_type, salary) VALUES (?, ?, ?)', changed)
+            log_change(connection, None, 'salaries', session_id)
+    return len(changed)
@@ -0,0 +1,204 @@
+# simulation.py
+
+# Monte Carlo cost uncertainty for team portfolios: salaries, FTE counts and end-date slippage are drawn from
+# distributions and every draw's yearly portfolio cost is evaluated as batched arrays (draws x teams x years).
+# Draws run in chunks that bound memory, optionally across worker processes sharing the base arrays, and are
+# summarized as P10/P50/P90 yearly cost bands.
+
+# Import necessary libraries
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+from team_cost_model import (
+    build_cost_inputs,
+    calculate_portfolio_costs,
+    costable_team_ids
+)
+from what_if import init_scenario_worker, share_arrays, worker_state
+
+# Largest end-date slippage drawn, in months, and the most draws one run accepts
+MAX_SLIP_MONTHS = 24
+MAX_DRAWS = 1000000
+
+# Memory budget for a chunk's draws x teams arrays; a chunk holds as many draws as fit in it
+SIMULATION_CHUNK_BYTES = 64 << 20
+CHUNK_ARRAYS = 5
+
+# Default distributions: relative standard deviations of salaries (per salary cell) and FTE counts (per team),
+# and the mean end-date slippage in months (Poisson, per team)
+DEFAULT_UNCERTAINTY = {'salary_sd': 0.05, 'fte_sd': 0.1, 'mean_slip': 1.0}
+
+# Percentiles reported for each year and for the total
+COST_PERCENTILES = {'P10': 10, 'P50': 50, 'P90': 90}
+
+# Calendar years a slipped end date can add costs to, counted from the year the team ends in
+TAIL_YEARS = 3
+
+# Function to build the simulation's base arrays on one year axis: every team's unslipped yearly costs, the costs
+# each slippage of 1 to max_slip months adds in the few years after the team's end, and the share of each team's cost
+# paid to each salary cell
+def build_simulation_base(store, salaries, schedule=None, max_slip=MAX_SLIP_MONTHS):
+    if not 0 <= max_slip <= MAX_SLIP_MONTHS:
+        raise ValueError(f"The slippage must be between 0 and {MAX_SLIP_MONTHS} months.")
+    team_ids = costable_team_ids(store)
+    cost_inputs = build_cost_inputs(store, team_ids, salaries, schedule)
+    roles = store['roles'].loc[cost_inputs['role_ids']]
+    end_months = cost_inputs['end_dates'].astype('datetime64[M]')
+
+    # One year axis covers the latest slippage
+    if len(team_ids):
+        years = np.arange(
+            cost_inputs['start_dates'].min().astype('datetime64[Y]'),
+            (end_months.max() + max_slip).astype('datetime64[Y]') + 1
+        )
+    else:
+        years = np.array([], dtype='datetime64[Y]')
+    slip_costs = np.zeros((max_slip + 1, len(team_ids), len(years)))
+    for slip in range(max_slip + 1):
+        costs = calculate_portfolio_costs(
+            cost_inputs['role_team_index'],
+            cost_inputs['role_counts'],
+            cost_inputs['role_rates'],
+            cost_inputs['start_dates'],
+            (end_months + slip).astype('datetime64[D]'),
+            cost_inputs['rate_months']
+        )
+        first = int(costs['years'][0]) - (int(years[0].astype(np.int64)) + 1970) if len(costs['years']) else 0
+        slip_costs[slip, :, first:first + len(costs['years'])] = costs['cost_matrix']
+        if slip == 0:
+            role_costs = costs['role_costs']
+
+    # Slippage only adds costs from the team's end year on; keep those years' costs per slippage and team. Teams
+    # that end before they start stay uncosted however far they slip
+    base_costs = slip_costs[0]
+    added_costs = np.where((cost_inputs['end_dates'] >= cost_inputs['start_dates'])[None, :, None], slip_costs - base_costs, 0.0)
+    end_years = (end_months.astype('datetime64[Y]') - years[0]).astype(np.int64) if len(years) else np.zeros(0, dtype=np.int64)
+    tail_positions = end_years[:, None] + np.arange(TAIL_YEARS)
+    in_axis = tail_positions < len(years)
+    tail_positions = np.minimum(tail_positions, max(len(years) - 1, 0))
+    tail_costs = np.zeros((max_slip + 1, len(team_ids), TAIL_YEARS))
+    tail_spread = np.zeros((TAIL_YEARS, len(team_ids), len(years)))
+    if len(years):
+        tail_costs[...] = np.where(in_axis, np.take_along_axis(added_costs, np.broadcast_to(tail_positions, tail_costs.shape), axis=2), 0.0)
+        for offset in range(TAIL_YEARS):
+            tail_spread[offset, np.arange(len(team_ids)), tail_positions[:, offset]] = in_axis[:, offset]
+
+    # Salary draws scale each team by the cost-weighted multiplier of its salary cells; weights are the roles'
+    # shares of their team's unslipped cost, so with scheduled salaries they are averaged over the team's life
+    cell_codes, cells = pd.factorize(pd.MultiIndex.from_arrays([roles['role'], roles['resource_type']]))
+    team_cell_weights = np.zeros((len(team_ids), len(cells)))
+    np.add.at(team_cell_weights, (cost_inputs['role_team_index'], cell_codes), role_costs)
+    team_totals = team_cell_weights.sum(axis=1, keepdims=True)
+    np.divide(team_cell_weights, team_totals, out=team_cell_weights, where=team_totals > 0)
+
+    return {
+        'team_ids': team_ids,
+        'cells': list(cells),
+        'years': years.astype(np.int64) + 1970,
+        'base_costs': base_costs,
+        'tail_costs': tail_costs,
+        'tail_spread': tail_spread,
+        'team_cell_weights': team_cell_weights
+    }
+
+# Function to evaluate one chunk of draws and return their yearly portfolio costs: draws x years. Each chunk has
+# its own random stream, so results do not depend on how chunks are spread over processes
+def simulate_draw_chunk(arrays, uncertainty, seed, chunk_index, num_draws):
+    tail_costs = arrays['tail_costs']
+    weights = arrays['team_cell_weights']
+    num_teams = weights.shape[0]
+    rng = np.random.default_rng([seed, chunk_index])
+
+    # Lognormal salary multipliers with mean 1 and normal FTE multipliers floored at zero scale each team's costs
+    salary_sd = np.sqrt(np.log1p(uncertainty['salary_sd'] ** 2))
+    salary_multipliers = rng.lognormal(-salary_sd ** 2 / 2, salary_sd, (num_draws, weights.shape[1]))
+    team_scales = salary_multipliers @ weights.T
+    fte_multipliers = rng.standard_normal((num_draws, num_teams), dtype=np.float32)
+    fte_multipliers *= uncertainty['fte_sd']
+    fte_multipliers += 1.0
+    team_scales *= np.clip(fte_multipliers, 0, None)
+
+    # Poisson slippage capped at the largest one costed, drawn by inverting its distribution function: a slippage
+    # is the number of cumulative probabilities its uniform draw reaches
+    thresholds = np.cumsum(poisson_pmf(uncertainty['mean_slip'], len(tail_costs))[:-1]).astype(np.float32)
+    uniforms = rng.random((num_draws, num_teams), dtype=np.float32)
+    slips = np.zeros((num_draws, num_teams), dtype=np.int8)
+    for threshold in thresholds[thresholds < 1.0]:
+        slips += uniforms >= threshold
+
+    # Unslipped costs are one matrix product; each tail year adds the drawn slippage's costs in that year
+    yearly_costs = team_scales @ arrays['base_costs']
+    tail_cells = slips * np.int64(num_teams) + np.arange(num_teams)
+    for offset in range(tail_costs.shape[2]):
+        yearly_costs += (team_scales * tail_costs[:, :, offset].ravel()[tail_cells]) @ arrays['tail_spread'][offset]
+    return yearly_costs
+
+# Function to get the probabilities of 0 to size - 1 under a Poisson distribution, the last one taking the rest
+def poisson_pmf(mean, size):
+    pmf = np.zeros(size)
+    pmf[0] = np.exp(-mean)
+    for count in range(1, size):
+        pmf[count] = pmf[count - 1] * mean / count
+    pmf[-1] = max(1.0 - pmf[:-1].sum(), 0.0)
+    return pmf
+
+# Function to split the draws into chunks whose draws x teams arrays fit in the chunk memory budget
+def simulation_chunks(num_draws, num_teams, chunk_bytes=SIMULATION_CHUNK_BYTES):
+    chunk_draws = max(1, chunk_bytes // (CHUNK_ARRAYS * 8 * max(num_teams, 1)))
+    return [(start, min(start + chunk_draws, num_draws)) for start in range(0, num_draws, chunk_draws)]
+
+# Function to evaluate a chunk of draws in a worker process
+def run_draw_chunk(uncertainty, seed, chunk_index, start, stop):
+    return start, simulate_draw_chunk(worker_state['arrays'], uncertainty, seed, chunk_index, stop - start)
+
+# Function to run the simulation, yielding (first draw, yearly costs) as each chunk completes
+def run_simulation(base, num_draws, uncertainty=DEFAULT_UNCERTAINTY, seed=0, processes=None, chunk_bytes=SIMULATION_CHUNK_BYTES):
+    if not 1 <= num_draws <= MAX_DRAWS:
+        raise ValueError(f"The number of draws must be between 1 and {MAX_DRAWS:,}.")
+    arrays = {name: base[name] for name in ('base_costs', 'tail_costs', 'tail_spread', 'team_cell_weights')}
+    chunks = simulation_chunks(num_draws, len(base['team_ids']), chunk_bytes)
+
+    # Single-CPU hosts and single chunks are not worth starting processes for
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(chunks) == 1:
+        for chunk_index, (start, stop) in enumerate(chunks):
+            yield start, simulate_draw_chunk(arrays, uncertainty, seed, chunk_index, stop - start)
+        return
+
+    blocks, specs = share_arrays(arrays)
+    try:
+        # Spawned workers do not inherit the Streamlit server's threads
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context('spawn'),
+            initializer=init_scenario_worker,
+            initargs=(specs,)
+        ) as executor:
+            futures = [
+                executor.submit(run_draw_chunk, uncertainty, seed, chunk_index, start, stop)
+                for chunk_index, (start, stop) in enumerate(chunks)
+            ]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+# Function to summarize the draws as cost bands: the percentiles, mean and unperturbed cost of each year, and a
+# last row for the total over all years
+def cost_bands_frame(base, yearly_draws):
+    draws = np.column_stack([yearly_draws, yearly_draws.sum(axis=1)])
+    base_costs = base['base_costs'].sum(axis=0)
+    bands = pd.DataFrame({'Year': [str(year) for year in base['years']] + ['Total']})
+    for label, percentile in COST_PERCENTILES.items():
+        bands[label] = np.percentile(draws, percentile, axis=0) if len(draws) else np.nan
+    bands['Mean'] = draws.mean(axis=0) if len(draws) else np.nan
+    bands['Base'] = np.append(base_costs, base_costs.sum())
+    return bands
@@ -0,0 +1,251 @@
+# snapshots.py
+
+# Versioned snapshots of a team portfolio and its salary table, and diffs between them. Every version of a team is
+# stored once as a blob addressed by its id, content and costs; a snapshot is a manifest of team ids and blob
+# addresses plus its salaries and yearly totals, so saving one writes only the teams no earlier snapshot holds. A diff
+# compares two manifests and decodes only the blobs of teams that differ.
+
+# Import necessary libraries
+import json
+import time
+import numpy as np
+import pandas as pd
+from shared_store import SHARED_TEAM_COLUMNS, shared_connection, shared_transaction, team_content_hashes
+
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot_blobs (
+    address INTEGER PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    team_count INTEGER NOT NULL,
+    new_blobs INTEGER NOT NULL,
+    salaries TEXT NOT NULL,
+    yearly_totals TEXT NOT NULL,
+    manifest BLOB NOT NULL
+);
+"""
+
+# Labels of the kinds of change a diff reports, for teams and for roles
+TEAM_CHANGES = ['Added', 'Removed', 'Changed', 'Cost Only']
+ROLE_CHANGES = ['Added', 'Removed', 'Changed']
+
+# Function to add the snapshot tables to a store opened with shared_store.open_shared_store
+def create_snapshot_tables(shared):
+    with shared_connection(shared) as connection:
+        connection.executescript(SNAPSHOT_SCHEMA)
+    return shared
+
+# Function to address every team by its id, content and yearly costs, so a team's blob changes when either changes
+# and only the same team saved unchanged in another snapshot shares it. Returns (addresses, content hashes) as
+# int64, SQLite's integer type
+def team_blob_addresses(store):
+    content = team_content_hashes(store)
+    costs = store['costs'].reindex(store['teams'].index)
+    cost_cells = costs.stack().dropna()
+    cost_hashes = np.zeros(len(costs), dtype=np.uint64)
+    if len(cost_cells):
+        cell_hashes = pd.util.hash_pandas_object(cost_cells.reset_index(name='cost').astype({'cost': 'float64'}), index=False).to_numpy()
+        np.add.at(cost_hashes, costs.index.get_indexer(cost_cells.index.get_level_values(0)), cell_hashes)
+    addresses = pd.util.hash_pandas_object(pd.DataFrame({'content': content.to_numpy(), 'costs': cost_hashes}), index=False).to_numpy()
+    return addresses.view(np.int64), content.to_numpy().view(np.int64)
+
+# Function to encode one team as a blob: its shared columns, its roles in order and its yearly costs
+def encode_team_blob(team_id, team, team_roles, team_costs):
+    return json.dumps({
+        'team_id': team_id,
+        'team': team,
+        'roles': team_roles,
+        'costs': team_costs
+    }, separators=(',', ':')).encode('utf-8')
+
+# Function to list each team's roles as [role, resource type, FTE] in order
+def team_role_lists(roles, team_ids):
+    roles = roles[roles['team_id'].isin(team_ids)]
+    role_lists = {team_id: [] for team_id in team_ids.tolist()}
+    for team_id, role, resource_type, count in zip(
+        roles['team_id'].tolist(), roles['role'].tolist(), roles['resource_type'].tolist(), roles['count'].tolist()
+    ):
+        role_lists[team_id].append([role, resource_type, count])
+    return list(role_lists.values())
+
+# Function to list each team's yearly costs as [year, cost], skipping the years it does not run in
+def team_cost_lists(costs):
+    years = [int(year) for year in costs.columns]
+    return [
+        [[year, cost] for year, cost in zip(years, row) if cost == cost]  # NaN marks years the team does not run in
+        for row in costs.to_numpy(dtype=np.float64).tolist()
+    ]
+
+# Function to save the team store and salary table as a named snapshot; only teams no stored blob matches are
+# encoded and written. Costs must be up to date. Returns the snapshot id and how many blobs were new
+def save_snapshot(shared, store, salaries, name):
+    teams = store['teams']
+    addresses, content = team_blob_addresses(store)
+    yearly_totals = store['costs'].reindex(teams.index).sum(axis=0, min_count=1).dropna()
+    manifest = np.stack([teams.index.to_numpy(dtype=np.int64), content, addresses])
+
+    with shared_transaction(shared, write=True) as connection:
+        stored = {row[0] for row in connection.execute(
+            'SELECT address FROM snapshot_blobs WHERE address IN (SELECT value FROM json_each(?))',
+            (json.dumps(addresses.tolist()),)
+        )}
+        new_positions = [position for position, address in enumerate(addresses.tolist()) if address not in stored]
+        if new_positions:
+            team_rows = teams[SHARED_TEAM_COLUMNS].iloc[new_positions]
+            team_values = [dict(zip(SHARED_TEAM_COLUMNS, row)) for row in team_rows.itertuples(index=False)]
+            role_lists = team_role_lists(store['roles'], team_rows.index)
+            cost_lists = team_cost_lists(store['costs'].reindex(team_rows.index))
+            connection.executemany('INSERT INTO snapshot_blobs (address, data) VALUES (?, ?)', [
+                (int(addresses[position]), encode_team_blob(team_id, team, team_roles, team_costs))
+                for position, team_id, team, team_roles, team_costs
+                in zip(new_positions, team_rows.index.tolist(), team_values, role_lists, cost_lists)
+            ])
+        cursor = connection.execute(
+            'INSERT INTO snapshots (name, created_at, team_count, new_blobs, salaries, yearly_totals, manifest) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (name, time.time(), len(teams), len(new_positions), json.dumps(salaries, sort_keys=True),
+             json.dumps({str(year): float(total) for year, total in yearly_totals.items()}), manifest.tobytes())
+        )
+    return {'snapshot_id': cursor.lastrowid, 'new_blobs': len(new_positions)}
+
+# Function to list the saved snapshots, newest first
+def list_snapshots(shared):
+    with shared_connection(shared) as connection:
+        snapshots = pd.read_sql_query(
+            'SELECT snapshot_id, name, created_at, team_count, new_blobs FROM snapshots ORDER BY snapshot_id DESC', connection
+        )
+    snapshots['created_at'] = pd.to_datetime(snapshots['created_at'], unit='s').dt.floor('s')
+    return snapshots
+
+# Function to read a snapshot's manifest, salaries and yearly totals
+def load_snapshot(connection, snapshot_id):
+    row = connection.execute(
+        'SELECT name, salaries, yearly_totals, manifest FROM snapshots WHERE snapshot_id = ?', (int(snapshot_id),)
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"Snapshot {snapshot_id} does not exist.")
+    manifest = np.frombuffer(row[3], dtype=np.int64).reshape(3, -1)
+    return {
+        'name': row[0],
+        'salaries': json.loads(row[1]),
+        'yearly_totals': pd.Series({int(year): total for year, total in json.loads(row[2]).items()}, dtype='float64'),
+        'content': pd.Series(manifest[1], index=manifest[0]),
+        'addresses': pd.Series(manifest[2], index=manifest[0])
+    }
+
+# Function to delete a snapshot and the blobs no other snapshot refers to
+def delete_snapshot(shared, snapshot_id):
+    with shared_transaction(shared, write=True) as connection:
+        connection.execute('DELETE FROM snapshots WHERE snapshot_id = ?', (int(snapshot_id),))
+        referenced = [np.frombuffer(row[0], dtype=np.int64).reshape(3, -1)[2] for row in connection.execute('SELECT manifest FROM snapshots')]
+        referenced = np.unique(np.concatenate(referenced)) if referenced else np.array([], dtype=np.int64)
+        stored = np.array([row[0] for row in connection.execute('SELECT address FROM snapshot_blobs')], dtype=np.int64)
+        orphaned = np.setdiff1d(stored, referenced)
+        connection.execute('DELETE FROM snapshot_blobs WHERE address IN (SELECT value FROM json_each(?))', (json.dumps(orphaned.tolist()),))
+    return len(orphaned)
+
+# Function to decode blobs into a teams table, a roles table and a long table of yearly costs
+def read_team_blobs(connection, addresses):
+    blobs = connection.execute(
+        'SELECT data FROM snapshot_blobs WHERE address IN (SELECT value FROM json_each(?))',
+        (json.dumps([int(address) for address in addresses]),)
+    ).fetchall()
+    documents = [json.loads(blob[0]) for blob in blobs]
+    team_ids = [document['team_id'] for document in documents]
+    teams = pd.DataFrame([document['team'] for document in documents], index=pd.Index(team_ids, dtype='int64', name='team_id'), columns=SHARED_TEAM_COLUMNS)
+    role_counts = [len(document['roles']) for document in documents]
+    roles = pd.DataFrame(
+        [role for document in documents for role in document['roles']], columns=['role', 'resource_type', 'count']
+    ).astype({'count': 'float64'})
+    roles.insert(0, 'team_id', np.repeat(np.asarray(team_ids, dtype=np.int64), role_counts))
+    cost_counts = [len(document['costs']) for document in documents]
+    costs = pd.DataFrame([cost for document in documents for cost in document['costs']], columns=['year', 'cost']).astype({'year': 'int64', 'cost': 'float64'})
+    costs.insert(0, 'team_id', np.repeat(np.asarray(team_ids, dtype=np.int64), cost_counts))
+    return teams, roles, costs
+
+# Function to diff two snapshots: added, removed and changed teams with their cost deltas, role changes, salary
+# changes, and the cost delta of each year. Unchanged teams are settled from the manifests alone
+def diff_snapshots(shared, old_id, new_id):
+    with shared_transaction(shared) as connection:
+        old = load_snapshot(connection, old_id)
+        new = load_snapshot(connection, new_id)
+        added = new['addresses'].index.difference(old['addresses'].index)
+        removed = old['addresses'].index.difference(new['addresses'].index)
+        common = old['addresses'].index.intersection(new['addresses'].index)
+        changed = common[old['addresses'].loc[common].to_numpy() != new['addresses'].loc[common].to_numpy()]
+        old_teams, old_roles, old_costs = read_team_blobs(connection, old['addresses'].loc[removed.union(changed)])
+        new_teams, new_roles, new_costs = read_team_blobs(connection, new['addresses'].loc[added.union(changed)])
+
+    # Cost deltas as a changed teams x years matrix: new costs in, old costs out
+    team_ids = added.union(removed).union(changed)
+    years = np.union1d(old['yearly_totals'].index, new['yearly_totals'].index)
+    years = np.union1d(years, np.union1d(old_costs['year'], new_costs['year'])).astype(np.int64)
+    delta = np.zeros((len(team_ids), len(years)))
+    for costs, sign in ((new_costs, 1.0), (old_costs, -1.0)):
+        np.add.at(delta, (team_ids.get_indexer(costs['team_id']), np.searchsorted(years, costs['year'])), sign * costs['cost'].to_numpy())
+
+    # Roles are matched by team, role and resource type; repeated roles are summed
+    role_keys = ['team_id', 'role', 'resource_type']
+    roles_df = pd.merge(
+        old_roles.groupby(role_keys, sort=False)['count'].sum().rename('FTE Before'),
+        new_roles.groupby(role_keys, sort=False)['count'].sum().rename('FTE After'),
+        how='outer', left_index=True, right_index=True
+    ).reset_index()
+    roles_df.insert(3, 'Change', pd.Categorical(np.select(
+        [roles_df['FTE Before'].isna(), roles_df['FTE After'].isna()], ['Added', 'Removed'], 'Changed'
+    ), categories=ROLE_CHANGES))
+    roles_df = roles_df[roles_df['FTE Before'].ne(roles_df['FTE After'])].sort_values(role_keys, kind='stable')
+
+    # Changed fields of teams in both snapshots; a team whose content is the same only changed in cost
+    content_changed = changed[old['content'].loc[changed].to_numpy() != new['content'].loc[changed].to_numpy()]
+    field_changes = old_teams.reindex(content_changed).ne(new_teams.reindex(content_changed))
+    field_labels = np.where(field_changes.to_numpy(), np.array([f"{col}, " for col in SHARED_TEAM_COLUMNS], dtype=object), '')
+    changed_fields = pd.Series(field_labels.sum(axis=1) if len(field_labels) else [], index=content_changed, dtype=object).str.rstrip(', ')
+    role_changed = pd.Index(roles_df['team_id']).intersection(content_changed)
+    changed_fields.loc[role_changed] = [', '.join(filter(None, [fields, 'roles'])) for fields in changed_fields.loc[role_changed]]
+
+    change = pd.Series('Cost Only', index=team_ids, dtype=object)
+    change.loc[added] = 'Added'
+    change.loc[removed] = 'Removed'
+    change.loc[content_changed] = 'Changed'
+    names = new_teams['team_name'].combine_first(old_teams['team_name']).reindex(team_ids)
+    teams_df = pd.DataFrame({
+        'team_id': team_ids,
+        'Team': names.fillna('').to_numpy(),
+        'Change': pd.Categorical(change.to_numpy(), categories=TEAM_CHANGES),
+        'Changed Fields': changed_fields.reindex(team_ids, fill_value='').to_numpy(),
+        'Cost Before': old_costs.groupby('team_id')['cost'].sum().reindex(team_ids, fill_value=0.0).to_numpy(),
+        'Cost After': new_costs.groupby('team_id')['cost'].sum().reindex(team_ids, fill_value=0.0).to_numpy(),
+        'Cost Delta': delta.sum(axis=1)
+    }).sort_values(['Change', 'team_id'], kind='stable')
+
+    years_df = pd.DataFrame({
+        'Year': years.astype(str),
+        'Before': old['yearly_totals'].reindex(years, fill_value=0.0).to_numpy(),
+        'After': new['yearly_totals'].reindex(years, fill_value=0.0).to_numpy(),
+        'Delta': delta.sum(axis=0)
+    })
+
+    salary_keys = list(dict.fromkeys(
+        (role, resource_type) for snapshot in (old, new) for role, role_salaries in snapshot['salaries'].items() for resource_type in role_salaries
+    ))
+    salaries_df = pd.DataFrame({
+        'Role': [role for role, _ in salary_keys],
+        'Resource Type': [resource_type for _, resource_type in salary_keys],
+        'Before': [old['salaries'].get(role, {}).get(resource_type, np.nan) for role, resource_type in salary_keys],
+        'After': [new['salaries'].get(role, {}).get(resource_type, np.nan) for role, resource_type in salary_keys]
+    }).astype({'Before': 'float64', 'After': 'float64'})
+    salaries_df = salaries_df[salaries_df['Before'].ne(salaries_df['After'])]
+
+    return {
+        'old_name': old['name'],
+        'new_name': new['name'],
+        'counts': {label: int((teams_df['Change'] == label).sum()) for label in TEAM_CHANGES},
+        'teams': teams_df.reset_index(drop=True),
+        'roles': roles_df.reset_index(drop=True),
+        'years': years_df,
+        'salaries': salaries_df.reset_index(drop=True)
+    }
@@ -0,0 +1,109 @@
+# team_cost_cli.py
+
+# Headless batch costing for team files, built on the UI-free team_cost_model module.
+# Each input file is imported and costed in its own worker process.
+#
+#   python team_cost_cli.py teams_a.json teams_b.parquet                # cost files in parallel
+#   python team_cost_cli.py teams.jsonl --salaries salaries.json        # override salary entries
+#   python team_cost_cli.py teams.json --salary-schedule schedule.json  # escalate salaries over time
+#   python team_cost_cli.py exports/*.json --processes 4 --output-dir out
+
+# Import necessary libraries
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import team_cost_model
+
+# Function to build the salary table: the defaults, with any role/resource type entries from a JSON file applied on top
+def load_salaries(salaries_path):
+    salaries = copy.deepcopy(team_cost_model.DEFAULT_YEARLY_SALARIES)
+    if salaries_path:
+        with open(salaries_path) as salaries_file:
+            for role, rates in json.load(salaries_file).items():
+                salaries.setdefault(role, {}).update({resource_type: float(rate) for resource_type, rate in rates.items()})
+    return salaries
+
+# Function to build a salary schedule from a JSON file of
+# {"base_year": 2026, "default_escalation": 3, "escalation": {role: pct}, "overrides": [{role, resource_type, from, salary}]}
+def load_salary_schedule(schedule_path, salaries):
+    if not schedule_path:
+        return None
+    with open(schedule_path) as schedule_file:
+        settings = json.load(schedule_file)
+    return team_cost_model.build_salary_schedule(
+        salaries,
+        settings.get('base_year', date.today().year),
+        settings.get('escalation'),
+        settings.get('overrides', ()),
+        settings.get('default_escalation', 0.0)
+    )
+
+# Output file suffix for each summary granularity
+PERIOD_SUFFIXES = {'Month': 'monthly', 'Quarter': 'quarterly', 'Year': 'yearly'}
+
+# Function to import and cost one teams file, writing its period totals, per-team and per-role costs as CSV
+def cost_teams_file(path, salaries, output_dir, granularity='Year', fiscal_year_start=1, schedule=None):
+    start = time.perf_counter()
+    with open(path, 'rb') as binary_file:
+        store, problems = team_cost_model.import_teams_file(binary_file, os.path.basename(path), os.path.getsize(path))
+    cache = team_cost_model.create_cost_cache()
+    team_cost_model.update_portfolio_costs(store, cache, salaries, schedule)
+    summary_frames = team_cost_model.build_summary_frames(store, cache, granularity, fiscal_year_start)
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    periods_path = os.path.join(output_dir, f"{stem}_{PERIOD_SUFFIXES[granularity]}.csv")
+    teams_path = os.path.join(output_dir, f"{stem}_teams.csv")
+    roles_path = os.path.join(output_dir, f"{stem}_roles.csv")
+    summary_frames['period_costs'].to_csv(periods_path, index=False)
+    summary_frames['pivot'].to_csv(teams_path, index=False)
+    team_cost_model.build_role_period_frame(store, cache, granularity, fiscal_year_start).to_csv(roles_path, index=False)
+
+    return {
+        'path': path,
+        'teams': len(store['teams']),
+        'roles': len(store['roles']),
+        'problems': len(problems),
+        'total_cost': float(summary_frames['period_costs']['Cost'].sum()),
+        'outputs': [periods_path, teams_path, roles_path],
+        'seconds': time.perf_counter() - start
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cost team files (JSON, JSON Lines, CSV or Parquet) without the Streamlit app.")
+    parser.add_argument('files', nargs='+', help="Team files to cost.")
+    parser.add_argument('--salaries', metavar='PATH', help="JSON file of {role: {resource_type: yearly_salary}} overrides.")
+    parser.add_argument('--salary-schedule', metavar='PATH', help="JSON file of base_year, default_escalation, per-role escalation and dated salary overrides.")
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes; defaults to one per CPU, capped at the number of files.")
+    parser.add_argument('--granularity', choices=list(team_cost_model.GRANULARITIES), default='Year', help="Period the costs are rolled up to.")
+    parser.add_argument('--fiscal-year-start', type=int, choices=range(1, 13), default=1, metavar='MONTH', help="First month of the fiscal year (1-12).")
+    parser.add_argument('--output-dir', default='.', help="Directory for the CSV outputs.")
+    args = parser.parse_args()
+
+    salaries = load_salaries(args.salaries)
+    schedule = load_salary_schedule(args.salary_schedule, salaries)
+    os.makedirs(args.output_dir, exist_ok=True)
+    processes = min(args.processes or os.cpu_count() or 1, len(args.files))
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(cost_teams_file, path, salaries, args.output_dir, args.granularity, args.fiscal_year_start, schedule): path for path in args.files}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"{futures[future]}: failed: {e}", file=sys.stderr)
+                continue
+            print(
+                f"{result['path']}: {result['teams']:,} teams, {result['roles']:,} roles, {result['problems']:,} skipped, "
+                f"total ${result['total_cost']:,.2f} in {result['seconds']:.2f} s -> {', '.join(result['outputs'])}"
+            )
+
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,1895 @@
+# team_cost_model.py
+
+# UI-free cost model for the team cost calculator: salary table, team store schema,
+# import/export and storage formats, the batched cost engine and summary aggregations.
+# Nothing here imports Streamlit, so it can be used from batch jobs and the CLI.
+
+# Import necessary libraries
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import random
+import json
+import codecs
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, date
+
+# Default roles and their yearly salaries; callers pass a (possibly adjusted) copy to the cost functions
+DEFAULT_YEARLY_SALARIES = {
+    'Management': {
+        'Onshore FTE': 263000,
+        'Offshore FTE': 131000,
+        'Onshore Professional Services': 394000,
+        'Offshore Professional Services': 197000
+    },
+    'Product Manager': {
+        'Onshore FTE': 140000,
+        'Offshore FTE': 105000,
+        'Onshore Professional Services': 175000,
+        'Offshore Professional Services': 123000
+    },
+    'Product Specialists': {
+        'Onshore FTE': 140000,
+        'Offshore FTE': 88000,
+        'Onshore Professional Services': 175000,
+        'Offshore Professional Services': 123000
+    },
+    'Core Dev, Data Science & Infra': {
+        'Onshore FTE': 175000,
+        'Offshore FTE': 123000,
+        'Onshore Professional Services': 228000,
+        'Offshore Professional Services': 140000
+    },
+    'QA': {
+        'Onshore FTE': 140000,
+        'Offshore FTE': 88000,
+        'Onshore Professional Services': 175000,
+        'Offshore Professional Services': 123000
+    },
+    'UX Designers': {
+        'Onshore FTE': 175000,
+        'Offshore FTE': 123000,
+        'Onshore Professional Services': 228000,
+        'Offshore Professional Services': 140000
+    },
+    'Scrum Masters': {
+        'Onshore FTE': 140000,
+        'Offshore FTE': 105000,
+        'Onshore Professional Services': 175000,
+        'Offshore Professional Services': 123000
+    }
+}
+
+# Columns and dtypes of the teams table in the team store (indexed by team_id)
+TEAM_COLUMNS = {
+    'team_name': 'object',
+    'team_description': 'object',
+    'start_year': 'int64',
+    'start_month': 'int64',
+    'end_year': 'int64',
+    'end_month': 'int64',
+    'duration_weeks': 'float64',
+    'total_team_cost': 'float64'
+}
+
+# Columns and dtypes of the roles table in the team store (indexed by role_id)
+ROLE_COLUMNS = {
+    'team_id': 'int64',
+    'role': 'object',
+    'resource_type': 'object',
+    'count': 'float64',
+    'role_cost': 'float64'
+}
+
+# Years offered by the team editor
+YEAR_OPTIONS = range(2020, 2031)
+
+# Function to build an empty, typed table for the team store
+def empty_store_table(columns, index_name):
+    table = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in columns.items()})
+    table.index = pd.Index([], dtype='int64', name=index_name)
+    return table
+
+# Function to create an empty team store: a teams table, a roles table and a team x year cost table
+def create_team_store():
+    teams = empty_store_table(TEAM_COLUMNS, 'team_id')
+    return {
+        'teams': teams,
+        'roles': empty_store_table(ROLE_COLUMNS, 'role_id'),
+        'costs': pd.DataFrame(index=teams.index, dtype='float64')
+    }
+
+# Function to convert start/end year and month columns to first-of-month dates
+def month_start_dates(years, months):
+    years = np.asarray(years, dtype=np.int64)
+    months = np.asarray(months, dtype=np.int64)
+    return ((years - 1970) * 12 + months - 1).astype('datetime64[M]').astype('datetime64[D]')
+
+# Function to get the display name of every team in the store
+def team_display_names(teams):
+    return [name or f"Team {pos+1}" for pos, name in enumerate(teams['team_name'])]
+
+# Declarative schema of the team JSON document used for import/export; only fields typed 'date' go through the date codec
+TEAM_DOCUMENT_SCHEMA = {
+    'team_id': 'int',
+    'team_name': 'str',
+    'team_description': 'str',
+    'start_year': 'int',
+    'start_month': 'int',
+    'end_year': 'int',
+    'end_month': 'int',
+    'start_date': 'date',
+    'end_date': 'date',
+    'duration_weeks': 'float',
+    'team_roles': 'roles',
+    'cost_per_year': 'year_costs',
+    'total_team_cost': 'float'
+}
+ROLE_DOCUMENT_SCHEMA = {
+    'role': 'str',
+    'count': 'float',
+    'resource_type': 'str'
+}
+# Year and month fields that each date field stands for; the date is only read when they are missing
+DOCUMENT_DATE_PARTS = {
+    'start_date': ('start_year', 'start_month'),
+    'end_date': ('end_year', 'end_month')
+}
+
+# Function to decode a whole column of ISO date strings at once; missing or invalid values become NaT
+def decode_document_dates(values):
+    dates = pd.to_datetime(pd.Series(values, dtype=object).astype(str), format='ISO8601', errors='coerce')
+    return dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+
+# Function to encode a column of dates as ISO strings
+def encode_document_dates(dates):
+    return np.datetime_as_string(np.asarray(dates, dtype='datetime64[D]'), unit='D').tolist()
+
+# Function to read year and month columns, falling back to the matching date field and then to today
+def decode_year_month_columns(columns, date_field, fallback):
+    year_field, month_field = DOCUMENT_DATE_PARTS[date_field]
+    years = pd.Series(columns[year_field], dtype='float64').to_numpy(copy=True)
+    months = pd.Series(columns[month_field], dtype='float64').to_numpy(copy=True)
+    missing = np.isnan(years) | np.isnan(months)
+    if missing.any():
+        dates = decode_document_dates([columns[date_field][pos] for pos in np.flatnonzero(missing)])
+        date_months = dates.astype('datetime64[M]').astype(np.int64)
+        has_date = ~np.isnat(dates)
+        years[missing] = np.where(has_date, date_months // 12 + 1970, fallback.year)
+        months[missing] = np.where(has_date, date_months % 12 + 1, fallback.month)
+    return years.astype(np.int64), months.astype(np.int64)
+
+# Function to build a team store from a list of team documents (demo teams, imports)
+def team_store_from_records(records):
+    # Read every schema field as one column in a single sweep per field
+    columns = {field: [team.get(field) for team in records] for field in TEAM_DOCUMENT_SCHEMA}
+
+    # Flatten all role lists into role columns that point back at their team's position
+    team_roles = [team_role_list or [] for team_role_list in columns['team_roles']]
+    flat_roles = [role_info for team_role_list in team_roles for role_info in team_role_list]
+    role_columns = {
+        'team_position': np.repeat(np.arange(len(records)), [len(team_role_list) for team_role_list in team_roles]),
+        'role': [role_info.get('role') for role_info in flat_roles],
+        'resource_type': [role_info.get('resource_type') for role_info in flat_roles],
+        'count': [role_info.get('count', 1.0) for role_info in flat_roles]
+    }
+    return team_store_from_columns(columns, role_columns)
+
+# Function to build a team store from team document columns and role columns
+def team_store_from_columns(columns, role_columns):
+    today = date.today()
+
+    # Keep stored team ids so cost caches survive the storage round trip; renumber if they are missing or clash
+    team_ids = list(columns['team_id'])
+    if None in team_ids or len(set(team_ids)) != len(team_ids):
+        team_ids = list(range(len(team_ids)))
+
+    start_years, start_months = decode_year_month_columns(columns, 'start_date', today)
+    end_years, end_months = decode_year_month_columns(columns, 'end_date', today)
+    teams = pd.DataFrame({
+        'team_name': [name if isinstance(name, str) else '' for name in columns['team_name']],
+        'team_description': [description if isinstance(description, str) else '' for description in columns['team_description']],
+        'start_year': start_years,
+        'start_month': start_months,
+        'end_year': end_years,
+        'end_month': end_months,
+        'duration_weeks': pd.Series(columns['duration_weeks'], dtype='float64').fillna(0.0).to_numpy(),
+        'total_team_cost': pd.Series(columns['total_team_cost'], dtype='float64').fillna(0.0).to_numpy()
+    }, index=pd.Index(team_ids, dtype='int64', name='team_id')).astype(TEAM_COLUMNS)
+
+    roles = pd.DataFrame({
+        'team_id': teams.index.to_numpy()[np.asarray(role_columns['team_position'], dtype=np.int64)],
+        'role': role_columns['role'],
+        'resource_type': role_columns['resource_type'],
+        'count': pd.Series(role_columns['count'], dtype='float64').to_numpy(),
+        'role_cost': np.nan
+    }, index=pd.Index(range(len(role_columns['role'])), dtype='int64', name='role_id')).astype(ROLE_COLUMNS)
+
+    # Collect cost_per_year entries as (team, year, cost) cells and pivot them into the cost table
+    cost_cells = [
+        (team_id, int(year), cost)
+        for team_id, year_costs in zip(team_ids, columns['cost_per_year']) if year_costs
+        for year, cost in year_costs.items()
+    ]
+    if cost_cells:
+        cost_cells = pd.DataFrame(cost_cells, columns=['team_id', 'year', 'cost'])
+        costs = cost_cells.pivot(index='team_id', columns='year', values='cost').reindex(teams.index)
+        costs.columns.name = None
+        costs = costs.astype('float64')
+    else:
+        costs = pd.DataFrame(index=teams.index, dtype='float64')
+    return {'teams': teams, 'roles': roles, 'costs': costs}
+
+# Function to convert the team store back to a list of team documents (export)
+def team_store_to_records(store):
+    teams = store['teams']
+    roles = store['roles']
+    costs = store['costs'].reindex(teams.index)
+    start_dates = encode_document_dates(month_start_dates(teams['start_year'], teams['start_month']))
+    end_dates = encode_document_dates(month_start_dates(teams['end_year'], teams['end_month']))
+
+    # Group role rows by team once instead of filtering the roles table per team
+    team_roles = {team_id: [] for team_id in teams.index.tolist()}
+    for team_id, role, count, resource_type in zip(
+        roles['team_id'].tolist(), roles['role'].tolist(), roles['count'].tolist(), roles['resource_type'].tolist()
+    ):
+        team_roles[team_id].append({'role': role, 'count': count, 'resource_type': resource_type})
+
+    years = [int(year) for year in costs.columns]
+    cost_per_year = [
+        {year: cost for year, cost in zip(years, row) if cost == cost}  # NaN marks years the team does not run in
+        for row in costs.to_numpy(dtype=np.float64).tolist()
+    ]
+
+    return [
+        {
+            'team_id': team_id,
+            'team_name': team_name,
+            'team_description': team_description,
+            'start_year': start_year,
+            'start_month': start_month,
+            'end_year': end_year,
+            'end_month': end_month,
+            'start_date': start_date,
+            'end_date': end_date,
+            'duration_weeks': duration_weeks,
+            'team_roles': team_roles[team_id],
+            'cost_per_year': year_costs,
+            'total_team_cost': total_team_cost
+        }
+        for (team_id, team_name, team_description, start_year, start_month, end_year, end_month,
+             start_date, end_date, duration_weeks, year_costs, total_team_cost) in zip(
+            teams.index.tolist(),
+            teams['team_name'].tolist(),
+            teams['team_description'].tolist(),
+            teams['start_year'].tolist(),
+            teams['start_month'].tolist(),
+            teams['end_year'].tolist(),
+            teams['end_month'].tolist(),
+            start_dates,
+            end_dates,
+            teams['duration_weeks'].tolist(),
+            cost_per_year,
+            teams['total_team_cost'].tolist()
+        )
+    ]
+
+# Number of team documents converted per batch, and bytes or rows read per chunk, during streaming imports
+IMPORT_BATCH_SIZE = 5000
+IMPORT_CHUNK_BYTES = 1 << 20
+IMPORT_CHUNK_ROWS = 50000
+
+# Columns of a flat role table (CSV/Parquet import): one row per role, with the team fields repeated on every row
+ROLE_TABLE_TEAM_FIELDS = [
+    'team_id', 'team_name', 'team_description', 'start_year', 'start_month',
+    'end_year', 'end_month', 'start_date', 'end_date', 'duration_weeks'
+]
+ROLE_TABLE_ROLE_FIELDS = list(ROLE_DOCUMENT_SCHEMA)
+
+# Function to iterate over the team documents in a JSON array or JSON Lines file without loading it whole
+def iter_team_documents(binary_file, total_bytes=None, on_progress=None):
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    json_decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    bytes_read = 0
+    finished = False
+    need_more = True
+    array_mode = None
+    last_token = '['  # In an array: '[', ',' or 'element'
+    while True:
+        # Read the next chunk, keeping the unconsumed tail of the buffer
+        if need_more and not finished:
+            chunk = binary_file.read(IMPORT_CHUNK_BYTES)
+            finished = not chunk
+            bytes_read += len(chunk)
+            buffer = buffer[pos:] + text_decoder.decode(chunk, final=finished)
+            pos = 0
+            if on_progress and total_bytes:
+                on_progress(bytes_read / total_bytes)
+        need_more = False
+
+        # Skip whitespace
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos == len(buffer):
+            if finished:
+                if array_mode:
+                    raise ValueError("The JSON array is not closed.")
+                return
+            need_more = True
+            continue
+
+        # A file starting with '[' is a JSON array, anything else is JSON Lines
+        if array_mode is None:
+            array_mode = buffer[pos] == '['
+            if array_mode:
+                pos += 1
+            continue
+
+        if array_mode:
+            # Elements are separated by exactly one comma, with none before the first or after the last
+            if buffer[pos] == ']':
+                if last_token == ',':
+                    raise ValueError("The JSON array has a comma before its closing bracket.")
+                return
+            if buffer[pos] == ',':
+                if last_token != 'element':
+                    raise ValueError("The JSON array has a comma without an element before it.")
+                last_token = ','
+                pos += 1
+                continue
+            if last_token == 'element':
+                raise ValueError("The JSON array is missing a comma between elements.")
+            try:
+                document, end = json_decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if finished:
+                    raise
+                need_more = True  # The element is cut off at the end of the buffer
+                continue
+            last_token = 'element'
+        else:
+            end = buffer.find('\n', pos)
+            if end == -1:
+                if not finished:
+                    need_more = True
+                    continue
+                end = len(buffer)
+            document = json.loads(buffer[pos:end])
+        pos = end
+        yield document
+
+# Function to check that a team document has the structure the store expects; returns a problem description or None
+def validate_team_document(team):
+    if not isinstance(team, dict):
+        return "not a JSON object"
+    for field, field_type in TEAM_DOCUMENT_SCHEMA.items():
+        value = team.get(field)
+        if value is None:
+            continue
+        if field_type in ('int', 'float') and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            return f"'{field}' must be a number"
+        if field_type in ('str', 'date') and not isinstance(value, str):
+            return f"'{field}' must be a string"
+        if field_type == 'roles' and not (isinstance(value, list) and all(isinstance(role_info, dict) for role_info in value)):
+            return f"'{field}' must be a list of objects"
+        if field_type == 'year_costs' and not isinstance(value, dict):
+            return f"'{field}' must be an object"
+    for role_info in team.get('team_roles') or []:
+        count = role_info.get('count', 1.0)
+        if isinstance(count, bool) or not isinstance(count, (int, float)):
+            return "role 'count' must be a number"
+    return None
+
+# Function to flag teams whose start or end falls outside the years and months the editor supports
+def invalid_team_dates(teams):
+    valid = (
+        teams['start_year'].isin(list(YEAR_OPTIONS)) & teams['end_year'].isin(list(YEAR_OPTIONS))
+        & teams['start_month'].between(1, 12) & teams['end_month'].between(1, 12)
+    )
+    return ~valid.to_numpy()
+
+# Function to renumber a converted import batch after the parts imported so far, dropping teams with unsupported dates.
+# Returns each batch team's new team_id, or -1 for dropped teams
+def append_import_batch(batch_store, team_parts, role_parts, problems):
+    teams = batch_store['teams']
+    roles = batch_store['roles']
+    invalid = invalid_team_dates(teams)
+    for team_name in teams['team_name'][invalid]:
+        problems.append(f"Team '{team_name or 'Unnamed'}': dates outside {YEAR_OPTIONS[0]}-{YEAR_OPTIONS[-1]}")
+    roles = roles[~roles['team_id'].isin(teams.index[invalid])]
+    teams = teams[~invalid]
+
+    # Imported teams get consecutive ids and their calculated fields reset
+    team_offset = sum(len(part) for part in team_parts)
+    role_offset = sum(len(part) for part in role_parts)
+    new_team_ids = pd.Index(np.arange(team_offset, team_offset + len(teams)), dtype='int64', name='team_id')
+    roles = roles.assign(team_id=new_team_ids[teams.index.get_indexer(roles['team_id'])], role_cost=np.nan)
+    roles.index = pd.Index(np.arange(role_offset, role_offset + len(roles)), dtype='int64', name='role_id')
+    teams = teams.assign(total_team_cost=0.0)
+    teams.index = new_team_ids
+    team_parts.append(teams)
+    role_parts.append(roles)
+    batch_team_ids = np.full(len(invalid), -1, dtype=np.int64)
+    batch_team_ids[~invalid] = new_team_ids
+    return batch_team_ids
+
+# Function to assemble a team store from imported parts
+def team_store_from_import_parts(team_parts, role_parts):
+    store = create_team_store()
+    if team_parts:
+        store['teams'] = pd.concat(team_parts).astype(TEAM_COLUMNS)
+        # Roles added to teams from earlier chunks are moved next to the team's other roles
+        roles = pd.concat(role_parts).astype(ROLE_COLUMNS).sort_values('team_id', kind='stable')
+        roles.index = pd.Index(np.arange(len(roles)), dtype='int64', name='role_id')
+        store['roles'] = roles
+        store['costs'] = pd.DataFrame(index=store['teams'].index, dtype='float64')
+    return store
+
+# Function to import team documents as they stream in, validating and converting them in batches
+def import_team_documents(documents):
+    team_parts = []
+    role_parts = []
+    problems = []
+    batch = []
+    for position, team in enumerate(documents, start=1):
+        problem = validate_team_document(team)
+        if problem:
+            problems.append(f"Team {position}: {problem}")
+        else:
+            batch.append(team)
+        if len(batch) == IMPORT_BATCH_SIZE:
+            append_import_batch(team_store_from_records(batch), team_parts, role_parts, problems)
+            batch = []
+    if batch:
+        append_import_batch(team_store_from_records(batch), team_parts, role_parts, problems)
+    return team_store_from_import_parts(team_parts, role_parts), problems
+
+# Function to iterate over chunks of a CSV or Parquet role table, reading only the known columns
+def iter_role_table_chunks(binary_file, file_type, total_bytes=None, on_progress=None):
+    known_columns = ROLE_TABLE_TEAM_FIELDS + ROLE_TABLE_ROLE_FIELDS
+    if file_type == 'parquet':
+        parquet_file = pq.ParquetFile(binary_file)
+        columns = [col for col in parquet_file.schema_arrow.names if col in known_columns]
+        total_rows = max(parquet_file.metadata.num_rows, 1)
+        rows_read = 0
+        for batch in parquet_file.iter_batches(batch_size=IMPORT_CHUNK_ROWS, columns=columns):
+            rows_read += batch.num_rows
+            if on_progress:
+                on_progress(rows_read / total_rows)
+            yield batch.to_pandas()
+    else:
+        try:
+            reader = pd.read_csv(binary_file, chunksize=IMPORT_CHUNK_ROWS, usecols=lambda col: col in known_columns)
+        except pd.errors.EmptyDataError:
+            raise ValueError("The CSV file is empty or has no header row.")
+        for chunk in reader:
+            if on_progress and total_bytes:
+                on_progress(binary_file.tell() / total_bytes)
+            yield chunk
+
+# Function to import a flat role table chunk by chunk; rows are grouped into teams by team_id, or team_name without it.
+# Each chunk is converted as it arrives: teams first seen in it become new teams, and rows of teams seen in earlier
+# chunks (such as a team spanning the chunk boundary) are added to those teams
+def import_role_table(chunks):
+    team_parts = []
+    role_parts = []
+    problems = []
+    team_key = None
+    skipped_rows = 0
+    invalid_count_rows = 0
+    team_ids_by_key = {}  # -1 marks teams dropped for their dates
+    for rows in chunks:
+        if team_key is None:
+            missing = [col for col in ('role', 'resource_type') if col not in rows.columns]
+            team_key = 'team_id' if 'team_id' in rows.columns else 'team_name'
+            if team_key not in rows.columns:
+                missing.append('team_id or team_name')
+            if missing:
+                raise ValueError(f"Role table is missing columns: {', '.join(missing)}")
+
+        keyed = rows[team_key].notna().to_numpy()
+        skipped_rows += int((~keyed).sum())
+        rows = rows[keyed]
+
+        # Blank, non-numeric and negative FTE counts are skipped, as in the role editor
+        if 'count' in rows.columns:
+            counts = pd.to_numeric(rows['count'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            valid_count = counts >= 0
+            invalid_count_rows += int((~valid_count).sum())
+            rows = rows[valid_count]
+            counts = counts[valid_count]
+        else:
+            counts = np.ones(len(rows))
+        seen = rows[team_key].isin(list(team_ids_by_key)).to_numpy()
+
+        # Rows of teams converted in an earlier chunk extend their roles
+        if seen.any():
+            seen_rows = rows[seen]
+            seen_team_ids = np.array([team_ids_by_key[key] for key in seen_rows[team_key].tolist()], dtype=np.int64)
+            kept = seen_team_ids >= 0
+            role_offset = sum(len(part) for part in role_parts)
+            role_parts.append(pd.DataFrame({
+                'team_id': seen_team_ids[kept],
+                'role': seen_rows['role'].to_numpy()[kept],
+                'resource_type': seen_rows['resource_type'].to_numpy()[kept],
+                'count': counts[seen][kept],
+                'role_cost': np.nan
+            }, index=pd.Index(np.arange(role_offset, role_offset + int(kept.sum())), dtype='int64', name='role_id')))
+
+        # Teams first seen in this chunk take their fields from their first row
+        new_rows = rows[~seen]
+        if not len(new_rows):
+            continue
+        team_position, team_keys = pd.factorize(new_rows[team_key], sort=False)
+        _, first_rows = np.unique(team_position, return_index=True)
+        team_rows = new_rows.iloc[first_rows]
+        columns = {
+            field: team_rows[field].tolist() if field in team_rows.columns else [None] * len(team_rows)
+            for field in TEAM_DOCUMENT_SCHEMA
+        }
+        columns['team_id'] = [None] * len(team_rows)
+        role_columns = {
+            'team_position': team_position,
+            'role': new_rows['role'].tolist(),
+            'resource_type': new_rows['resource_type'].tolist(),
+            'count': counts[~seen]
+        }
+        batch_team_ids = append_import_batch(team_store_from_columns(columns, role_columns), team_parts, role_parts, problems)
+        team_ids_by_key.update(zip(team_keys.tolist(), batch_team_ids.tolist()))
+
+    if skipped_rows:
+        problems.append(f"{skipped_rows} role rows without a {team_key} were skipped")
+    if invalid_count_rows:
+        problems.append(f"{invalid_count_rows} role rows with a blank, non-numeric or negative count were skipped")
+    return team_store_from_import_parts(team_parts, role_parts), problems
+
+# Function to import an uploaded teams file (JSON array, JSON Lines, CSV or Parquet role table)
+def import_teams_file(binary_file, file_name, total_bytes=None, on_progress=None):
+    file_type = file_name.rsplit('.', 1)[-1].lower()
+    if file_type in ('csv', 'parquet'):
+        return import_role_table(iter_role_table_chunks(binary_file, file_type, total_bytes, on_progress))
+    return import_team_documents(iter_team_documents(binary_file, total_bytes, on_progress))
+
+# Arrow schemas for persisting the team store; dates are stored as native date32 columns
+TEAM_TABLE_SCHEMA = pa.schema([
+    ('team_id', pa.int64()),
+    ('team_name', pa.string()),
+    ('team_description', pa.string()),
+    ('start_date', pa.date32()),
+    ('end_date', pa.date32()),
+    ('duration_weeks', pa.float64()),
+    ('total_team_cost', pa.float64())
+])
+ROLE_TABLE_SCHEMA = pa.schema([
+    ('role_id', pa.int64()),
+    ('team_id', pa.int64()),
+    ('role', pa.string()),
+    ('resource_type', pa.string()),
+    ('count', pa.float64()),
+    ('role_cost', pa.float64())
+])
+COST_TABLE_SCHEMA = pa.schema([
+    ('team_id', pa.int64()),
+    ('year', pa.int64()),
+    ('cost', pa.float64())
+])
+
+# Function to convert one team store table to a typed Arrow table
+def store_table_to_arrow(store, name):
+    if name == 'teams':
+        teams = store['teams']
+        return pa.table({
+            'team_id': teams.index.to_numpy(),
+            'team_name': teams['team_name'].to_numpy(),
+            'team_description': teams['team_description'].to_numpy(),
+            'start_date': month_start_dates(teams['start_year'], teams['start_month']),
+            'end_date': month_start_dates(teams['end_year'], teams['end_month']),
+            'duration_weeks': teams['duration_weeks'].to_numpy(),
+            'total_team_cost': teams['total_team_cost'].to_numpy()
+        }, schema=TEAM_TABLE_SCHEMA)
+    if name == 'roles':
+        roles = store['roles']
+        return pa.table({
+            'role_id': roles.index.to_numpy(),
+            'team_id': roles['team_id'].to_numpy(),
+            'role': roles['role'].to_numpy(),
+            'resource_type': roles['resource_type'].to_numpy(),
+            'count': roles['count'].to_numpy(),
+            'role_cost': roles['role_cost'].to_numpy()
+        }, schema=ROLE_TABLE_SCHEMA)
+
+    # The team x year cost table is stored in long form, skipping years a team does not run in
+    costs = store['costs']
+    team_rows, year_cols = np.nonzero(costs.notna().to_numpy())
+    return pa.table({
+        'team_id': costs.index.to_numpy()[team_rows],
+        'year': costs.columns.to_numpy(dtype=np.int64)[year_cols],
+        'cost': costs.to_numpy(dtype=np.float64)[team_rows, year_cols]
+    }, schema=COST_TABLE_SCHEMA)
+
+# Function to rebuild the team store from typed Arrow tables
+def team_store_from_arrow(tables):
+    team_table = tables['teams']
+    start_months = team_table['start_date'].cast(pa.int32()).to_numpy().astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    end_months = team_table['end_date'].cast(pa.int32()).to_numpy().astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    teams = pd.DataFrame({
+        'team_name': team_table['team_name'].to_numpy(zero_copy_only=False),
+        'team_description': team_table['team_description'].to_numpy(zero_copy_only=False),
+        'start_year': start_months // 12 + 1970,
+        'start_month': start_months % 12 + 1,
+        'end_year': end_months // 12 + 1970,
+        'end_month': end_months % 12 + 1,
+        'duration_weeks': team_table['duration_weeks'].to_numpy(),
+        'total_team_cost': team_table['total_team_cost'].to_numpy()
+    }, index=pd.Index(team_table['team_id'].to_numpy(), dtype='int64', name='team_id')).astype(TEAM_COLUMNS)
+
+    role_table = tables['roles']
+    roles = pd.DataFrame(
+        {col: role_table[col].to_numpy(zero_copy_only=False) for col in ROLE_COLUMNS},
+        index=pd.Index(role_table['role_id'].to_numpy(), dtype='int64', name='role_id')
+    ).astype(ROLE_COLUMNS)
+
+    cost_table = tables['costs'].to_pandas()
+    costs = cost_table.pivot(index='team_id', columns='year', values='cost').reindex(teams.index)
+    costs.columns.name = None
+    return {'teams': teams, 'roles': roles, 'costs': costs.astype('float64')}
+
+# Function to serialize an Arrow table to IPC stream bytes
+def arrow_to_ipc(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+# Function to read an Arrow table back from IPC stream bytes
+def arrow_from_ipc(data):
+    return pa.ipc.open_stream(data).read_all()
+
+# Function to add a team (and its roles) to the team store, returning the new team_id
+def add_store_team(store, team):
+    teams = store['teams']
+    team_id = int(teams.index.max()) + 1 if len(teams) else 0
+    teams.loc[team_id] = [team.get(col, 0) for col in TEAM_COLUMNS]
+    store['teams'] = teams.astype(TEAM_COLUMNS)
+    store['costs'] = store['costs'].reindex(store['teams'].index)
+    for role_info in team.get('team_roles', []):
+        add_store_role(store, team_id, role_info)
+    return team_id
+
+# Function to append a role row for a team in the team store
+def add_store_role(store, team_id, role_info):
+    roles = store['roles']
+    role_id = int(roles.index.max()) + 1 if len(roles) else 0
+    roles.loc[role_id] = [team_id, role_info['role'], role_info['resource_type'], role_info['count'], np.nan]
+    store['roles'] = roles.astype(ROLE_COLUMNS)
+
+# Function to remove a team and its roles from the team store
+def delete_store_team(store, team_id):
+    store['teams'] = store['teams'].drop(index=team_id)
+    store['roles'] = store['roles'][store['roles']['team_id'] != team_id]
+    store['costs'] = store['costs'].drop(index=team_id, errors='ignore')
+
+# Function to grow or shrink a team's role rows to num_roles, returning the team's role_ids
+def resize_store_team_roles(store, team_id, role_ids, num_roles, default_role):
+    role_ids = list(role_ids)
+    while len(role_ids) < num_roles:
+        add_store_role(store, team_id, default_role)
+        role_ids.append(int(store['roles'].index[-1]))
+    if len(role_ids) > num_roles:
+        store['roles'] = store['roles'].drop(index=role_ids[num_roles:])
+        role_ids = role_ids[:num_roles]
+    return role_ids
+
+# Bulk role table columns and the role store columns they edit
+ROLE_EDIT_COLUMNS = {'team_id': 'team_id', 'Role': 'role', 'Resource Type': 'resource_type', 'FTE': 'count'}
+
+# Function to build the bulk role table for the given teams: one row per role, grouped by team in team order
+def role_edit_frame(store, team_ids):
+    roles = store['roles']
+    roles = roles[roles['team_id'].isin(team_ids)]
+    roles = roles.iloc[np.argsort(pd.Index(team_ids).get_indexer(roles['team_id']), kind='stable')]
+    display_names = pd.Series(team_display_names(store['teams']), index=store['teams'].index)
+    return pd.DataFrame({
+        'team_id': roles['team_id'].to_numpy(),
+        'Team': display_names.loc[roles['team_id']].to_numpy(),
+        'Role': roles['role'].to_numpy(),
+        'Resource Type': roles['resource_type'].to_numpy(),
+        'FTE': roles['count'].to_numpy()
+    }, index=roles.index)
+
+# Function to apply a batch of bulk role table edits to the team store in one pass. Edits use the table
+# editor's diff format: edited_rows by row position, added_rows and deleted_rows positions. Rows with an unknown
+# team, a role/resource type without a salary or an invalid FTE count are skipped and reported as problems
+def apply_role_edits(store, role_ids, edits, salaries):
+    teams = store['teams']
+    roles = store['roles']
+    role_ids = pd.Index(role_ids)
+    edit_columns = list(ROLE_EDIT_COLUMNS.values())
+    problems = []
+
+    # Edited rows take their unchanged cells from the store; deleting a row overrides its edits
+    deleted_positions = sorted(int(pos) for pos in edits.get('deleted_rows', []))
+    edited_rows = {
+        int(pos): values for pos, values in edits.get('edited_rows', {}).items() if int(pos) not in deleted_positions
+    }
+    changes = pd.DataFrame.from_dict(edited_rows, orient='index').rename(columns=ROLE_EDIT_COLUMNS)
+    changes = changes.reindex(columns=edit_columns)
+    changes.index = role_ids[changes.index] if len(changes) else pd.Index([], dtype='int64')
+    updated = roles.loc[changes.index, edit_columns].astype(object)
+    updated = updated.mask(changes.notna(), changes)
+
+    added = pd.DataFrame(list(edits.get('added_rows', [])), dtype=object).rename(columns=ROLE_EDIT_COLUMNS)
+    added = added.reindex(columns=edit_columns)
+    deleted_ids = role_ids[deleted_positions]
+
+    # Validate edited and added rows together
+    candidates = pd.concat([updated.assign(source='edited'), added.assign(source='added')], ignore_index=True)
+    team_ids = pd.to_numeric(candidates['team_id'], errors='coerce')
+    counts = pd.to_numeric(candidates['count'], errors='coerce')
+    rates = lookup_yearly_salaries(candidates['role'], candidates['resource_type'], salaries)
+    valid_team = team_ids.isin(teams.index).to_numpy()
+    valid_rate = ~np.isnan(rates)
+    valid_count = (counts >= 0).to_numpy()
+    for pos in np.flatnonzero(~(valid_team & valid_rate & valid_count)):
+        row = candidates.iloc[pos]
+        reason = "unknown team" if not valid_team[pos] else "no salary for role" if not valid_rate[pos] else "invalid FTE count"
+        problems.append(f"Skipped {row['source']} row ({row['team_id']}, {row['role']}, {row['resource_type']}, {row['count']}): {reason}.")
+    valid = valid_team & valid_rate & valid_count
+    candidates = candidates.assign(team_id=team_ids, count=counts)[valid]
+    valid_updates = candidates[candidates['source'] == 'edited']
+    valid_additions = candidates[candidates['source'] == 'added']
+    updated_ids = updated.index[valid[:len(updated)]]
+
+    # Teams whose roles changed, before and after the batch
+    touched_ids = pd.Index(pd.concat([
+        roles.loc[updated_ids.union(deleted_ids), 'team_id'],
+        valid_updates['team_id'],
+        valid_additions['team_id']
+    ]).astype('int64').unique())
+
+    for col in edit_columns:
+        roles.loc[updated_ids, col] = valid_updates[col].to_numpy().astype(ROLE_COLUMNS[col])
+    roles = roles.drop(index=deleted_ids)
+    next_role_id = int(store['roles'].index.max()) + 1 if len(store['roles']) else 0
+    new_roles = valid_additions[edit_columns].assign(role_cost=np.nan)
+    new_roles.index = pd.RangeIndex(next_role_id, next_role_id + len(new_roles), name='role_id')
+    store['roles'] = pd.concat([roles, new_roles]).astype(ROLE_COLUMNS)
+
+    return {
+        'updated': len(updated_ids),
+        'added': len(new_roles),
+        'deleted': len(deleted_ids),
+        'team_ids': touched_ids,
+        'problems': problems
+    }
+
+# Function to look up the yearly salary of each (role, resource_type) pair; NaN where there is none
+def lookup_yearly_salaries(roles, resource_types, salaries):
+    salary_table = pd.Series({
+        (role, resource_type): salary
+        for role, role_salaries in salaries.items()
+        for resource_type, salary in role_salaries.items()
+    }, dtype='float64')
+    pairs = pd.MultiIndex.from_arrays([np.asarray(roles, dtype=object), np.asarray(resource_types, dtype=object)])
+    return salary_table.reindex(pairs).to_numpy(dtype=np.float64)
+
+# Months covered by salary schedules: the years offered by the team editor. Teams running outside them are
+# costed at the first or last scheduled month's salaries
+SCHEDULE_MONTHS = np.arange(np.datetime64(f"{YEAR_OPTIONS[0]}-01"), np.datetime64(f"{YEAR_OPTIONS[-1] + 1}-01"))
+
+# Function to parse a period label, a year ('2026') or a month ('2026-03'), into its first month
+def period_start_month(label):
+    label = str(label)
+    return np.datetime64(label if '-' in label else f"{label}-01", 'M')
+
+# Function to build a salary schedule: a dense role x resource_type x month tensor of yearly salaries. The salary
+# table gives each cell's salary in the base year; annual escalation percentages (per role, else the default)
+# compound every January from it, and overrides reset a cell's salary from their year or month on, with escalation
+# continuing from there. Returns None for a flat schedule, so costs keep their constant-rate path
+def build_salary_schedule(salaries, base_year, escalation=None, overrides=(), default_escalation=0.0):
+    escalation = {role: pct for role, pct in (escalation or {}).items() if pct is not None and not pd.isna(pct)}
+    if not overrides and not default_escalation and not any(escalation.values()):
+        return None
+    roles = list(salaries)
+    resource_types = list(dict.fromkeys(resource_type for role_salaries in salaries.values() for resource_type in role_salaries))
+
+    # Each cell's anchors are (first month, yearly salary) pairs: the base salary, then its overrides
+    anchors = {
+        (role, resource_type): [(np.datetime64(f"{base_year}-01"), float(salary))]
+        for role, role_salaries in salaries.items()
+        for resource_type, salary in role_salaries.items()
+    }
+    for override in overrides:
+        cell = (override['role'], override['resource_type'])
+        if cell not in anchors:
+            raise ValueError(f"There is no {cell[0]} ({cell[1]}) salary to override.")
+        anchors[cell].append((period_start_month(override['from']), float(override['salary'])))
+
+    years = SCHEDULE_MONTHS.astype('datetime64[Y]').astype(np.int64)
+    rates = np.full((len(roles), len(resource_types), len(SCHEDULE_MONTHS)), np.nan)
+    for (role, resource_type), cell_anchors in anchors.items():
+        cell_anchors.sort(key=lambda anchor: anchor[0])
+        anchor_months = np.array([anchor[0] for anchor in cell_anchors])
+        anchor_salaries = np.array([anchor[1] for anchor in cell_anchors])
+        positions = np.clip(np.searchsorted(anchor_months, SCHEDULE_MONTHS, side='right') - 1, 0, None)
+        growth = 1 + escalation.get(role, default_escalation) / 100
+        anchor_years = anchor_months.astype('datetime64[Y]').astype(np.int64)
+        rates[roles.index(role), resource_types.index(resource_type)] = anchor_salaries[positions] * growth ** (years - anchor_years[positions])
+
+    return {
+        'roles': roles,
+        'resource_types': resource_types,
+        'months': SCHEDULE_MONTHS,
+        'rates': rates,
+        'key': json.dumps([salaries, base_year, escalation, list(overrides), default_escalation], sort_keys=True, default=str)
+    }
+
+# Function to find each (role, resource_type) pair's cell in a salary schedule: flat cell positions, -1 where there is none
+def schedule_cell_positions(roles, resource_types, schedule):
+    role_codes = pd.Index(schedule['roles']).get_indexer(np.asarray(roles, dtype=object))
+    type_codes = pd.Index(schedule['resource_types']).get_indexer(np.asarray(resource_types, dtype=object))
+    return np.where((role_codes >= 0) & (type_codes >= 0), role_codes * len(schedule['resource_types']) + type_codes, -1)
+
+# Function to look up the yearly salaries of each (role, resource_type) pair: one per pair, or pairs x schedule
+# months with a salary schedule. NaN where there is none
+def lookup_salary_rates(roles, resource_types, salaries, schedule=None):
+    if schedule is None:
+        return lookup_yearly_salaries(roles, resource_types, salaries)
+    cells = schedule_cell_positions(roles, resource_types, schedule)
+    cell_rates = schedule['rates'].reshape(-1, len(schedule['months']))
+    return np.where((cells >= 0)[:, None], cell_rates[np.clip(cells, 0, None)], np.nan)
+
+# Function to fingerprint the salary each (role, resource_type) pair is costed at: the salary itself, or a hash
+# of its scheduled salaries
+def lookup_salary_fingerprints(roles, resource_types, salaries, schedule=None):
+    if schedule is None:
+        return lookup_yearly_salaries(roles, resource_types, salaries)
+    cells = schedule_cell_positions(roles, resource_types, schedule)
+    cell_hashes = pd.util.hash_pandas_object(
+        pd.DataFrame(schedule['rates'].reshape(-1, len(schedule['months']))), index=False
+    ).to_numpy()
+    return np.where(cells >= 0, cell_hashes[np.clip(cells, 0, None)], np.uint64(0))
+
+# Function to map months onto the columns of a month-varying rate table, clamped to its first and last month
+def rate_month_columns(months, rate_months):
+    return np.clip((months.astype('datetime64[M]') - rate_months[0]).astype(np.int64), 0, len(rate_months) - 1)
+
+# Function to put per-team or per-role rates in a Series, or in a DataFrame with one column per month when they vary by month
+def rate_table(values, index):
+    if values.ndim == 2:
+        return pd.DataFrame(values, index=index)
+    return pd.Series(values, index=index)
+
+# Function to calculate costs for a team per year based on yearly salaries
+def calculate_team_cost_per_year(team_roles, start_date, end_date, salaries):
+    cost_per_year = {}
+
+    # Convert start_date and end_date to pd.Timestamp
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+
+    # Generate a list of years covered by the date range
+    years = pd.date_range(start=start_date, end=end_date).year.unique()
+
+    for year in years:
+        # Define start and end of the year to calculate partial or full year overlap
+        year_start = pd.Timestamp(f"{year}-01-01")
+        year_end = pd.Timestamp(f"{year}-12-31")
+
+        # Calculate overlapping period within the year
+        overlap_start = max(start_date, year_start)
+        overlap_end = min(end_date, year_end)
+        overlap_days = (overlap_end - overlap_start).days + 1
+        overlap_fraction = overlap_days / 365.25  # Fraction of the year
+
+        # Calculate the cost for each role in this year
+        yearly_cost = 0
+        for role, resource_type, count in zip(team_roles['role'], team_roles['resource_type'], team_roles['count']):
+            # Validate role and resource_type
+            if not role or not resource_type:
+                continue  # Skip if role or resource_type is empty
+
+            yearly_salary = salaries.get(role, {}).get(resource_type, None)
+            if yearly_salary is None:
+                continue  # Skip if no matching salary found
+
+            # Calculate cost as FTE count times the salary, adjusted for partial year
+            yearly_cost += count * yearly_salary * overlap_fraction
+
+        cost_per_year[year] = yearly_cost
+
+    return cost_per_year
+
+# Function to calculate cost breakdown by role
+def calculate_role_costs(team_roles, start_date, end_date, salaries):
+    # Convert start_date and end_date to pd.Timestamp
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+
+    duration_days = (end_date - start_date).days + 1  # Include end date
+    duration_fraction = duration_days / 365.25  # Fraction of a year
+
+    role_costs = {}
+    for role, resource_type, count in zip(team_roles['role'], team_roles['resource_type'], team_roles['count']):
+        # Validate role and resource_type
+        if not role or not resource_type:
+            continue  # Skip if role or resource_type is empty
+
+        yearly_salary = salaries.get(role, {}).get(resource_type, None)
+        if yearly_salary is None:
+            continue  # Skip if no matching salary found
+
+        # Calculate cost as FTE count times the salary, adjusted for partial year
+        cost = count * yearly_salary * duration_fraction
+        role_key = f"{role} ({resource_type})"
+        role_costs[role_key] = cost
+
+    return role_costs
+
+# Function to read the batched cost engine inputs for the given teams straight from the team store; with a
+# salary schedule, role rates are roles x schedule months
+def build_cost_inputs(store, team_ids, salaries, schedule=None):
+    teams = store['teams'].loc[team_ids]
+    roles = store['roles']
+    roles = roles[roles['team_id'].isin(team_ids)]
+
+    # Roles without a matching salary get a NaN rate and are priced at zero
+    role_team_index = teams.index.get_indexer(roles['team_id'])
+    role_rates = lookup_salary_rates(roles['role'], roles['resource_type'], salaries, schedule)
+    role_keys = (roles['role'].astype(str) + ' (' + roles['resource_type'].astype(str) + ')').tolist()
+
+    return {
+        'role_ids': roles.index.to_numpy(),
+        'role_team_index': role_team_index.astype(np.int64),
+        'role_counts': roles['count'].to_numpy(dtype=np.float64),
+        'role_rates': role_rates,
+        'role_keys': role_keys,
+        'start_dates': month_start_dates(teams['start_year'], teams['start_month']),
+        'end_dates': month_start_dates(teams['end_year'], teams['end_month']),
+        'rate_months': None if schedule is None else schedule['months']
+    }
+
+# Function to count the days each team is active in each year of a datetime64[Y] year index
+def calculate_year_overlap_days(start_dates, end_dates, year_index):
+    year_starts = year_index.astype('datetime64[D]')
+    year_ends = (year_index + 1).astype('datetime64[D]') - 1
+    overlap_start = np.maximum(start_dates[:, None], year_starts[None, :])
+    overlap_end = np.minimum(end_dates[:, None], year_ends[None, :])
+    return np.clip((overlap_end - overlap_start).astype(np.int64) + 1, 0, None)
+
+# Function to count the days each team is active in each month of a datetime64[M] month index
+def calculate_month_overlap_days(start_dates, end_dates, month_index):
+    month_starts = month_index.astype('datetime64[D]')
+    month_ends = (month_index + 1).astype('datetime64[D]') - 1
+    overlap_start = np.maximum(start_dates[:, None], month_starts[None, :])
+    overlap_end = np.minimum(end_dates[:, None], month_ends[None, :])
+    return np.clip((overlap_end - overlap_start).astype(np.int64) + 1, 0, None)
+
+# Function to calculate the team x year cost matrix for many teams in one vectorized pass. Role rates are yearly
+# salaries, or roles x rate_months when salaries follow a schedule
+def calculate_portfolio_costs(role_team_index, role_counts, role_rates, start_dates, end_dates, rate_months=None):
+    start_dates = np.asarray(start_dates, dtype='datetime64[D]')
+    end_dates = np.asarray(end_dates, dtype='datetime64[D]')
+    num_teams = len(start_dates)
+
+    # Years spanned by the portfolio; teams whose end precedes their start cover no years
+    covering = end_dates >= start_dates
+    if covering.any():
+        first_year = start_dates[covering].astype('datetime64[Y]').min()
+        last_year = end_dates[covering].astype('datetime64[Y]').max()
+        year_index = np.arange(first_year, last_year + 1)
+    else:
+        year_index = np.array([], dtype='datetime64[Y]')
+
+    if rate_months is not None:
+        return calculate_scheduled_portfolio_costs(
+            role_team_index, role_counts, role_rates, start_dates, end_dates, year_index, rate_months
+        )
+
+    # Overlap of every team with every year, as a fraction of a year
+    overlap_days = calculate_year_overlap_days(start_dates, end_dates, year_index)
+    overlap_fraction = overlap_days / 365.25
+
+    # Sum FTE count times salary per team, then spread it over the overlapping years
+    priced = ~np.isnan(role_rates)
+    role_yearly_costs = np.where(priced, role_counts * np.nan_to_num(role_rates), 0.0)
+    team_yearly_rates = np.bincount(role_team_index, weights=role_yearly_costs, minlength=num_teams)
+    cost_matrix = overlap_fraction * team_yearly_rates[:, None]
+
+    # Cost of each role over the whole team duration
+    duration_fraction = ((end_dates - start_dates).astype(np.int64) + 1) / 365.25
+    role_costs = role_yearly_costs * duration_fraction[role_team_index]
+
+    return {
+        'years': year_index.astype(np.int64) + 1970,
+        'team_rates': team_yearly_rates,
+        'role_rates': role_yearly_costs,
+        'overlap_fraction': overlap_fraction,
+        'active': overlap_days > 0,
+        'cost_matrix': cost_matrix,
+        'role_costs': role_costs,
+        'role_priced': priced
+    }
+
+# Function to calculate the team x year cost matrix with scheduled salaries: team rates per schedule month are
+# one product of the role counts and the rate tensor, costed over each team's days in each month and totalled per year
+def calculate_scheduled_portfolio_costs(role_team_index, role_counts, role_rates, start_dates, end_dates, year_index, rate_months):
+    num_teams = len(start_dates)
+    priced = ~np.isnan(role_rates).any(axis=1)
+    role_yearly_costs = np.where(priced[:, None], role_counts[:, None] * np.nan_to_num(role_rates), 0.0)
+    team_rates = np.zeros((num_teams, len(rate_months)))
+    np.add.at(team_rates, role_team_index, role_yearly_costs)
+
+    # Days of every team in every month of the covered years, costed at that month's rates
+    if len(year_index):
+        month_index = np.arange(year_index[0].astype('datetime64[M]'), (year_index[-1] + 1).astype('datetime64[M]'))
+    else:
+        month_index = np.array([], dtype='datetime64[M]')
+    month_days = calculate_month_overlap_days(start_dates, end_dates, month_index)
+    columns = rate_month_columns(month_index, rate_months)
+    month_costs = team_rates[:, columns] * month_days / 365.25
+    overlap_days = month_days.reshape(num_teams, len(year_index), 12).sum(axis=2)
+    role_costs = (role_yearly_costs[:, columns] * month_days[role_team_index]).sum(axis=1) / 365.25
+
+    return {
+        'years': year_index.astype(np.int64) + 1970,
+        'team_rates': team_rates,
+        'role_rates': role_yearly_costs,
+        'overlap_fraction': overlap_days / 365.25,
+        'active': overlap_days > 0,
+        'cost_matrix': month_costs.reshape(num_teams, len(year_index), 12).sum(axis=2),
+        'role_costs': role_costs,
+        'role_priced': priced
+    }
+
+# Function to create an empty cost cache holding the last computed costs and their input fingerprints
+def create_cost_cache():
+    role_index = pd.MultiIndex.from_arrays([[], []], names=['team_id', 'position'])
+    return {
+        'fingerprints': pd.Series(dtype='uint64'),
+        'salary_key': None,
+        'team_rates': pd.Series(dtype='float64'),
+        'role_rates': pd.Series(index=role_index, dtype='float64'),
+        'rate_months': None,
+        'calendar': None,
+        'costs': pd.DataFrame(index=pd.Index([], dtype='int64', name='team_id'), dtype='float64'),
+        'team_totals': pd.Series(dtype='float64'),
+        'role_costs': pd.Series(index=role_index, dtype='float64'),
+        'yearly_totals': pd.Series(dtype='float64'),
+        'year_team_counts': pd.Series(dtype='int64'),
+        'rate_uses': pd.DataFrame(
+            {'team_id': pd.Series(dtype='int64')},
+            index=pd.MultiIndex.from_arrays([[], []], names=['role', 'resource_type'])
+        )
+    }
+
+# Function to fingerprint each team's cost inputs: its dates, its roles and the salary entries they use
+def team_cost_fingerprints(store, team_ids, salaries, schedule=None):
+    teams = store['teams'].loc[team_ids]
+    roles = store['roles']
+    roles = roles[roles['team_id'].isin(team_ids)]
+
+    role_hashes = pd.util.hash_pandas_object(pd.DataFrame({
+        'position': roles.groupby('team_id').cumcount(),
+        'role': roles['role'],
+        'resource_type': roles['resource_type'],
+        'count': roles['count'],
+        'rate': lookup_salary_fingerprints(roles['role'], roles['resource_type'], salaries, schedule)
+    }), index=False).to_numpy()
+    date_hashes = pd.util.hash_pandas_object(
+        teams[['start_year', 'start_month', 'end_year', 'end_month']], index=False
+    ).to_numpy()
+
+    # Combine role hashes per team; uint64 addition wraps around
+    fingerprints = date_hashes.copy()
+    np.add.at(fingerprints, teams.index.get_indexer(roles['team_id']), role_hashes)
+    return pd.Series(fingerprints, index=teams.index)
+
+# Function to get the ids of teams that have at least one role and can be costed
+def costable_team_ids(store):
+    teams = store['teams']
+    return teams.index[teams.index.isin(store['roles']['team_id'])]
+
+# Function to empty the cost cache when salaries switch between constant and scheduled rates, whose cached
+# rates have different shapes; returns whether it was emptied
+def reset_cost_cache_for_schedule(cache, schedule):
+    if (schedule is None) == (cache['rate_months'] is None):
+        return False
+    cache.update(create_cost_cache())
+    if schedule is not None:
+        no_rates = np.zeros((0, len(schedule['months'])))
+        cache['team_rates'] = rate_table(no_rates, cache['team_rates'].index)
+        cache['role_rates'] = rate_table(no_rates, cache['role_rates'].index)
+        cache['rate_months'] = schedule['months']
+    return True
+
+# Function to get the key of the salaries and salary schedule that the cached costs were last checked against
+def cost_cache_salary_key(salaries, schedule=None):
+    return json.dumps([salaries, schedule and schedule['key']], sort_keys=True, default=str)
+
+# Function to bring the cost cache and the team store up to date, recomputing only teams whose inputs changed;
+# team_ids, when given, are the only teams edited since the last update, and only they are fingerprinted.
+# Without them (bulk imports) or after a salary change every team is fingerprinted.
+def update_portfolio_costs(store, cache, salaries, schedule=None, team_ids=None):
+    reset_cost_cache_for_schedule(cache, schedule)
+    salary_key = cost_cache_salary_key(salaries, schedule)
+    previous = cache['fingerprints']
+    if team_ids is None or cache['salary_key'] != salary_key:
+        team_ids = costable_team_ids(store)
+        removed_ids = previous.index.difference(team_ids)
+    else:
+        edited_ids = pd.Index(team_ids, dtype='int64').unique()
+        if not len(edited_ids):
+            return 0
+        role_team_ids = store['roles']['team_id']
+        team_ids = edited_ids[edited_ids.isin(store['teams'].index) & edited_ids.isin(role_team_ids[role_team_ids.isin(edited_ids)])]
+        removed_ids = edited_ids.difference(team_ids).intersection(previous.index)
+
+    # Dirty teams are new teams and teams whose fingerprint changed
+    fingerprints = team_cost_fingerprints(store, team_ids, salaries, schedule)
+    known = team_ids.isin(previous.index)
+    unchanged = np.zeros(len(team_ids), dtype=bool)
+    unchanged[known] = previous.loc[team_ids[known]].to_numpy() == fingerprints[known].to_numpy()
+    dirty_ids = team_ids[~unchanged]
+
+    refresh_team_costs(store, cache, dirty_ids, fingerprints.loc[dirty_ids], removed_ids, salaries, schedule)
+    cache['salary_key'] = salary_key
+    return len(dirty_ids)
+
+# Function to recompute the teams that depend on a salary cell after it changed, returning their team_ids
+def propagate_salary_change(store, cache, role, resource_type, salaries, schedule=None):
+    if reset_cost_cache_for_schedule(cache, schedule):
+        update_portfolio_costs(store, cache, salaries, schedule)
+        return costable_team_ids(store)
+    # Once every changed cell is propagated the cache matches the new salaries, and the next update need not
+    # fingerprint every team again
+    rate_uses = cache['rate_uses']
+    if (role, resource_type) not in rate_uses.index:
+        cache['salary_key'] = cost_cache_salary_key(salaries, schedule)
+        return pd.Index([], dtype='int64')
+    affected_ids = pd.Index(rate_uses.loc[[(role, resource_type)], 'team_id'].unique())
+
+    # Affected teams that were deleted or lost all roles since the last run drop out of the cache
+    team_ids = costable_team_ids(store)
+    dirty_ids = affected_ids.intersection(team_ids)
+    refresh_team_costs(
+        store, cache, dirty_ids,
+        team_cost_fingerprints(store, dirty_ids, salaries, schedule),
+        affected_ids.difference(team_ids),
+        salaries,
+        schedule
+    )
+    cache['salary_key'] = cost_cache_salary_key(salaries, schedule)
+    return affected_ids
+
+# Function to recompute the dirty teams and fold them into the cost cache, its aggregates and the team store
+def refresh_team_costs(store, cache, dirty_ids, dirty_fingerprints, removed_ids, salaries, schedule=None):
+    teams = store['teams']
+    roles = store['roles']
+    previous = cache['fingerprints']
+    stale_ids = dirty_ids.union(removed_ids)
+
+    # Take the stale teams' old costs out of the yearly totals
+    old_costs = cache['costs'].loc[cache['costs'].index.intersection(stale_ids)]
+    yearly_totals = cache['yearly_totals'].sub(old_costs.sum(), fill_value=0.0)
+    year_team_counts = cache['year_team_counts'].sub(old_costs.notna().sum(), fill_value=0)
+
+    # Recompute only the dirty teams with the batched engine
+    cost_inputs = build_cost_inputs(store, dirty_ids, salaries, schedule)
+    portfolio_costs = calculate_portfolio_costs(
+        cost_inputs['role_team_index'],
+        cost_inputs['role_counts'],
+        cost_inputs['role_rates'],
+        cost_inputs['start_dates'],
+        cost_inputs['end_dates'],
+        cost_inputs['rate_months']
+    )
+    active = portfolio_costs['active']
+    year_mask = active.any(axis=0)
+    new_costs = pd.DataFrame(
+        np.where(active, portfolio_costs['cost_matrix'], np.nan)[:, year_mask],
+        index=pd.Index(dirty_ids, dtype='int64', name='team_id'),
+        columns=portfolio_costs['years'][year_mask]
+    )
+    dirty_roles = roles.loc[cost_inputs['role_ids']]
+    new_role_costs = pd.Series(
+        np.where(portfolio_costs['role_priced'], portfolio_costs['role_costs'], np.nan),
+        index=pd.MultiIndex.from_arrays(
+            [dirty_roles['team_id'], dirty_roles.groupby('team_id').cumcount()],
+            names=['team_id', 'position']
+        )
+    )
+
+    # Add the new costs back in; years no team runs in any more drop out
+    yearly_totals = yearly_totals.add(new_costs.sum(), fill_value=0.0)
+    year_team_counts = year_team_counts.add(new_costs.notna().sum(), fill_value=0).astype('int64')
+    covered_years = year_team_counts.index[year_team_counts.to_numpy() > 0]
+    costs = pd.concat([cache['costs'].drop(index=old_costs.index), new_costs])
+    kept_roles = ~cache['role_costs'].index.get_level_values('team_id').isin(stale_ids)
+
+    cache['fingerprints'] = pd.concat([previous.drop(index=stale_ids, errors='ignore'), dirty_fingerprints])
+    cache['costs'] = costs.reindex(columns=covered_years.sort_values())
+    cache['team_totals'] = pd.concat([
+        cache['team_totals'].drop(index=stale_ids, errors='ignore'),
+        pd.Series(portfolio_costs['cost_matrix'].sum(axis=1), index=dirty_ids)
+    ])
+    cache['role_costs'] = pd.concat([cache['role_costs'][kept_roles], new_role_costs])
+    new_role_rates = portfolio_costs['role_rates'].copy()
+    new_role_rates[~portfolio_costs['role_priced']] = np.nan
+    cache['team_rates'] = pd.concat([
+        cache['team_rates'].drop(index=stale_ids, errors='ignore'),
+        rate_table(portfolio_costs['team_rates'], dirty_ids)
+    ])
+    cache['role_rates'] = pd.concat([
+        cache['role_rates'][kept_roles],
+        rate_table(new_role_rates, new_role_costs.index)
+    ])
+    if len(stale_ids):
+        cache['calendar'] = None
+    cache['yearly_totals'] = yearly_totals.loc[covered_years].sort_index()
+    cache['year_team_counts'] = year_team_counts.loc[covered_years].sort_index()
+
+    # Reverse index from each salary cell to the teams whose costs use it
+    rate_uses = cache['rate_uses']
+    new_uses = dirty_roles[['role', 'resource_type', 'team_id']].drop_duplicates()
+    cache['rate_uses'] = pd.concat([
+        rate_uses[~rate_uses['team_id'].isin(stale_ids)],
+        new_uses.set_index(['role', 'resource_type'])
+    ]).sort_index()
+
+    # Write the cached costs back into the team store
+    store['costs'] = cache['costs'].reindex(teams.index)
+    teams['total_team_cost'] = cache['team_totals'].reindex(teams.index, fill_value=0.0)
+    role_positions = pd.MultiIndex.from_arrays([roles['team_id'], roles.groupby('team_id').cumcount()])
+    roles['role_cost'] = cache['role_costs'].reindex(role_positions).to_numpy()
+
+# Cost granularities the summaries can roll up to, as months per period
+GRANULARITIES = {'Month': 1, 'Quarter': 3, 'Year': 12}
+
+# Function to build the month-index calendar: a contiguous month axis, each team's active days and the
+# portfolio's cumulative cost at every day and month boundary. Team rates are yearly, or teams x rate_months
+def build_month_calendar(start_dates, end_dates, team_rates, rate_months=None):
+    start_dates = np.asarray(start_dates, dtype='datetime64[D]')
+    end_dates = np.asarray(end_dates, dtype='datetime64[D]')
+    start_days = start_dates.astype(np.int64)
+    durations = np.clip(end_dates.astype(np.int64) - start_days + 1, 0, None)
+    covering = durations > 0
+    team_rates = np.asarray(team_rates, dtype=np.float64)
+    calendar = {
+        'months': np.array([], dtype='datetime64[M]'),
+        'start_days': start_days,
+        'durations': durations,
+        'team_rates': team_rates,
+        'rate_months': rate_months,
+        'first_day': 0,
+        'cumulative_daily_costs': np.zeros(1),
+        'monthly_costs': np.array([], dtype=np.float64),
+        'cumulative_costs': np.zeros(1)
+    }
+    if not covering.any():
+        return calendar
+
+    first_month = start_dates[covering].astype('datetime64[M]').min()
+    last_month = end_dates[covering].astype('datetime64[M]').max()
+    boundary_days = np.arange(first_month, last_month + 2).astype('datetime64[D]').astype(np.int64)
+    first_day = boundary_days[0]
+    num_days = boundary_days[-1] - first_day
+
+    # Daily portfolio rate from a difference array over each team's contiguous active days
+    if rate_months is None:
+        rates = np.where(covering, team_rates, 0.0)
+        offsets = np.where(covering, start_days - first_day, 0)
+        step_ends = offsets + np.where(covering, durations, 0)
+    else:
+        # Month-varying rates step at every month a team is active in
+        segment_starts = np.maximum(start_days[:, None], boundary_days[None, :-1])
+        segment_ends = np.minimum((start_days + durations)[:, None], boundary_days[None, 1:])
+        active = segment_ends > segment_starts
+        rates = team_rates[:, rate_month_columns(np.arange(first_month, last_month + 1), rate_months)][active]
+        offsets = segment_starts[active] - first_day
+        step_ends = segment_ends[active] - first_day
+    rate_steps = (
+        np.bincount(offsets, weights=rates, minlength=num_days + 1)
+        - np.bincount(step_ends, weights=rates, minlength=num_days + 1)
+    )
+    cumulative_daily_costs = np.concatenate([[0.0], np.cumsum(np.cumsum(rate_steps)[:num_days] / 365.25)])
+
+    # Month boundaries are samples of the daily cumulative costs
+    cumulative_costs = cumulative_daily_costs[boundary_days - first_day]
+    calendar['months'] = np.arange(first_month, last_month + 1)
+    calendar['first_day'] = first_day
+    calendar['cumulative_daily_costs'] = cumulative_daily_costs
+    calendar['monthly_costs'] = np.diff(cumulative_costs)
+    calendar['cumulative_costs'] = cumulative_costs
+    return calendar
+
+# Function to split the calendar's months into month, quarter or (fiscal) year periods: boundary months and labels
+def calendar_periods(calendar, granularity, fiscal_year_start=1):
+    months = calendar['months']
+    if not len(months):
+        return np.array([], dtype='datetime64[M]'), []
+    step = GRANULARITIES[granularity]
+    offset = fiscal_year_start - 1
+
+    # Period starts are aligned to the fiscal year start; fiscal years are named after the year they end in
+    month_numbers = months.astype(np.int64)
+    first = (month_numbers[0] - offset) // step * step + offset
+    last = (month_numbers[-1] - offset) // step * step + offset + step
+    boundaries = np.arange(first, last + 1, step)
+    period_starts = boundaries[:-1]
+    if granularity == 'Month':
+        labels = np.datetime_as_string(period_starts.astype('datetime64[M]')).tolist()
+    else:
+        fiscal_months = period_starts - offset
+        fiscal_years = fiscal_months // 12 + 1970 + (1 if offset else 0)
+        prefix = 'FY' if offset else ''
+        if granularity == 'Year':
+            labels = [f"{prefix}{year}" for year in fiscal_years]
+        else:
+            labels = [f"{prefix}{year} Q{quarter}" for year, quarter in zip(fiscal_years, fiscal_months % 12 // 3 + 1)]
+    return boundaries.astype('datetime64[M]'), labels
+
+# Function to total the portfolio over each period: two lookups into the cumulative costs per period
+def portfolio_period_costs(calendar, boundaries):
+    if not len(calendar['months']):
+        return np.zeros(max(len(boundaries) - 1, 0))
+    positions = np.clip((boundaries - calendar['months'][0]).astype(np.int64), 0, len(calendar['months']))
+    return np.diff(calendar['cumulative_costs'][positions])
+
+# Function to total the portfolio's cost over inclusive date windows, with two lookups per window
+def portfolio_window_costs(calendar, start_dates, end_dates):
+    cumulative = calendar['cumulative_daily_costs']
+    start_pos = np.clip(np.asarray(start_dates, dtype='datetime64[D]').astype(np.int64) - calendar['first_day'], 0, len(cumulative) - 1)
+    end_pos = np.clip(np.asarray(end_dates, dtype='datetime64[D]').astype(np.int64) + 1 - calendar['first_day'], 0, len(cumulative) - 1)
+    return np.where(end_pos > start_pos, cumulative[end_pos] - cumulative[start_pos], 0.0)
+
+# Function to cost teams per period from their cumulative active days at each boundary; roles pass their own
+# rates and the calendar positions of their teams. Rates that vary by month (items x the calendar's rate months)
+# are applied to each month segment of a period. Returns the costs and which items are active in each period
+def calendar_period_costs(calendar, boundaries, rates=None, team_positions=None):
+    start_days = calendar['start_days']
+    durations = calendar['durations']
+    if rates is None:
+        rates = calendar['team_rates']
+    if team_positions is not None:
+        start_days = start_days[team_positions]
+        durations = durations[team_positions]
+    boundary_days = boundaries.astype('datetime64[D]').astype(np.int64)
+    if rates.ndim == 1:
+        active_days = np.diff(np.clip(boundary_days[None, :] - start_days[:, None], 0, durations[:, None]), axis=1)
+        return rates[:, None] * active_days / 365.25, active_days > 0
+    if len(boundary_days) < 2:
+        return np.zeros((len(rates), 0)), np.zeros((len(rates), 0), dtype=bool)
+
+    # Split the periods at every month start inside them, cost each segment at its month's rates and total them per period
+    month_starts = np.arange(
+        boundaries[0].astype('datetime64[M]') + 1, boundaries[-1].astype('datetime64[M]') + 1
+    ).astype('datetime64[D]').astype(np.int64)
+    segment_days = np.union1d(boundary_days, month_starts[(month_starts > boundary_days[0]) & (month_starts < boundary_days[-1])])
+    segment_active_days = np.diff(np.clip(segment_days[None, :] - start_days[:, None], 0, durations[:, None]), axis=1)
+    segment_months = segment_days[:-1].astype('datetime64[D]').astype('datetime64[M]')
+    segment_costs = rates[:, rate_month_columns(segment_months, calendar['rate_months'])] * segment_active_days / 365.25
+    first_segments = np.searchsorted(segment_days, boundary_days[:-1])
+    return (
+        np.add.reduceat(segment_costs, first_segments, axis=1),
+        np.add.reduceat(segment_active_days, first_segments, axis=1) > 0
+    )
+
+# Function to get the portfolio's month calendar from the cost cache, rebuilding it after costs changed
+def portfolio_calendar(store, cache):
+    if cache['calendar'] is None:
+        team_ids = cache['team_rates'].index
+        teams = store['teams'].loc[team_ids]
+        calendar = build_month_calendar(
+            month_start_dates(teams['start_year'], teams['start_month']),
+            month_start_dates(teams['end_year'], teams['end_month']),
+            cache['team_rates'].to_numpy(),
+            cache['rate_months']
+        )
+        calendar['team_ids'] = team_ids
+        cache['calendar'] = calendar
+    return cache['calendar']
+
+# Currency salary amounts are paid in unless their salary cell names another one
+BASE_CURRENCY = 'USD'
+
+# Default FX table: the value of one unit of each currency in the base currency. Rows are years ('2026') or
+# months ('2026-03'), and each rate applies from the start of its row's period until the next row that sets it
+DEFAULT_FX_RATES = {
+    'USD': {'2024': 1.0},
+    'EUR': {'2024': 1.08, '2025': 1.13, '2026': 1.16},
+    'GBP': {'2024': 1.28, '2025': 1.32, '2026': 1.34},
+    'INR': {'2024': 0.0120, '2025': 0.0116, '2026': 0.0113}
+}
+
+# Function to build a {role: {resource_type: currency}} table that pays every salary cell in the base currency
+def default_salary_currencies(salaries):
+    return {role: {resource_type: BASE_CURRENCY for resource_type in role_salaries} for role, role_salaries in salaries.items()}
+
+# Function to look up the currency of each (role, resource_type) pair's salary; the base currency where none is set
+def lookup_salary_currencies(roles, resource_types, salary_currencies):
+    currency_table = pd.Series({
+        (role, resource_type): currency
+        for role, role_currencies in salary_currencies.items()
+        for resource_type, currency in role_currencies.items()
+    }, dtype=object)
+    if currency_table.empty:
+        return np.full(len(roles), BASE_CURRENCY, dtype=object)
+    pairs = pd.MultiIndex.from_arrays([np.asarray(roles, dtype=object), np.asarray(resource_types, dtype=object)])
+    return currency_table.reindex(pairs).fillna(BASE_CURRENCY).to_numpy(dtype=object)
+
+# Function to key an FX table by its content
+def fx_table_key(fx_rates):
+    return json.dumps([
+        [str(label) for label in fx_rates.index],
+        [str(currency) for currency in fx_rates.columns],
+        int(pd.util.hash_pandas_object(fx_rates.astype(np.float64), index=False).sum())
+    ])
+
+# Function to build the currency settings the summaries are converted with, or None when every salary cell is
+# already paid in the reporting currency and the costs can be shown as they are. Raises ValueError for an FX
+# table that cannot convert them
+def currency_settings(salary_currencies, fx_rates, reporting_currency):
+    used = {currency for role_currencies in salary_currencies.values() for currency in role_currencies.values()}
+    if used <= {reporting_currency}:
+        return None
+    missing = sorted(used.union([reporting_currency]) - set(fx_rates.columns))
+    if missing:
+        raise ValueError(f"The FX table has no rates for {', '.join(missing)}.")
+    if not len(fx_rates) or not (fx_rates.astype(np.float64).fillna(1.0) > 0).all().all():
+        raise ValueError("FX rates must be positive, with at least one row.")
+    fx_month_rates(fx_rates, np.array([], dtype='datetime64[M]'))  # Rejects period labels that are not years or months
+    return {
+        'salary_currencies': salary_currencies,
+        'fx_rates': fx_rates,
+        'reporting_currency': reporting_currency,
+        'key': json.dumps([salary_currencies, fx_table_key(fx_rates), reporting_currency], sort_keys=True)
+    }
+
+# Function to expand an FX table to a month axis: months x currencies, valued in the base currency.
+# Currencies missing before their first row take that row's rate
+def fx_month_rates(fx_rates, months):
+    starts = np.array([period_start_month(label) for label in fx_rates.index], dtype='datetime64[M]')
+    order = np.argsort(starts, kind='stable')
+    table = fx_rates.iloc[order].astype(np.float64).ffill().bfill()
+    positions = np.clip(np.searchsorted(starts[order], months, side='right') - 1, 0, None)
+    return table.iloc[positions].reset_index(drop=True)
+
+# Function to split the portfolio's costs by salary currency: each (team, currency) pair's yearly rate and cost
+# per calendar month. It is cached on the calendar, so it is rebuilt only when costs or salary currencies change
+def currency_month_costs(store, cache, salary_currencies):
+    calendar = portfolio_calendar(store, cache)
+    key = json.dumps(salary_currencies, sort_keys=True)
+    cached = calendar.get('currency_costs')
+    if cached is not None and cached['key'] == key:
+        return cached
+
+    # Role rates are keyed by team and position within the team, like the cached role costs
+    roles = store['roles']
+    role_rates = cache['role_rates'].dropna()
+    role_positions = pd.MultiIndex.from_arrays([roles['team_id'], roles.groupby('team_id').cumcount()])
+    role_rows = roles.iloc[role_positions.get_indexer(role_rates.index)]
+    pair_rates = role_rates.set_axis(pd.MultiIndex.from_arrays([
+        role_rates.index.get_level_values('team_id'),
+        lookup_salary_currencies(role_rows['role'], role_rows['resource_type'], salary_currencies)
+    ], names=['team_id', 'currency'])).groupby(level=['team_id', 'currency'], sort=False).sum()
+
+    currency_codes, currencies = pd.factorize(pair_rates.index.get_level_values('currency'))
+    team_positions = calendar['team_ids'].get_indexer(pair_rates.index.get_level_values('team_id'))
+    months = calendar['months']
+    month_boundaries = np.arange(months[0], months[-1] + 2) if len(months) else months
+    month_costs, _ = calendar_period_costs(calendar, month_boundaries, pair_rates.to_numpy(), team_positions)
+    calendar['currency_costs'] = {
+        'key': key,
+        'team_positions': team_positions,
+        'currencies': list(currencies),
+        'currency_codes': currency_codes,
+        'rates': pair_rates.to_numpy(),
+        'month_costs': month_costs,
+        'conversions': {}
+    }
+    return calendar['currency_costs']
+
+# Function to get the conversion vector into the reporting currency: each salary currency's FX factor per calendar
+# month. It is cached with the currency costs, so a currency switch only re-applies it to costs already computed
+def currency_conversion(calendar, currency_costs, fx_rates, reporting_currency):
+    key = (reporting_currency, fx_table_key(fx_rates))
+    conversions = currency_costs['conversions']
+    if key not in conversions:
+        month_rates = fx_month_rates(fx_rates, calendar['months'])
+        factors = np.ones((len(currency_costs['currencies']), len(calendar['months'])))
+        for code, currency in enumerate(currency_costs['currencies']):
+            if currency != reporting_currency:
+                factors[code] = month_rates[currency].to_numpy() / month_rates[reporting_currency].to_numpy()
+        conversions[key] = factors
+    return conversions[key]
+
+# Function to convert the portfolio's costs into the reporting currency: team x month costs in calendar team order,
+# plus the average factor each (team, currency) pair was converted at over the team's duration
+def converted_month_costs(store, cache, currency):
+    calendar = portfolio_calendar(store, cache)
+    currency_costs = currency_month_costs(store, cache, currency['salary_currencies'])
+    factors = currency_conversion(calendar, currency_costs, currency['fx_rates'], currency['reporting_currency'])
+    pair_month_costs = currency_costs['month_costs'] * factors[currency_costs['currency_codes']]
+    team_month_costs = np.zeros((len(calendar['team_ids']), len(calendar['months'])))
+    np.add.at(team_month_costs, currency_costs['team_positions'], pair_month_costs)
+    pair_totals = currency_costs['month_costs'].sum(axis=1)
+    pair_factors = np.divide(pair_month_costs.sum(axis=1), pair_totals, out=np.ones_like(pair_totals), where=pair_totals != 0)
+    return {
+        'team_month_costs': team_month_costs,
+        'pair_factors': pd.Series(pair_factors, index=pd.MultiIndex.from_arrays([
+            calendar['team_ids'][currency_costs['team_positions']],
+            np.asarray(currency_costs['currencies'], dtype=object)[currency_costs['currency_codes']]
+        ]))
+    }
+
+# Function to total month columns into the periods between month boundaries
+def month_costs_to_periods(calendar, month_costs, boundaries):
+    if not len(calendar['months']):
+        return np.zeros((len(month_costs), max(len(boundaries) - 1, 0)))
+    positions = np.clip((boundaries - calendar['months'][0]).astype(np.int64), 0, len(calendar['months']))
+    cumulative = np.concatenate([np.zeros((len(month_costs), 1)), np.cumsum(month_costs, axis=1)], axis=1)
+    return np.diff(cumulative[:, positions], axis=1)
+
+# Function to cost each team over an inclusive date window in the reporting currency, converting every month
+# segment of the window at that month's rate; costs are in calendar team order
+def converted_window_costs(store, cache, currency, window_start, window_end):
+    calendar = portfolio_calendar(store, cache)
+    currency_costs = currency_month_costs(store, cache, currency['salary_currencies'])
+    factors = currency_conversion(calendar, currency_costs, currency['fx_rates'], currency['reporting_currency'])
+    team_costs = np.zeros(len(calendar['team_ids']))
+    months = calendar['months']
+    if not len(months):
+        return team_costs
+
+    # Split the window at the month starts inside it
+    start = np.datetime64(window_start, 'D')
+    stop = np.datetime64(window_end, 'D') + 1
+    month_starts = months.astype('datetime64[D]')
+    boundaries = np.concatenate([[start], month_starts[(month_starts > start) & (month_starts < stop)], [stop]])
+    pair_costs, _ = calendar_period_costs(calendar, boundaries, currency_costs['rates'], currency_costs['team_positions'])
+    segment_months = np.clip((boundaries[:-1].astype('datetime64[M]') - months[0]).astype(np.int64), 0, len(months) - 1)
+    converted = (pair_costs * factors[currency_costs['currency_codes']][:, segment_months]).sum(axis=1)
+    np.add.at(team_costs, currency_costs['team_positions'], converted)
+    return team_costs
+
+# Function to summarize each team's roles on one line, e.g. "2.0 x QA (Onshore FTE), 1.0 x ..."
+def team_role_summaries(roles):
+    role_labels = roles['count'].astype(str) + ' x ' + roles['role'].astype(str) + ' (' + roles['resource_type'].astype(str) + ')'
+    return role_labels.groupby(roles['team_id'], sort=False).agg(', '.join)
+
+# Function to find the ids of teams whose name or description contains the search text and that use any of the given roles
+def find_teams(store, search='', role_names=()):
+    teams = store['teams']
+    matches = np.ones(len(teams), dtype=bool)
+    if search:
+        matches &= (
+            teams['team_name'].str.contains(search, case=False, regex=False).to_numpy()
+            | teams['team_description'].str.contains(search, case=False, regex=False).to_numpy()
+        )
+    if role_names:
+        roles = store['roles']
+        matches &= teams.index.isin(roles.loc[roles['role'].isin(role_names), 'team_id'])
+    return teams.index[matches]
+
+# Function to build a compact one-row-per-team overview of the given teams for the editor
+def team_overview_frame(store, team_ids):
+    teams = store['teams'].loc[team_ids]
+    roles = store['roles']
+    roles = roles[roles['team_id'].isin(team_ids)]
+    display_names = pd.Series(team_display_names(store['teams']), index=store['teams'].index)
+    return pd.DataFrame({
+        'Team': display_names.loc[team_ids].to_numpy(),
+        'Start': np.datetime_as_string(month_start_dates(teams['start_year'], teams['start_month']).astype('datetime64[M]')),
+        'End': np.datetime_as_string(month_start_dates(teams['end_year'], teams['end_month']).astype('datetime64[M]')),
+        'Roles': team_role_summaries(roles).reindex(team_ids, fill_value='').to_numpy(),
+        'FTE': roles.groupby('team_id')['count'].sum().reindex(team_ids, fill_value=0.0).to_numpy(),
+        'Total Cost': teams['total_team_cost'].to_numpy()
+    }, index=pd.Index(team_ids, name='team_id'))
+
+# Function to build the data frames behind the Gantt, pie, period summary and pivot sections from the team store;
+# with currency settings, every cost is converted into the reporting currency month by month
+def build_summary_frames(store, cache, granularity='Year', fiscal_year_start=1, currency=None):
+    teams = store['teams']
+    roles = store['roles']
+    team_ids = costable_team_ids(store)
+    display_names = pd.Series(team_display_names(teams), index=teams.index)
+    complete_team_names = display_names.loc[team_ids].to_numpy()
+
+    # Gantt rows, one per complete team
+    roles_str = team_role_summaries(roles)
+    complete = teams.loc[team_ids]
+    gantt_df = pd.DataFrame({
+        'Team': complete_team_names,
+        'Start': pd.to_datetime(month_start_dates(complete['start_year'], complete['start_month'])),
+        'End': pd.to_datetime(month_start_dates(complete['end_year'], complete['end_month'])),
+        'Cost': complete['total_team_cost'].to_numpy(),
+        'Roles': roles_str.reindex(team_ids).to_numpy(),
+        'Description': complete['team_description'].to_numpy()
+    }, index=team_ids)
+
+    # Pie rows from the role costs; repeated roles within a team keep the last entry, as in calculate_role_costs
+    priced_roles = roles[roles['role_cost'].notna()]
+    pie_df = pd.DataFrame({
+        'Team': display_names.loc[priced_roles['team_id']].to_numpy(),
+        'Role': (priced_roles['role'] + ' (' + priced_roles['resource_type'] + ')').to_numpy(),
+        'Cost': priced_roles['role_cost'].to_numpy()
+    }, index=pd.Index(priced_roles['team_id'].to_numpy(), name='team_id'))
+    latest_roles = ~pd.DataFrame({'team': priced_roles['team_id'].to_numpy(), 'role': pie_df['Role']}).duplicated(keep='last').to_numpy()
+    pie_df = pie_df[latest_roles]
+
+    if currency is not None:
+        # Converted costs come from the cached per-currency month costs and the cached conversion vector
+        calendar = portfolio_calendar(store, cache)
+        conversion = converted_month_costs(store, cache, currency)
+        boundaries, periods = calendar_periods(calendar, granularity, fiscal_year_start)
+        team_positions = calendar['team_ids'].get_indexer(team_ids)
+        costs = month_costs_to_periods(calendar, conversion['team_month_costs'], boundaries)
+        _, active = calendar_period_costs(calendar, boundaries)
+        period_totals = costs.sum(axis=0)
+        team_costs = np.where(active, costs, np.nan)[team_positions]
+        gantt_df['Cost'] = conversion['team_month_costs'].sum(axis=1)[team_positions]
+
+        # Role costs are converted at the average factor of their team and salary currency
+        role_currencies = lookup_salary_currencies(priced_roles['role'], priced_roles['resource_type'], currency['salary_currencies'])
+        pie_factors = conversion['pair_factors'].reindex(pd.MultiIndex.from_arrays([
+            priced_roles['team_id'].to_numpy(), role_currencies
+        ])).fillna(1.0).to_numpy()
+        pie_df['Cost'] = pie_df['Cost'].to_numpy() * pie_factors[latest_roles]
+    elif granularity == 'Year' and fiscal_year_start == 1:
+        # Calendar-year totals and team costs come from the incrementally maintained cache
+        yearly_totals = cache['yearly_totals']
+        periods = yearly_totals.index.to_numpy(dtype=np.int64)
+        period_totals = yearly_totals.to_numpy()
+        team_costs = store['costs'].loc[team_ids].reindex(columns=yearly_totals.index).to_numpy()
+    else:
+        # Other granularities are lookups into the cached month calendar
+        calendar = portfolio_calendar(store, cache)
+        boundaries, periods = calendar_periods(calendar, granularity, fiscal_year_start)
+        period_totals = portfolio_period_costs(calendar, boundaries)
+        costs, active = calendar_period_costs(calendar, boundaries)
+        team_costs = np.where(active, costs, np.nan)[calendar['team_ids'].get_indexer(team_ids)]
+
+    period_costs_df = pd.DataFrame({granularity: periods, 'Cost': period_totals})
+
+    # Long-form team x period costs for the stacked chart, and the pivot with teams as rows and periods as columns
+    team_rows, period_cols = np.nonzero(~np.isnan(team_costs))
+    detailed_df = pd.DataFrame({
+        'Team': complete_team_names[team_rows],
+        granularity: np.asarray(periods)[period_cols],
+        'Cost': team_costs[team_rows, period_cols]
+    }, index=team_ids[team_rows])
+    pivot_df = pd.DataFrame(np.nan_to_num(team_costs), index=pd.Index(complete_team_names, name='Team'), columns=periods)
+    pivot_df.columns.name = granularity
+    pivot_df = pivot_df.sort_index().reset_index()
+
+    return {
+        'gantt': gantt_df,
+        'pie': pie_df,
+        'period_costs': period_costs_df,
+        'detailed': detailed_df,
+        'pivot': pivot_df
+    }
+
+# Function to build long-form role costs per period: one row per team, role and period the role is active in
+def build_role_period_frame(store, cache, granularity='Year', fiscal_year_start=1):
+    roles = store['roles']
+    calendar = portfolio_calendar(store, cache)
+    boundaries, periods = calendar_periods(calendar, granularity, fiscal_year_start)
+
+    # Role rates are keyed by team and position within the team, like the cached role costs
+    role_rates = cache['role_rates'].dropna()
+    role_team_ids = role_rates.index.get_level_values('team_id')
+    costs, active = calendar_period_costs(
+        calendar, boundaries, role_rates.to_numpy(), calendar['team_ids'].get_indexer(role_team_ids)
+    )
+    role_positions = pd.MultiIndex.from_arrays([roles['team_id'], roles.groupby('team_id').cumcount()])
+    role_rows = roles.iloc[role_positions.get_indexer(role_rates.index)]
+    display_names = pd.Series(team_display_names(store['teams']), index=store['teams'].index)
+
+    rows, cols = np.nonzero(active)
+    return pd.DataFrame({
+        'Team': display_names.loc[role_team_ids].to_numpy()[rows],
+        'Role': (role_rows['role'] + ' (' + role_rows['resource_type'] + ')').to_numpy()[rows],
+        granularity: np.asarray(periods)[cols],
+        'Cost': costs[rows, cols]
+    })
+
+# Function to total the portfolio's FTE per calendar month for each role and resource type, with a sweep over the
+# roles' start and end days: the events are sorted once and each pair's FTE level is a running sum between them.
+# Gives each month's average FTE (FTE-days over its days) and peak concurrent FTE, with the peak month of every
+# pair and of the whole portfolio. It is cached on the calendar, so it is rebuilt only when teams or roles change
+def portfolio_headcount(store, cache):
+    calendar = portfolio_calendar(store, cache)
+    if calendar.get('headcount') is not None:
+        return calendar['headcount']
+    teams = store['teams']
+    roles = store['roles']
+
+    # Each role is active from its team's first day to the day after its end date, as in the cost calendar
+    team_positions = teams.index.get_indexer(roles['team_id'])
+    start_days = month_start_dates(teams['start_year'], teams['start_month']).astype('datetime64[D]').astype(np.int64)
+    end_days = month_start_dates(teams['end_year'], teams['end_month']).astype('datetime64[D]').astype(np.int64) + 1
+    role_starts = start_days[team_positions]
+    role_ends = end_days[team_positions]
+    counts = roles['count'].fillna(0.0).to_numpy(dtype=np.float64)
+    active = (team_positions >= 0) & (role_ends > role_starts) & (counts != 0)
+    pair_codes, pairs = pd.MultiIndex.from_arrays([roles['role'], roles['resource_type']])[active].factorize()
+    role_starts, role_ends, counts = role_starts[active], role_ends[active], counts[active]
+
+    headcount = {
+        'months': np.array([], dtype='datetime64[M]'),
+        'pairs': pairs,
+        'average_fte': np.zeros((len(pairs), 0)),
+        'peak_fte': np.zeros((len(pairs), 0)),
+        'total_average_fte': np.zeros(0),
+        'total_peak_fte': np.zeros(0)
+    }
+    if active.any():
+        # Sweep: +FTE on each start day and -FTE on each end day, summed per pair and event day, then accumulated
+        event_days, event_positions = np.unique(np.concatenate([role_starts, role_ends]), return_inverse=True)
+        deltas = np.bincount(
+            np.tile(pair_codes, 2) * len(event_days) + event_positions,
+            weights=np.concatenate([counts, -counts]),
+            minlength=len(pairs) * len(event_days)
+        ).reshape(len(pairs), len(event_days))
+        levels = np.round(np.cumsum(deltas, axis=1), 9)
+
+        # Split the months at every event day; each segment holds the level of the last event before it
+        active_months = np.array([event_days[0], event_days[-1] - 1]).astype('datetime64[D]').astype('datetime64[M]')
+        months = np.arange(active_months[0], active_months[1] + 1)
+        month_days = np.arange(months[0], months[-1] + 2).astype('datetime64[D]').astype(np.int64)
+        segment_days = np.union1d(month_days, event_days)
+        segment_levels = levels[:, np.searchsorted(event_days, segment_days[:-1], side='right') - 1]
+        segment_lengths = np.diff(segment_days)
+        first_segments = np.searchsorted(segment_days, month_days[:-1])
+        total_levels = segment_levels.sum(axis=0)
+
+        headcount['months'] = months
+        headcount['average_fte'] = np.add.reduceat(segment_levels * segment_lengths, first_segments, axis=1) / np.diff(month_days)
+        headcount['peak_fte'] = np.maximum.reduceat(segment_levels, first_segments, axis=1)
+        headcount['total_average_fte'] = np.add.reduceat(total_levels * segment_lengths, first_segments) / np.diff(month_days)
+        headcount['total_peak_fte'] = np.maximum.reduceat(total_levels, first_segments)
+    calendar['headcount'] = headcount
+    return headcount
+
+# Function to build the headcount frames: FTE per month for each role and resource type, portfolio totals per month,
+# and each pair's peak with the first month it is reached
+def build_headcount_frames(store, cache):
+    headcount = portfolio_headcount(store, cache)
+    month_labels = np.datetime_as_string(headcount['months'])
+    pairs = headcount['pairs']
+    roles = np.asarray(pairs.get_level_values(0), dtype=object)
+    resource_types = np.asarray(pairs.get_level_values(1), dtype=object)
+
+    rows, cols = np.nonzero(headcount['peak_fte'])
+    monthly_df = pd.DataFrame({
+        'Month': month_labels[cols],
+        'Role': roles[rows],
+        'Resource Type': resource_types[rows],
+        'FTE': headcount['average_fte'][rows, cols],
+        'Peak FTE': headcount['peak_fte'][rows, cols]
+    })
+    totals_df = pd.DataFrame({
+        'Month': month_labels,
+        'FTE': headcount['total_average_fte'],
+        'Peak FTE': headcount['total_peak_fte']
+    })
+    peak_months = np.argmax(headcount['peak_fte'], axis=1) if len(month_labels) else np.zeros(len(pairs), dtype=np.int64)
+    peaks_df = pd.DataFrame({
+        'Role': roles,
+        'Resource Type': resource_types,
+        'Peak FTE': headcount['peak_fte'].max(axis=1, initial=0.0),
+        'Peak Month': month_labels[peak_months] if len(month_labels) else np.full(len(pairs), '', dtype=object)
+    }).sort_values('Peak FTE', ascending=False, kind='stable', ignore_index=True)
+    return {'monthly': monthly_df, 'totals': totals_df, 'peaks': peaks_df}
+
+# Download formats for summary tables, with their MIME types
+TABLE_EXPORT_FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# Function to serialize a summary table for download; period column labels become string column names
+def summary_table_bytes(df, file_format):
+    df = df.rename(columns=str)
+    if file_format == 'csv':
+        return df.to_csv(index=False).encode('utf-8')
+    if file_format == 'parquet':
+        sink = pa.BufferOutputStream()
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), sink)
+        return sink.getvalue().to_pybytes()
+    raise ValueError(f"Unsupported table format: {file_format}")
+
+# Function to hash the portfolio content the summaries depend on: team details and dates in team order, each team's
+# roles in order, the salary table and any extra parameters such as the granularity
+def portfolio_content_hash(store, salaries, *params):
+    teams = store['teams'][['team_name', 'team_description', 'start_year', 'start_month', 'end_year', 'end_month']]
+    roles = store['roles'][['team_id', 'role', 'resource_type', 'count']]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(teams, index=True).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(roles, index=False).to_numpy().tobytes())
+    digest.update(json.dumps([salaries, params], sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+# Function to create a size-bounded LRU cache of derived frames, safe to share between threads
+def create_frame_cache(max_bytes):
+    return {
+        'entries': OrderedDict(),
+        'max_bytes': max_bytes,
+        'bytes': 0,
+        'hits': 0,
+        'misses': 0,
+        'lock': threading.Lock()
+    }
+
+# Function to measure the memory held by a nested dict of data frames
+def frames_nbytes(frames):
+    if isinstance(frames, dict):
+        return sum(frames_nbytes(value) for value in frames.values())
+    return int(frames.memory_usage(index=True, deep=True).sum())
+
+# Function to get cached frames by key, marking them most recently used; None on a miss.
+# Cached frames are shared, so callers must not modify them in place
+def frame_cache_get(cache, key):
+    with cache['lock']:
+        entry = cache['entries'].get(key)
+        if entry is None:
+            cache['misses'] += 1
+            return None
+        cache['entries'].move_to_end(key)
+        cache['hits'] += 1
+        return entry['frames']
+
+# Function to add frames to the cache, evicting least recently used entries to stay within its size bound
+def frame_cache_put(cache, key, frames):
+    nbytes = frames_nbytes(frames)
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['bytes'] -= cache['entries'].pop(key)['bytes']
+        if nbytes > cache['max_bytes']:
+            return
+        while cache['entries'] and cache['bytes'] + nbytes > cache['max_bytes']:
+            _, evicted = cache['entries'].popitem(last=False)
+            cache['bytes'] -= evicted['bytes']
+        cache['entries'][key] = {'frames': frames, 'bytes': nbytes}
+        cache['bytes'] += nbytes
+
+# Function to generate demo teams
+def generate_demo_teams(salaries):
+    demo_teams = []
+    team_names = ['Alpha', 'Beta', 'Gamma', 'Delta']
+    for i in range(4):
+        start_year = date.today().year + random.randint(0, 2)
+        start_month = random.randint(1, 12)
+        start_date = datetime(start_year, start_month, 1).date()
+        end_year = start_year + random.randint(0, 2)
+        end_month = random.randint(start_month, 12) if end_year == start_year else random.randint(1, 12)
+        end_date = datetime(end_year, end_month, 1).date()
+        num_roles = random.randint(1, 4)
+        team_roles = []
+        for _ in range(num_roles):
+            role = random.choice(list(salaries.keys()))
+            resource_type = random.choice(list(salaries[role].keys()))
+            count = random.uniform(0.5, 5.0)
+            count = round(count * 2) / 2  # Round to nearest 0.5
+            team_roles.append({
+                'role': role,
+                'count': count,
+                'resource_type': resource_type
+            })
+        demo_teams.append({
+            'team_name': f"Team {team_names[i]}",
+            'team_description': f"Description for Team {team_names[i]}",
+            'start_year': start_year,
+            'start_month': start_month,
+            'end_year': end_year,
+            'end_month': end_month,
+            'duration_weeks': 0,
+            'team_roles': team_roles,
+            'cost_per_year': {},
+            'total_team_cost': 0
+        })
+    return demo_teams
@@ -0,0 +1,80 @@
+import os
+import sys
+
+from streamlit.testing.v1 import AppTest
+
+# The app and its model live in the repository root
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import team_cost_model
+
+APP_PATH = os.path.join(REPO_DIR, 'main.py')
+
+
+# Function to wrap a model function so each call is recorded by name
+def record_calls(monkeypatch, calls, name):
+    function = getattr(team_cost_model, name)
+
+    def recorded(*args, **kwargs):
+        calls.append(name)
+        return function(*args, **kwargs)
+    monkeypatch.setattr(team_cost_model, name, recorded)
+
+
+def test_summary_cache_hit_skips_cost_update(monkeypatch):
+    at = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    at.button(key='generate_demo_teams').click().run()
+    at.button(key='generate_gantt_cost_summary').click().run()
+    assert not at.exception
+    yearly_totals = at.session_state.cost_cache['yearly_totals'].copy()
+
+    # Generating the same summary again is served from the shared cache without fingerprinting or recomputing a team
+    calls = []
+    for name in ('team_cost_fingerprints', 'refresh_team_costs', 'build_cost_inputs'):
+        record_calls(monkeypatch, calls, name)
+    at.button(key='generate_gantt_cost_summary').click().run()
+    assert not at.exception
+    assert any(caption.value.startswith("Loaded the summary from the shared cache") for caption in at.caption)
+    assert calls == []
+    assert at.session_state.cost_cache['yearly_totals'].equals(yearly_totals)
+
+
+def test_editor_change_recomputes_only_the_edited_team(monkeypatch):
+    at = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    at.button(key='generate_demo_teams').click().run()
+    team_id = int(at.session_state.team_store['teams'].index[0])
+
+    # Only the team whose FTE count changed is fingerprinted
+    fingerprinted = []
+    fingerprint = team_cost_model.team_cost_fingerprints
+
+    def recorded(store, team_ids, *args):
+        fingerprinted.append(list(team_ids))
+        return fingerprint(store, team_ids, *args)
+    monkeypatch.setattr(team_cost_model, 'team_cost_fingerprints', recorded)
+    fte_input = at.number_input(key=f"team_{team_id}_role_0_fte_input")
+    fte_input.set_value(fte_input.value + 1.0).run()
+    assert not at.exception
+    assert fingerprinted == [[team_id]]
+
+
+def test_salary_change_fingerprints_only_the_teams_using_it(monkeypatch):
+    at = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    at.button(key='generate_demo_teams').click().run()
+    roles = at.session_state.team_store['roles']
+    role, resource_type = roles['role'].iat[0], roles['resource_type'].iat[0]
+    using_ids = sorted(roles.loc[(roles['role'] == role) & (roles['resource_type'] == resource_type), 'team_id'].unique().tolist())
+
+    # The changed salary cell is propagated to the teams using it; the rerun's cost update has nothing left to check
+    fingerprinted = []
+    fingerprint = team_cost_model.team_cost_fingerprints
+
+    def recorded(store, team_ids, *args):
+        fingerprinted.append(sorted(team_ids.tolist()))
+        return fingerprint(store, team_ids, *args)
+    monkeypatch.setattr(team_cost_model, 'team_cost_fingerprints', recorded)
+    salary_input = at.number_input(key=f"{role}_{resource_type}_adjust")
+    salary_input.set_value(salary_input.value + 1000).run()
+    assert not at.exception
+    assert fingerprinted == [using_ids]
@@ -0,0 +1,229 @@
+# what_if.py
+
+# What-if scenario runner for team portfolios: evaluates a grid of salary multipliers, FTE scaling
+# and start/end date shifts against a base portfolio, spread over worker processes.
+# The base arrays and the scenario grid are placed in shared memory once; each task only carries
+# a range of scenario numbers and returns that range's yearly cost totals.
+
+# Import necessary libraries
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context, shared_memory
+import numpy as np
+import pandas as pd
+from team_cost_model import (
+    build_cost_inputs,
+    calculate_month_overlap_days,
+    calculate_year_overlap_days,
+    costable_team_ids,
+    rate_month_columns
+)
+
+# Scenarios evaluated per task, and the largest grid the runner accepts
+SCENARIO_CHUNK_SIZE = 256
+MAX_SCENARIOS = 200000
+
+# Date shift overlaps kept per worker; scenarios are ordered so consecutive ones share a shift pair
+OVERLAP_CACHE_SIZE = 16
+
+# Shared arrays attached by each worker process, set up by init_scenario_worker
+worker_state = {}
+
+# Function to build the base portfolio arrays: each team's yearly cost per salary cell and its start/end months.
+# With a salary schedule, team cells hold FTE counts and each cell's salary per schedule month is kept alongside
+def build_what_if_base(store, salaries, schedule=None):
+    team_ids = costable_team_ids(store)
+    cost_inputs = build_cost_inputs(store, team_ids, salaries, schedule)
+    roles = store['roles'].loc[cost_inputs['role_ids']]
+
+    # Salary cells are the (role, resource_type) pairs the portfolio uses; unpriced roles cost nothing
+    cell_codes, cells = pd.factorize(pd.MultiIndex.from_arrays([roles['role'], roles['resource_type']]))
+    role_rates = cost_inputs['role_rates']
+    team_cell_rates = np.zeros((len(team_ids), len(cells)))
+    base = {
+        'team_ids': team_ids,
+        'cells': list(cells),
+        'team_cell_rates': team_cell_rates,
+        'start_months': cost_inputs['start_dates'].astype('datetime64[M]').astype(np.int64),
+        'end_months': cost_inputs['end_dates'].astype('datetime64[M]').astype(np.int64)
+    }
+    if schedule is None:
+        role_yearly_costs = np.where(np.isnan(role_rates), 0.0, cost_inputs['role_counts'] * np.nan_to_num(role_rates))
+        np.add.at(team_cell_rates, (cost_inputs['role_team_index'], cell_codes), role_yearly_costs)
+        return base
+
+    priced = ~np.isnan(role_rates).any(axis=1)
+    np.add.at(team_cell_rates, (cost_inputs['role_team_index'], cell_codes), np.where(priced, cost_inputs['role_counts'], 0.0))
+    cell_month_rates = np.zeros((len(cells), len(schedule['months'])))
+    cell_month_rates[cell_codes[priced]] = role_rates[priced]
+    base['cell_month_rates'] = cell_month_rates
+    base['rate_months'] = schedule['months'].astype(np.int64)
+    return base
+
+# Function to build the scenario grid as the cartesian product of every perturbation axis
+def build_scenario_grid(salary_multipliers, fte_scales=(1.0,), start_shifts=(0,), end_shifts=(0,)):
+    # Date shifts are the outermost axes so that consecutive scenarios share their overlap matrix
+    axes = {'start_shift': list(start_shifts), 'end_shift': list(end_shifts), 'fte_scale': list(fte_scales)}
+    for target, multipliers in salary_multipliers.items():
+        axes[salary_axis_name(target)] = list(multipliers)
+
+    num_scenarios = int(np.prod([len(values) for values in axes.values()]))
+    if num_scenarios == 0:
+        raise ValueError("Every perturbation axis needs at least one value.")
+    if num_scenarios > MAX_SCENARIOS:
+        raise ValueError(f"The grid has {num_scenarios:,} scenarios; the limit is {MAX_SCENARIOS:,}.")
+
+    grid = pd.MultiIndex.from_product(list(axes.values()), names=list(axes.keys())).to_frame(index=False)
+    grid.attrs['salary_targets'] = dict(zip(list(axes.keys())[3:], salary_multipliers.keys()))
+    return grid
+
+# Function to name the grid column of a salary multiplier; a target is a role or a (role, resource_type) pair
+def salary_axis_name(target):
+    if isinstance(target, tuple):
+        return f"{target[0]} ({target[1]}) x"
+    return f"{target} x"
+
+# Function to turn a scenario grid into the flat arrays the workers read
+def build_scenario_arrays(base, grid):
+    cells = base['cells']
+
+    # Multipliers per scenario and salary cell; axes that target the same cell compound
+    cell_multipliers = np.ones((len(grid), len(cells)))
+    for column, target in grid.attrs['salary_targets'].items():
+        matches = np.array([cell == target or cell[0] == target for cell in cells], dtype=bool)
+        cell_multipliers[:, matches] *= grid[column].to_numpy(dtype=np.float64)[:, None]
+
+    start_shifts = grid['start_shift'].to_numpy(dtype=np.int64)
+    end_shifts = grid['end_shift'].to_numpy(dtype=np.int64)
+
+    # One year axis covers every shifted portfolio
+    if len(base['start_months']):
+        first_year = (base['start_months'].min() + start_shifts.min()) // 12
+        last_year = (base['end_months'].max() + end_shifts.max()) // 12
+        years = np.arange(first_year, max(first_year, last_year) + 1, dtype=np.int64)
+    else:
+        years = np.array([], dtype=np.int64)
+
+    arrays = {
+        'team_cell_rates': base['team_cell_rates'],
+        'start_months': base['start_months'],
+        'end_months': base['end_months'],
+        'years': years,
+        'cell_multipliers': cell_multipliers,
+        'fte_scales': grid['fte_scale'].to_numpy(dtype=np.float64),
+        'start_shifts': start_shifts,
+        'end_shifts': end_shifts
+    }
+    if 'cell_month_rates' in base:
+        arrays['cell_month_rates'] = base['cell_month_rates']
+        arrays['rate_months'] = base['rate_months']
+    return arrays
+
+# Function to cost every salary cell per year for one start/end shift: cells x years
+def shifted_cell_year_costs(arrays, start_shift, end_shift):
+    start_dates = (arrays['start_months'] + start_shift).astype('datetime64[M]').astype('datetime64[D]')
+    end_dates = (arrays['end_months'] + end_shift).astype('datetime64[M]').astype('datetime64[D]')
+    if 'cell_month_rates' not in arrays:
+        overlap_fraction = calculate_year_overlap_days(start_dates, end_dates, arrays['years'].astype('datetime64[Y]')) / 365.25
+        return arrays['team_cell_rates'].T @ overlap_fraction
+
+    # Scheduled salaries: FTE days per cell and month, costed at that month's salary and totalled per year
+    years = arrays['years']
+    months = np.arange(years[0] * 12, (years[-1] + 1) * 12).astype('datetime64[M]') if len(years) else np.array([], dtype='datetime64[M]')
+    cell_month_days = arrays['team_cell_rates'].T @ calculate_month_overlap_days(start_dates, end_dates, months)
+    rates = arrays['cell_month_rates'][:, rate_month_columns(months, arrays['rate_months'].astype('datetime64[M]'))]
+    return (cell_month_days * rates / 365.25).reshape(len(arrays['cell_month_rates']), len(years), 12).sum(axis=2)
+
+# Function to evaluate scenarios [start, stop) and return their yearly cost totals: scenarios x years
+def evaluate_scenario_range(arrays, start, stop, overlap_cache):
+    yearly_costs = np.empty((stop - start, len(arrays['years'])))
+    shift_pairs = np.stack([arrays['start_shifts'][start:stop], arrays['end_shifts'][start:stop]], axis=1)
+
+    # Costs are linear in the salary cells, so each scenario is its multiplier row times the cell x year costs
+    for start_shift, end_shift in np.unique(shift_pairs, axis=0):
+        key = (int(start_shift), int(end_shift))
+        if key not in overlap_cache:
+            if len(overlap_cache) >= OVERLAP_CACHE_SIZE:
+                overlap_cache.pop(next(iter(overlap_cache)))
+            overlap_cache[key] = shifted_cell_year_costs(arrays, *key)
+        rows = np.flatnonzero((shift_pairs[:, 0] == start_shift) & (shift_pairs[:, 1] == end_shift))
+        scenarios = start + rows
+        yearly_costs[rows] = arrays['fte_scales'][scenarios, None] * (arrays['cell_multipliers'][scenarios] @ overlap_cache[key])
+    return yearly_costs
+
+# Function to copy arrays into shared memory blocks, returning the blocks and the specs workers attach with
+def share_arrays(arrays):
+    blocks = []
+    specs = {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+# Function to attach a worker to the shared arrays as read-only views
+def init_scenario_worker(specs):
+    worker_state['blocks'] = []
+    worker_state['arrays'] = {}
+    worker_state['overlap_cache'] = {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        worker_state['blocks'].append(block)
+        worker_state['arrays'][name] = array
+
+# Function to evaluate a scenario range in a worker process
+def run_scenario_range(start, stop):
+    return start, evaluate_scenario_range(worker_state['arrays'], start, stop, worker_state['overlap_cache'])
+
+# Function to run every scenario, yielding (first scenario, yearly costs) as each range completes
+def run_what_if_scenarios(arrays, processes=None, chunk_size=SCENARIO_CHUNK_SIZE):
+    num_scenarios = len(arrays['fte_scales'])
+    ranges = [(start, min(start + chunk_size, num_scenarios)) for start in range(0, num_scenarios, chunk_size)]
+
+    # Single-CPU hosts and small grids are not worth starting processes for
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(ranges) == 1:
+        overlap_cache = {}
+        for start, stop in ranges:
+            yield start, evaluate_scenario_range(arrays, start, stop, overlap_cache)
+        return
+
+    blocks, specs = share_arrays(arrays)
+    try:
+        # Spawned workers do not inherit the Streamlit server's threads
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context('spawn'),
+            initializer=init_scenario_worker,
+            initargs=(specs,)
+        ) as executor:
+            futures = [executor.submit(run_scenario_range, start, stop) for start, stop in ranges]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+# Function to cost the unperturbed base portfolio on a scenario year axis
+def base_yearly_costs(arrays):
+    return shifted_cell_year_costs(arrays, 0, 0).sum(axis=0)
+
+# Function to build comparison rows for a completed scenario range: grid parameters, totals and yearly costs
+def scenario_results_frame(grid, arrays, start, yearly_costs, base_total):
+    results = grid.iloc[start:start + len(yearly_costs)].copy()
+    results.insert(0, 'Scenario', results.index + 1)
+    results['Total Cost'] = yearly_costs.sum(axis=1)
+    results['Change vs Base'] = results['Total Cost'] - base_total
+    results['Change %'] = results['Change vs Base'] / base_total * 100 if base_total else np.nan
+    years = arrays['years'] + 1970
+    for year_pos, year in enumerate(years):
+        results[str(year)] = yearly_costs[:, year_pos]
+    return results